@@ -0,0 +1,384 @@
+"""
+    Caching HTTP proxy
+    ==================
+    This module provides a forward HTTP proxy that caches the artifacts downloaded by the containers
+    (OS packages, Python packages, ...) on the host so that repeated provisioning runs don't
+    download them again. The proxy relies on asyncio and is only imported by the `cache-proxy`
+    command.
+"""
+
+import asyncio
+import hashlib
+import itertools
+import json
+import logging
+import os
+import re
+import time
+import types
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+from .utils.cache import get_cache_dir, get_cache_proxy_state_path
+
+
+__all__ = ['CacheStore', 'CachingProxy', ]
+
+logger = logging.getLogger(__name__)
+
+# The extensions of the files that are never modified once they are published (packages, archives,
+# ...). Responses for such files can be cached indefinitely.
+IMMUTABLE_EXTENSIONS = (
+    '.apk', '.deb', '.egg', '.gem', '.jar', '.pkg.tar.xz', '.pkg.tar.zst', '.rpm', '.tar.bz2',
+    '.tar.gz', '.tar.xz', '.tbz2', '.tgz', '.udeb', '.whl', '.zip',
+)
+
+# The headers that are related to a single connection and must not be forwarded by proxies.
+HOP_BY_HOP_HEADERS = {
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization', 'proxy-connection',
+    'te', 'trailers', 'transfer-encoding', 'upgrade',
+}
+
+_max_age_re = re.compile(r'max-age=(\d+)')
+
+# Generator-based coroutines are used so that the proxy can run on Python 3.4, which doesn't support
+# the async/await syntax. `asyncio.coroutine` was removed in Python 3.11 in favor of
+# `types.coroutine`, which is not available on Python 3.4.
+coroutine = getattr(types, 'coroutine', None) or asyncio.coroutine
+
+
+class CacheStore:
+    """ Stores HTTP responses on disk, keyed by URL, and evicts the least recently used ones.
+
+    Each response is stored as a body file and a JSON metadata file (status, headers, expiration
+    time) named after the SHA-256 hash of its URL. The total size of the stored bodies is kept below
+    `max_size` bytes by evicting the least recently used responses.
+    """
+
+    def __init__(self, path, max_size):
+        self.path = path
+        self.max_size = max_size
+        self.size = 0
+        # Associates the keys of the stored responses with the sizes of their bodies, from the least
+        # recently used to the most recently used.
+        self._entries = OrderedDict()
+        self._temporary_ids = itertools.count()
+        os.makedirs(path, exist_ok=True)
+        self._load()
+
+    def get(self, url):
+        """ Returns the metadata and the path of the body of the response cached for `url`.
+
+        None is returned if no fresh response is cached for the considered URL.
+        """
+        key = self._get_key(url)
+        if key not in self._entries:
+            return None
+        try:
+            with open(self._get_metadata_path(key)) as fd:
+                metadata = json.load(fd)
+        except (OSError, ValueError):
+            self._remove(key)
+            return None
+        if metadata.get('expires') is not None and metadata['expires'] < time.time():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        os.utime(self._get_body_path(key))
+        return metadata, self._get_body_path(key)
+
+    def get_temporary_path(self, url):
+        """ Returns a path where the body of a response can be written before being stored. """
+        return os.path.join(
+            self.path, '{}.{}.tmp'.format(self._get_key(url), next(self._temporary_ids)))
+
+    def put(self, url, metadata, body_path):
+        """ Stores a response whose body was written to `body_path` (which is moved). """
+        key = self._get_key(url)
+        size = os.path.getsize(body_path)
+        if size > self.max_size:
+            os.remove(body_path)
+            return
+        self._remove(key)
+        os.replace(body_path, self._get_body_path(key))
+        with open(self._get_metadata_path(key), 'w') as fd:
+            json.dump(metadata, fd)
+        self._entries[key] = size
+        self.size += size
+        while self.size > self.max_size:
+            self._remove(next(iter(self._entries)))
+
+    def _get_key(self, url):
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    def _get_body_path(self, key):
+        return os.path.join(self.path, key)
+
+    def _get_metadata_path(self, key):
+        return os.path.join(self.path, '{}.json'.format(key))
+
+    def _load(self):
+        """ Loads the responses stored by previous runs, using their access times to order them. """
+        entries = []
+        for name in os.listdir(self.path):
+            if name.endswith('.tmp'):
+                os.remove(os.path.join(self.path, name))
+            elif name.endswith('.json'):
+                key = name[:-len('.json')]
+                try:
+                    stat = os.stat(self._get_body_path(key))
+                except OSError:
+                    os.remove(os.path.join(self.path, name))
+                    continue
+                entries.append((stat.st_mtime, key, stat.st_size))
+        for _, key, size in sorted(entries):
+            self._entries[key] = size
+            self.size += size
+
+    def _remove(self, key):
+        size = self._entries.pop(key, None)
+        if size is not None:
+            self.size -= size
+        for path in (self._get_body_path(key), self._get_metadata_path(key)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+class CachingProxy:
+    """ A forward HTTP proxy caching the responses of GET requests in a `CacheStore`.
+
+    Only the responses that are safe to cache are stored: responses for files that are never
+    modified once published (see `IMMUTABLE_EXTENSIONS`) and responses defining a "max-age"
+    directive. HTTPS requests (CONNECT) are tunneled without being cached.
+    """
+
+    # The number of bytes read at once when streaming responses.
+    chunk_size = 64 * 1024
+
+    def __init__(self, host='127.0.0.1', port=3142, cache_dir=None, max_size=2 * 1024 ** 3):
+        self.host = host
+        self.port = port
+        self.store = CacheStore(cache_dir or get_cache_dir('proxy'), max_size)
+        self.hits = self.misses = 0
+        self._server = None
+
+    @coroutine
+    def start(self):
+        """ Starts listening; `port` is updated if an ephemeral port (0) was requested. """
+        self._server = yield from asyncio.start_server(self._handle_client, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info('Caching proxy listening on {}'.format(self.url))
+
+    @coroutine
+    def stop(self):
+        self._server.close()
+        yield from self._server.wait_closed()
+
+    @property
+    def url(self):
+        return 'http://{}:{}'.format(self.host, self.port)
+
+    def serve_forever(self):
+        """ Runs the proxy until the process is interrupted.
+
+        The URL of the proxy is written to the LXDock's cache directory while the proxy runs so that
+        the containers use it automatically (see `lxdock.utils.cache.get_cache_proxy_url`).
+        """
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        state_path = get_cache_proxy_state_path()
+        try:
+            loop.run_until_complete(self.start())
+            with open(state_path, 'w') as fd:
+                json.dump({'pid': os.getpid(), 'url': self.url}, fd)
+            try:
+                loop.run_forever()
+            finally:
+                os.remove(state_path)
+        finally:
+            loop.close()
+
+    @coroutine
+    def _handle_client(self, reader, writer):
+        try:
+            request_line = (yield from reader.readline()).decode('latin-1').strip()
+            headers = yield from self._read_headers(reader)
+            try:
+                method, target, _ = request_line.split(' ', 2)
+            except ValueError:
+                return self._write_error(writer, 400, 'Bad Request')
+            if method == 'CONNECT':
+                yield from self._tunnel(target, reader, writer)
+            elif not target.startswith('http://'):
+                self._write_error(writer, 400, 'Bad Request')
+            else:
+                body = yield from reader.readexactly(
+                    int(self._get_header(headers, 'content-length', 0)))
+                cacheable_request = method == 'GET' and self._get_header(headers, 'range') is None
+                cached = self.store.get(target) if cacheable_request else None
+                if cached is not None:
+                    self.hits += 1
+                    logger.info('HIT {}'.format(target))
+                    yield from self._write_cached_response(writer, *cached)
+                else:
+                    self.misses += 1
+                    logger.info('MISS {} {}'.format(method, target))
+                    yield from self._forward(
+                        method, target, headers, body, writer, cache=cacheable_request)
+            yield from writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, OSError) as e:
+            logger.debug('Proxy connection error: {}'.format(e))
+        finally:
+            writer.close()
+
+    @coroutine
+    def _forward(self, method, url, headers, body, writer, cache=False):
+        """ Forwards a request to the origin server and streams the response to the client. """
+        parts = urlsplit(url)
+        path = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+        try:
+            origin_reader, origin_writer = yield from asyncio.open_connection(
+                parts.hostname, parts.port or 80)
+        except OSError as e:
+            logger.warning('Unable to connect to {}: {}'.format(parts.netloc, e))
+            return self._write_error(writer, 502, 'Bad Gateway')
+
+        try:
+            # HTTP/1.0 is used so that the origin server doesn't use chunked transfer encoding.
+            request_headers = [(k, v) for k, v in headers if k.lower() not in HOP_BY_HOP_HEADERS]
+            request_headers.append(('Connection', 'close'))
+            if self._get_header(headers, 'host') is None:
+                request_headers.append(('Host', parts.netloc))
+            origin_writer.write(self._serialize('{} {} HTTP/1.0'.format(method, path),
+                                                request_headers) + body)
+
+            status_line = (yield from origin_reader.readline()).decode('latin-1').strip()
+            origin_headers = yield from self._read_headers(origin_reader)
+            try:
+                _, status_reason = status_line.split(' ', 1)
+                status = int(status_reason.split(' ', 1)[0])
+            except ValueError:
+                logger.warning('Invalid response from {}: {!r}'.format(parts.netloc, status_line))
+                return self._write_error(writer, 502, 'Bad Gateway')
+            response_headers = [
+                (k, v) for k, v in origin_headers if k.lower() not in HOP_BY_HOP_HEADERS]
+            expires = self._get_expiration_time(url, response_headers)
+            cache = cache and status == 200 and expires is not False
+
+            writer.write(self._serialize(
+                'HTTP/1.0 {}'.format(status_reason),
+                response_headers + [('Connection', 'close'), ('X-Cache', 'MISS')]))
+            yield from self._stream_response(
+                url, origin_reader, writer,
+                {'headers': response_headers, 'expires': expires} if cache else None)
+        finally:
+            origin_writer.close()
+
+    @coroutine
+    def _stream_response(self, url, origin_reader, writer, metadata):
+        """ Streams the body of a response to the client and stores it if `metadata` is set. """
+        body_path = self.store.get_temporary_path(url) if metadata is not None else None
+        body_file = open(body_path, 'wb') if body_path else None
+        content_length = self._get_header(metadata['headers'], 'content-length') \
+            if metadata is not None else None
+        size = 0
+        try:
+            while True:
+                chunk = yield from origin_reader.read(self.chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                writer.write(chunk)
+                if body_file is not None:
+                    body_file.write(chunk)
+                yield from writer.drain()
+        except BaseException:
+            # The response could not be streamed entirely (eg. the connection to the origin server
+            # or to the client was lost): its body is incomplete and must not be stored.
+            if body_file is not None:
+                body_file.close()
+                os.remove(body_path)
+            raise
+
+        if body_file is not None:
+            body_file.close()
+            # Responses whose size doesn't match their Content-Length header are not stored either.
+            if content_length is None or int(content_length) == size:
+                self.store.put(url, metadata, body_path)
+            else:
+                os.remove(body_path)
+
+    @coroutine
+    def _write_cached_response(self, writer, metadata, body_path):
+        writer.write(self._serialize(
+            'HTTP/1.0 200 OK', metadata['headers'] + [('Connection', 'close'), ('X-Cache', 'HIT')]))
+        with open(body_path, 'rb') as fd:
+            while True:
+                chunk = fd.read(self.chunk_size)
+                if not chunk:
+                    break
+                writer.write(chunk)
+                yield from writer.drain()
+
+    @coroutine
+    def _tunnel(self, target, reader, writer):
+        """ Tunnels an HTTPS connection; the related responses cannot be cached. """
+        host, _, port = target.rpartition(':')
+        try:
+            origin_reader, origin_writer = yield from asyncio.open_connection(host, int(port))
+        except (OSError, ValueError):
+            return self._write_error(writer, 502, 'Bad Gateway')
+        writer.write(b'HTTP/1.0 200 Connection established\r\n\r\n')
+
+        @coroutine
+        def pipe(source, destination):
+            try:
+                while True:
+                    chunk = yield from source.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    destination.write(chunk)
+                    yield from destination.drain()
+            finally:
+                destination.close()
+
+        yield from asyncio.gather(
+            pipe(reader, origin_writer), pipe(origin_reader, writer), return_exceptions=True)
+
+    def _get_expiration_time(self, url, headers):
+        """ Returns the time until which a response can be served from the cache.
+
+        None means that the response never expires; False means that it cannot be cached at all.
+        """
+        cache_control = (self._get_header(headers, 'cache-control') or '').lower()
+        if 'no-store' in cache_control or 'private' in cache_control:
+            return False
+        if urlsplit(url).path.endswith(IMMUTABLE_EXTENSIONS):
+            return None
+        max_age = _max_age_re.search(cache_control)
+        if max_age and int(max_age.group(1)) > 0:
+            return time.time() + int(max_age.group(1))
+        return False
+
+    def _get_header(self, headers, name, default=None):
+        return next((v for k, v in headers if k.lower() == name), default)
+
+    @coroutine
+    def _read_headers(self, reader):
+        headers = []
+        while True:
+            line = (yield from reader.readline()).decode('latin-1').rstrip('\r\n')
+            if not line:
+                return headers
+            name, _, value = line.partition(':')
+            headers.append((name.strip(), value.strip()))
+
+    def _serialize(self, first_line, headers):
+        lines = [first_line, ] + ['{}: {}'.format(k, v) for k, v in headers]
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+    def _write_error(self, writer, status, reason):
+        writer.write(self._serialize('HTTP/1.0 {} {}'.format(status, reason), [
+            ('Content-Length', '0'), ('Connection', 'close')]))
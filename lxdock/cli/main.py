@@ -1,5 +1,6 @@
 import argparse
 import logging
+import os
 import sys
 
 from .. import __version__
@@ -8,6 +9,7 @@ from ..constants import ProvisioningMode
 from ..exceptions import LXDockException
 from ..logging import console_stderr_handler, console_stdout_handler
 from .exceptions import CLIError
+from .utils import positive_int
 
 
 logger = logging.getLogger(__name__)
@@ -29,6 +31,21 @@ class LXDock:
 
         subparsers = parser.add_subparsers(dest='action')
 
+        # Creates the 'cache-proxy' action.
+        self._parsers['cache-proxy'] = subparsers.add_parser(
+            'cache-proxy', help='Run a caching HTTP proxy for containers.',
+            description='Run a forward HTTP proxy caching the packages and archives downloaded by '
+                        'containers. Containers use it automatically while it runs.')
+        self._parsers['cache-proxy'].add_argument(
+            '--host', help='Address to listen on (the IPv4 address of the LXD bridge by default).')
+        self._parsers['cache-proxy'].add_argument(
+            '--bridge', default='lxdbr0', help='Name of the LXD bridge.')
+        self._parsers['cache-proxy'].add_argument(
+            '--port', type=positive_int, default=3142, help='Port to listen on.')
+        self._parsers['cache-proxy'].add_argument(
+            '--max-size', type=positive_int, default=2048,
+            help='Maximum size of the cache (in megabytes).')
+
         # Creates the 'config' action.
         self._parsers['config'] = subparsers.add_parser(
             'config', help='Validate and show the LXDock file.',
@@ -113,6 +130,21 @@ class LXDock:
         for pkey in per_container_parsers:
             self._parsers[pkey].add_argument('name', nargs='*', help='Container name.')
 
+        # Add common arguments to the action parsers that can process multiple containers at the
+        # same time.
+        concurrent_parsers = ['destroy', 'halt', 'up', ]
+        for pkey in concurrent_parsers:
+            self._parsers[pkey].add_argument(
+                '-j', '--jobs', type=positive_int,
+                help='Maximum number of containers to process at the same time.')
+
+        # Add common arguments to the action parsers that provision containers.
+        provisioning_parsers = ['provision', 'up', ]
+        for pkey in provisioning_parsers:
+            self._parsers[pkey].add_argument(
+                '--log-dir',
+                help='Directory where the output of the provisioning of each container is logged.')
+
         # Parses the arguments
         args = parser.parse_args(args=argv)
 
@@ -129,7 +161,7 @@ class LXDock:
 
         try:
             # use dispatch pattern to invoke method with same name
-            getattr(self, args.action)(args)
+            getattr(self, args.action.replace('-', '_'))(args)
         except KeyboardInterrupt:
             logger.warn('\nAborting.')
             sys.exit(1)
@@ -138,6 +170,19 @@ class LXDock:
                 logger.error(e.msg)
                 sys.exit(1)
 
+    def cache_proxy(self, args):
+        # The proxy relies on asyncio, which is only needed by this command.
+        from ..cache_proxy import CachingProxy
+        from ..network import get_interface_ipv4
+        # The proxy listens on the LXD bridge by default so that it can be reached by containers.
+        host = args.host or get_interface_ipv4(args.bridge)
+        if not host:
+            raise CLIError(
+                'The IPv4 address of the LXD bridge ({}) could not be found. Use the --bridge or '
+                '--host options.'.format(args.bridge))
+        proxy = CachingProxy(host=host, port=args.port, max_size=args.max_size * 1024 ** 2)
+        proxy.serve_forever()
+
     def config(self, args):
         # We have to display the LXDock file here, which can be useful for completion or other
         # automated operations. In order to speed up things, we'll just manually create our config
@@ -156,6 +201,7 @@ class LXDock:
         # the considered project.
         container_names = args.name or [c.name for c in self.project.containers]
         containers = [self.project.get_container_by_name(name) for name in container_names]
+        self.project.load_containers_state(containers)
         # At this point we are sure that the containers we are manipulating are defined for the
         # project because we used the `get_container_by_name` method, which raises an error if a
         # container is not defined for the considered project.
@@ -174,10 +220,11 @@ class LXDock:
                 should_destroy = True
 
         if should_destroy:
-            self.project.destroy(container_names=args.name)
+            # The states of the containers were loaded above: they are not fetched again.
+            self.project.destroy(container_names=args.name, jobs=args.jobs, load_state=False)
 
     def halt(self, args):
-        self.project.halt(container_names=args.name)
+        self.project.halt(container_names=args.name, jobs=args.jobs)
 
     def help(self, args):
         try:
@@ -212,7 +259,7 @@ class LXDock:
             fd.write(init_filecontent)
 
     def provision(self, args):
-        self.project.provision(container_names=args.name)
+        self.project.provision(container_names=args.name, log_dir=self._get_log_dir(args))
 
     def shell(self, args):
         self.project.shell(
@@ -222,12 +269,18 @@ class LXDock:
         self.project.status(container_names=args.name)
 
     def up(self, args):
-        self.project.up(container_names=args.name, provisioning_mode=args.provisioning_mode)
+        self.project.up(
+            container_names=args.name, provisioning_mode=args.provisioning_mode, jobs=args.jobs,
+            log_dir=self._get_log_dir(args))
 
     ##################################
     # UTILITY METHODS AND PROPERTIES #
     ##################################
 
+    def _get_log_dir(self, args):
+        """ Returns the absolute path of the log directory passed on the command line, if any. """
+        return os.path.abspath(args.log_dir) if args.log_dir else None
+
     @property
     def project(self):
         """ Initializes a LXDock project instance and returns it. """
@@ -1,3 +1,4 @@
+import argparse
 import collections
 
 
@@ -8,3 +9,14 @@ def yesno(question, default=False):
     answer_to_bool = collections.defaultdict(lambda: default)
     answer_to_bool.update({'yes': True, 'y': True, 'no': False, 'n': False, })
     return answer_to_bool[answer]
+
+
+def positive_int(value):
+    """ Converts a command line argument to a strictly positive integer. """
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise argparse.ArgumentTypeError('{} is not a positive integer'.format(value))
+    return number
@@ -1,27 +1,39 @@
-from voluptuous import (ALLOW_EXTRA, All, Any, Coerce, Extra, In, IsDir, Length, Required, Schema,
-                        Url)
+from voluptuous import (ALLOW_EXTRA, All, Any, Coerce, Extra, In, IsDir, Length, Range, Required,
+                        Schema, Url)
 
+from ..constants import CONTAINER_UP_STAGES, DEPENDENCY_CONDITIONS
 from ..provisioners import Provisioner
 from .validators import Hostname, LXDIdentifier
 
 
 def get_schema():
     _top_level_and_containers_common_options = {
+        'agent': bool,
+        # The URL of the caching proxy that should be used by the containers (instead of the proxy
+        # run by `lxdock cache-proxy`).
+        'cache_proxy': Url(),
         'environment': {Extra: Coerce(str)},
         'hostnames': [Hostname(), ],
         'image': str,
         'lxc_config': {Extra: str},
         'mode': In(['local', 'pull', ]),
+        'package_cache': bool,
+        # The number of seconds during which the package metadata of the guests is considered fresh.
+        'package_metadata_max_age': All(int, Range(min=0)),
         'privileged': bool,
         'profiles': [str, ],
         'protocol': In(['lxd', 'simplestreams', ]),
         'provisioning': [],  # will be set dynamically using provisioner classes...
+        # The directory (relative to the project's directory) where the output of the commands run
+        # in the containers during their provisioning is logged.
+        'provisioning_log_dir': str,
         'server': Url(),
         'shares': [{
             # The existence of the source directory will be checked!
             'source': IsDir(),
             'dest': str,
             'set_host_acl': bool,
+            'mapping': In(['shift', 'raw_idmap', ]),
         }],
         'shell': {
             'user': str,
@@ -56,12 +68,23 @@ def get_schema():
 
     _container_options = {
         Required('name'): LXDIdentifier(),
+        # The containers that should be brought up before the considered container; a condition
+        # can be specified in order to only wait for them to be up instead of being provisioned.
+        'depends_on': [Any({
+            Required('name'): LXDIdentifier(),
+            'condition': In(DEPENDENCY_CONDITIONS),
+        }, All(str, LXDIdentifier())), ],
     }
     _container_options.update(_top_level_and_containers_common_options)
 
     _lxdock_options = {
         Required('name'): LXDIdentifier(),
         'containers': [_container_options, ],
+        # The maximum number of containers that can be processed concurrently.
+        'parallelism': All(int, Range(min=1)),
+        # The maximum number of containers that can go through each stage of the "up" action at the
+        # same time.
+        'stage_parallelism': {In(CONTAINER_UP_STAGES): All(int, Range(min=1))},
     }
     _lxdock_options.update(_top_level_and_containers_common_options)
 
@@ -17,6 +17,19 @@ CONTAINER_STOPPED = 102
 CONTAINER_RUNNING = 103
 
 
+# CONTAINER LIFECYCLE STAGES
+# --
+
+# The stages each container goes through when it is brought up, in order.
+CONTAINER_UP_STAGES = ('create', 'start', 'network', 'setup', 'provision', )
+
+# The conditions a container can wait for before being brought up: the containers it depends on can
+# be up (running and set up but not provisioned yet) or provisioned (the default).
+DEPENDENCY_CONDITION_UP = 'up'
+DEPENDENCY_CONDITION_PROVISIONED = 'provisioned'
+DEPENDENCY_CONDITIONS = (DEPENDENCY_CONDITION_UP, DEPENDENCY_CONDITION_PROVISIONED, )
+
+
 # PROVISIONING
 # --
 
@@ -1,26 +1,39 @@
+import hashlib
+import itertools
+import json
 import logging
 import os
 import shlex
 import subprocess
 import textwrap
 import time
+from contextlib import contextmanager
 from functools import wraps
 from pathlib import PurePosixPath
 
 from pylxd.exceptions import LXDAPIException, NotFound
 
 from . import constants
+from .events import EventListener
 from .exceptions import ContainerOperationFailed
 from .guests import Guest
 from .hosts import Host
-from .network import EtcHosts, get_ip
+from .network import EtcHosts, get_ip_from_state, host_etchosts_lock
 from .provisioners import Provisioner
+from .utils.cache import get_cache_dir, get_cache_proxy_url, lock_cache_dir
 from .utils.identifier import folderid
+from .utils.lxd import patch_container, supports_api_extension
 
 
 logger = logging.getLogger(__name__)
 
 
+@contextmanager
+def _unlimited_stage(name):
+    """ Default stage context manager used when bringing up containers: it does nothing. """
+    yield
+
+
 def must_be_created_and_running(method):
     @wraps(method)
     def wrapper(self, *args, **kwargs):
@@ -35,6 +48,85 @@ def must_be_created_and_running(method):
     return wrapper
 
 
+class ContainerStateCache:
+    """ Caches the state of a specific PyLXD container.
+
+    The cache holds the PyLXD container (and thus its configuration, its devices and its status) and
+    its runtime state (eg. its network state). Cached values expire after `ttl` seconds and should
+    be invalidated when the container is modified. The `hits` and `misses` counters can be used to
+    know how many LXD API calls were saved (or not) by the cache.
+    """
+
+    def __init__(self, client, lxd_name, ttl=5):
+        self.client = client
+        self.lxd_name = lxd_name
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._container = None
+        self._container_fetched_at = None
+        self._state = None
+        self._state_fetched_at = None
+
+    @property
+    def container(self):
+        """ Returns the cached PyLXD container without checking if it expired.
+
+        The container is fetched only if it was never fetched before. None is returned if the
+        container does not exist.
+        """
+        if self._container_fetched_at is None and self._container is None:
+            return self.get()
+        return self._container
+
+    def get(self):
+        """ Returns the PyLXD container (or None if it does not exist) with a fresh status. """
+        if self._is_fresh(self._container_fetched_at):
+            self.hits += 1
+            return self._container
+
+        self.misses += 1
+        if self._container is not None:
+            # The PyLXD container is refreshed in place because it can be referenced elsewhere (eg.
+            # by `Guest` instances).
+            try:
+                self._container.sync()
+            except NotFound:
+                self._container = None
+        else:
+            try:
+                self._container = self.client.containers.get(self.lxd_name)
+            except NotFound:
+                self._container = None
+        self._container_fetched_at = time.monotonic()
+        self._state = None
+        return self._container
+
+    def get_state(self, force=False):
+        """ Returns the runtime state of the container (eg. its network state). """
+        if not force and self._state is not None and self._is_fresh(self._state_fetched_at):
+            self.hits += 1
+            return self._state
+        self.misses += 1
+        self._state = self.container.state()
+        self._state_fetched_at = time.monotonic()
+        return self._state
+
+    def invalidate(self):
+        """ Invalidates the cached values; they will be fetched again when needed. """
+        self._container_fetched_at = None
+        self._state = None
+
+    def set(self, container):
+        """ Stores a fresh PyLXD container (or None if the container doesn't exist). """
+        self._container = container
+        self._container_fetched_at = time.monotonic()
+        self._state = None
+
+    def _is_fresh(self, fetched_at):
+        return fetched_at is not None and time.monotonic() - fetched_at < self.ttl
+
+
 class Container:
     """ Represents a specific container that is managed by LXDock. """
 
@@ -44,6 +136,9 @@ class Container:
     # The default path for storing the command to execute during `lxdock shell`.
     _guest_shell_script_file = '/.lxdock.d/shell_cmd.sh'
 
+    # The number of seconds during which the state of the container is cached.
+    _state_cache_ttl = 5
+
     def __init__(self, project_name, homedir, client, **options):
         self.project_name = project_name
         self.homedir = homedir
@@ -54,28 +149,38 @@ class Container:
     # CONTAINER ACTIONS #
     #####################
 
-    def destroy(self):
-        """ Destroys the container. """
+    def destroy(self, unsetup_hostnames=True):
+        """ Destroys the container.
+
+        The hostnames of the container are removed from the host's /etc/hosts file unless
+        `unsetup_hostnames` is False (eg. if this was already done for many containers at once).
+        """
         container = self._get_container(create=False)
         if container is None:
             logger.info("Container doesn't exist, nothing to destroy.")
             return
 
         # Halts the container...
-        self.halt()
+        self.halt(unsetup_hostnames=unsetup_hostnames)
         # ... and destroy it!
         logger.info('Destroying container "{name}"...'.format(name=self.name))
         container.delete(wait=True)
+        self._state_cache.set(None)
         logger.info('Container "{name}" destroyed!'.format(name=self.name))
 
-    def halt(self):
-        """ Stops the container. """
+    def halt(self, unsetup_hostnames=True):
+        """ Stops the container.
+
+        The hostnames of the container are removed from the host's /etc/hosts file unless
+        `unsetup_hostnames` is False.
+        """
         if self.is_stopped:
             logger.info('The container is already stopped.')
             return
 
         # Removes configurations related to container's hostnames if applicable.
-        self._unsetup_hostnames()
+        if unsetup_hostnames:
+            self._unsetup_hostnames()
 
         logger.info('Stopping...')
         try:
@@ -83,19 +188,26 @@ class Container:
         except LXDAPIException:
             logger.warn("Can't stop the container. Forcing...")
             self._container.stop(force=True, wait=True)
+        # Note: PyLXD syncs the container once it is stopped.
+        self._state_cache.set(self._container)
 
     @must_be_created_and_running
-    def provision(self):
-        """ Provisions the container. """
-        # We run this in case our lxdock.yml config was modified since our last `lxdock up`.
+    def provision(self, log_dir=None):
+        """ Provisions the container.
+
+        The output of the commands run in the container is appended to a log file named after the
+        container in `log_dir` (or in the directory defined by the `provisioning_log_dir` option),
+        if any.
+        """
+        # We run this in case our lxdock.yml config was modified since our last `lxdock up`. Nothing
+        # is written if the environment didn't change.
+        self._setup_cache_proxy()
         self._setup_env()
+        self._save_container()
         barebone = not self.is_provisioned
 
         provisioning_steps = self.options.get('provisioning', [])
 
-        if barebone:
-            self._perform_barebones_setup()
-
         # Instantiate all provisioners
         provisioners = []
         for provisioning_item in provisioning_steps:
@@ -108,25 +220,28 @@ class Container:
 
         logger.info('Provisioning container "{name}"...'.format(name=self.name))
 
-        # Do barebone setups for each provisioner if necessary
-        if barebone:
-            for provisioner in provisioners:
-                logger.info('Performing barebones setup for provisioner {0}'.format(
-                    provisioner.name))
-                provisioner.setup()
+        with self._logging_guest_output(log_dir):
+            if barebone:
+                self._perform_barebones_setup()
 
-        # Provision
-        for provisioner in provisioners:
-            logger.info('Provisioning with {0}'.format(provisioner.name))
-            provisioner.provision()
+            with self._using_guest_agent():
+                # Do barebone setups for each provisioner if necessary
+                if barebone:
+                    self._setup_provisioners(provisioners)
 
-        self._container.config['user.lxdock.provisioned'] = 'true'
-        self._container.save(wait=True)
+                # Provision
+                for provisioner in provisioners:
+                    logger.info('Provisioning with {0}'.format(provisioner.name))
+                    provisioner.provision()
+
+        self._set_config('user.lxdock.provisioned', 'true')
+        self._save_container()
 
     @must_be_created_and_running
     def shell(self, username=None, cmd_args=[]):
         """ Opens a new interactive shell in the container. """
-        # We run this in case our lxdock.yml config was modified since our last `lxdock up`.
+        # We run this in case our lxdock.yml config was modified since our last `lxdock up`. Nothing
+        # is written if the environment didn't change.
         self._setup_env()
 
         # For now, it's much easier to call `lxc`, but eventually, we might want to contribute
@@ -150,59 +265,92 @@ class Container:
             # 2. Applying shlex.quote to every argument to protect special characters.
             #    e.g.: lxdock shell container_name -c echo "he re\"s" '$PATH'
 
-            self._guest.run(['mkdir', '-p',
-                             str(PurePosixPath(self._guest_shell_script_file).parent)])
-            self._container.files.put(self._guest_shell_script_file, textwrap.dedent(
-                """\
-                #!/bin/sh
-                {}
-                """.format(' '.join(map(shlex.quote, cmd_args)))))
-            self._guest.run(['chmod', 'a+rx', self._guest_shell_script_file])
+            with self._guest.batch(stop_on_error=True) as batch:
+                batch.run(['mkdir', '-p', str(PurePosixPath(self._guest_shell_script_file).parent)])
+                batch.write_file(self._guest_shell_script_file, textwrap.dedent(
+                    """\
+                    #!/bin/sh
+                    {}
+                    """.format(' '.join(map(shlex.quote, cmd_args)))))
+                batch.run(['chmod', 'a+rx', self._guest_shell_script_file])
             cmd += ' -s {}'.format(self._guest_shell_script_file)
 
+        # The changes are saved once the guest has been used so that the name of a newly detected
+        # guest is stored along with the environment.
+        self._save_container()
         subprocess.call(cmd, shell=True)
 
-    def up(self, provisioning_mode=None):
-        """ Creates, starts and provisions the container. """
-        if self.is_running:
+    def up(self, provisioning_mode=None, stage=None, events=None, log_dir=None):
+        """ Creates, starts and provisions the container.
+
+        The container goes through each stage defined in `constants.CONTAINER_UP_STAGES`. `stage`
+        can be a callable that returns a context manager for a given stage name; it will be used to
+        wrap the operations of each stage (eg. in order to limit the number of containers going
+        through a specific stage at the same time). `events` can be an `EventListener` instance that
+        is shared by multiple containers in order to react to LXD events. `log_dir` is passed to
+        `provision`.
+        """
+        stage = stage or _unlimited_stage
+
+        with stage('create'):
+            # Note: the PyLXD container is created here if it doesn't exist yet.
+            is_running = self.is_running
+        if is_running:
             logger.info('Container "{name}" is already running'.format(name=self.name))
             return
 
-        logger.info('Starting container "{name}"...'.format(name=self.name))
-        self._container.start(wait=True)
-        if not self.is_running:
-            logger.error('Something went wrong trying to start the container.')
-            raise ContainerOperationFailed()
-
-        ip = self._setup_ip()
+        with stage('start'):
+            logger.info('Starting container "{name}"...'.format(name=self.name))
+            self._container.start(wait=True)
+            # Note: PyLXD syncs the container once it is started.
+            self._state_cache.set(self._container)
+            if not self.is_running:
+                logger.error('Something went wrong trying to start the container.')
+                raise ContainerOperationFailed()
+
+        with stage('network'):
+            ip = self._setup_ip(events=events)
         if not ip:
             return
 
         logger.info('Container "{name}" is up! IP: {ip}'.format(name=self.name, ip=ip))
 
-        # Setup hostnames if applicable.
-        self._setup_hostnames(ip)
+        with stage('setup'), self._using_guest_agent():
+            # Setup hostnames if applicable.
+            self._setup_hostnames(ip)
 
-        # Setup users if applicable.
-        self._setup_users()
+            # Setup users if applicable.
+            self._setup_users()
 
-        # Setup shares if applicable.
-        self._setup_shares()
+            # Setup shares if applicable.
+            self._setup_shares()
 
-        # Override environment variables
-        self._setup_env()
+            # Setup the shared package cache if applicable.
+            self._setup_package_cache()
+
+            # Setup the caching proxy if applicable.
+            self._setup_cache_proxy()
+
+            # Override environment variables
+            self._setup_env()
 
-        # Provisions the container if applicable; that is only if it hasn't been provisioned before
-        # or if the provisioning is manually enabled.
-        is_provisioned = self.is_provisioned
-        provisioning_mode = provisioning_mode or constants.ProvisioningMode.AUTO
-        if not provisioning_mode == constants.ProvisioningMode.DISABLED:
-            if (not is_provisioned and provisioning_mode == constants.ProvisioningMode.AUTO) or \
-                    provisioning_mode == constants.ProvisioningMode.ENABLED:
-                self.provision()
-            elif is_provisioned:
-                logger.info('Container "{name}" already provisioned, '
-                            'not provisioning.'.format(name=self.name))
+            # Saves the changes made to the shares, the package cache, the caching proxy and the
+            # environment at once (if any).
+            self._save_container()
+
+        with stage('provision'):
+            # Provisions the container if applicable; that is only if it hasn't been provisioned
+            # before or if the provisioning is manually enabled.
+            is_provisioned = self.is_provisioned
+            provisioning_mode = provisioning_mode or constants.ProvisioningMode.AUTO
+            if not provisioning_mode == constants.ProvisioningMode.DISABLED:
+                if (not is_provisioned and
+                        provisioning_mode == constants.ProvisioningMode.AUTO) or \
+                        provisioning_mode == constants.ProvisioningMode.ENABLED:
+                    self.provision(log_dir=log_dir)
+                elif is_provisioned:
+                    logger.info('Container "{name}" already provisioned, '
+                                'not provisioning.'.format(name=self.name))
 
     ##################################
     # UTILITY METHODS AND PROPERTIES #
@@ -211,12 +359,7 @@ class Container:
     @property
     def exists(self):
         """ Returns True if the considered container has already been created. """
-        try:
-            self.client.containers.get(self.lxd_name)
-        except NotFound:
-            return False
-        else:
-            return True
+        return self._state_cache.get() is not None
 
     @property
     def is_privileged(self):
@@ -231,12 +374,12 @@ class Container:
     @property
     def is_running(self):
         """ Returns a boolean indicating if the container is running. """
-        return self._container.status_code == constants.CONTAINER_RUNNING
+        return self._fresh_container.status_code == constants.CONTAINER_RUNNING
 
     @property
     def is_stopped(self):
         """ Returns a boolean indicating if the container is stopped. """
-        return self._container.status_code == constants.CONTAINER_STOPPED
+        return self._fresh_container.status_code == constants.CONTAINER_STOPPED
 
     @property
     def lxd_name(self):
@@ -261,6 +404,14 @@ class Container:
         """ Returns the "local" name of the container. """
         return self.options['name']
 
+    def set_lxd_container(self, lxd_container):
+        """ Associates a PyLXD container that was fetched beforehand with the container.
+
+        `lxd_container` should be None if the container does not exist on LXD's side. This allows
+        projects to fetch the states of all their containers at once instead of one by one.
+        """
+        self._state_cache.set(lxd_container)
+
     @property
     def status(self):
         """ Returns a string identifier representing the current status of the container. """
@@ -281,16 +432,10 @@ class Container:
 
     def _get_container(self, create=True):
         """ Gets or creates the PyLXD container. """
-        try:
-            container = self.client.containers.get(self.lxd_name)
-        except NotFound:
-            container = None
-        else:
+        container = self._state_cache.get()
+        if container is not None or not create:
             return container
 
-        if not create:
-            return
-
         logger.warn('Unable to find container "{name}" for directory "{homedir}"'.format(
             name=self.name, homedir=self.homedir))
 
@@ -310,6 +455,17 @@ class Container:
             'user.lxdock.homedir': self.homedir,
         })
 
+        # Maps the current user to the root user of the container if this is required by shares. We
+        # do this at creation time so that the container doesn't need to be restarted.
+        raw_idmap = self._get_raw_idmap()
+        if raw_idmap is not None:
+            lxc_config['raw.idmap'] = raw_idmap
+
+        # Makes the commands run in the container use the caching proxy if applicable.
+        cache_proxy = self._get_cache_proxy_url()
+        if cache_proxy:
+            lxc_config['environment.http_proxy'] = cache_proxy
+
         container_config = {
             'name': self.lxd_name,
             'source': {
@@ -339,10 +495,12 @@ class Container:
             container_config['profiles'] = profiles.copy()
 
         try:
-            return self.client.containers.create(container_config, wait=True)
+            container = self.client.containers.create(container_config, wait=True)
         except LXDAPIException as e:
             logger.error("Can't create container: {error}".format(error=e))
             raise ContainerOperationFailed()
+        self._state_cache.set(container)
+        return container
 
     def _perform_barebones_setup(self):
         """ Performs bare bones setup on the machine. """
@@ -355,13 +513,38 @@ class Container:
         else:
             logger.warning('SSH pubkey was not found. Provisioning tools may not work correctly...')
 
+        # Install the guest agent if applicable.
+        if self.options.get('agent'):
+            self._guest.install_agent()
+
+    def _setup_cache_proxy(self):
+        """ Makes the container use the caching proxy if applicable, or stop using it otherwise.
+
+        The proxy defined by the `cache_proxy` option is used if any. Otherwise the proxy run by
+        `lxdock cache-proxy` is used while it runs. The proxy used by the container is stored in its
+        config so that the package manager of the guest is only reconfigured when it changes.
+        """
+        cache_proxy = self._get_cache_proxy_url() or ''
+        if cache_proxy == self._container.config.get('user.lxdock.cache_proxy', ''):
+            return
+
+        if cache_proxy:
+            logger.info('Using the caching proxy {}'.format(cache_proxy))
+            self._guest.configure_package_proxy(cache_proxy)
+            self._set_config('environment.http_proxy', cache_proxy)
+        else:
+            logger.info('Removing the caching proxy configuration')
+            self._guest.remove_package_proxy()
+            # LXD removes the configuration keys whose value is empty.
+            self._set_config('environment.http_proxy', '')
+        self._set_config('user.lxdock.cache_proxy', cache_proxy)
+
     def _setup_env(self):
         """ Add environment overrides from the conf to our container config. """
         env_override = self.options.get('environment')
         if env_override:
             for key, value in env_override.items():
-                self._container.config['environment.{}'.format(key)] = str(value)
-            self._container.save(wait=True)
+                self._set_config('environment.{}'.format(key), str(value))
 
     def _setup_hostnames(self, ip):
         """ Configure the potential hostnames associated with the container. """
@@ -369,28 +552,74 @@ class Container:
         if not hostnames:
             return
 
-        etchosts = EtcHosts()
-        for hostname in hostnames:
-            logger.info('Setting {hostname} to point to {ip}.'.format(
-                hostname=hostname, ip=ip))
-            etchosts.ensure_binding_present(hostname, ip)
-        if etchosts.changed:
-            logger.info("Saving host bindings to /etc/hosts. sudo may be needed")
-            etchosts.save()
-
-    def _setup_ip(self):
+        with host_etchosts_lock:
+            etchosts = EtcHosts()
+            for hostname in hostnames:
+                logger.info('Setting {hostname} to point to {ip}.'.format(
+                    hostname=hostname, ip=ip))
+                etchosts.ensure_binding_present(hostname, ip)
+            if etchosts.changed:
+                logger.info("Saving host bindings to /etc/hosts. sudo may be needed")
+                etchosts.save()
+
+    def _setup_ip(self, events=None):
         """ Setup the IP address of the considered container. """
-        ip = get_ip(self._container)
+        ip = get_ip_from_state(self._state_cache.get_state())
         if not ip:
             logger.info('No IP yet, waiting for at most 10 seconds...')
-            ip = self._wait_for_ip()
+            ip = self._wait_for_ip(events=events)
         if not ip:
             logger.warn('STILL no IP! Container is up, but probably broken.')
             logger.info('Maybe that restarting it will help? Not trying to provision.')
         return ip
 
+    def _setup_package_cache(self):
+        """ Mounts the host directory used as a package cache into the container if applicable.
+
+        The packages downloaded by the package manager of the container are stored in a directory of
+        the LXDock's cache directory that is shared by all the containers using the same
+        distribution and release. This way each package is downloaded only once.
+        """
+        package_cache_dir = self._get_package_cache_dir()
+        if package_cache_dir is None:
+            if self._container.devices.get(self._package_cache_device_name):
+                self._set_device(self._package_cache_device_name, None)
+            return
+
+        logger.info('Setting up the shared package cache ({})'.format(package_cache_dir))
+        self._host.give_access_to_share(
+            package_cache_dir, mapped_userpaths=None if self.is_privileged else [None, ])
+        self._set_device(self._package_cache_device_name, {
+            'type': 'disk', 'source': package_cache_dir, 'path': self._guest.package_cache_path, })
+
+    def _setup_provisioners(self, provisioners):
+        """ Performs the barebones setup of the provisioners.
+
+        The packages required by all the provisioners are installed at once (so that the package
+        manager of the guest runs only once) before running the setup operations that are specific
+        to each provisioner.
+        """
+        packages = []
+        for provisioner in provisioners:
+            for package in provisioner.get_required_packages():
+                if package not in packages:
+                    packages.append(package)
+        if packages:
+            logger.info('Installing packages required by the provisioners on the guest')
+            with self._holding_package_cache():
+                self._guest.install_packages(packages)
+
+        for provisioner in provisioners:
+            logger.info('Performing barebones setup for provisioner {0}'.format(provisioner.name))
+            provisioner.setup_guest()
+
     def _setup_shares(self):
-        """ Setup the shared folders associated with the container. """
+        """ Setup the shared folders associated with the container.
+
+        Shares are reconciled with the devices of the container: devices corresponding to shares
+        that are still defined are left untouched, only new shares are added and only stale shares
+        are removed. Host-side ACL are only set when the ACL fingerprint of a share changed.
+        """
         if 'shares' not in self.options:
             return
 
@@ -398,35 +627,62 @@ class Container:
 
         container = self._container
 
-        # First, let's make an inventory of shared sources that were already there.
+        # First, let's make an inventory of the lxdock shares that were already there and of the ACL
+        # fingerprints of the shared sources.
         existing_shares = {
             k: d for k, d in container.devices.items() if k.startswith('lxdockshare')}
-        existing_sources = {d['source'] for d in existing_shares.values()}
+        existing_fingerprints = json.loads(
+            container.config.get('user.lxdock.shares_acl') or '{}')
 
-        # Let's get rid of previously set up lxdock shares.
-        for k in existing_shares:
-            del container.devices[k]
-
-        for i, share in enumerate(self.options.get('shares', []), start=1):
+        fingerprints = {}
+        new_shares = []
+        for share in self.options.get('shares', []):
             source = os.path.join(self.homedir, share['source'])
             # It is possible to disable setting host side ACL but by default it is always enabled.
-            set_host_acl = share.get('set_host_acl', True)
-            if set_host_acl and source not in existing_sources:
-                logger.info('Setting host-side ACL for {}'.format(source))
-                self._host.give_current_user_access_to_share(source)
-                if not self.is_privileged:
-                    # We are considering a safe container. So give the mapped root user permissions
-                    # to read/write contents in the shared folders too.
-                    self._host.give_mapped_user_access_to_share(source)
-                    # We also give these permissions to any user that was created with LXDock.
-                    for uconfig in self.options.get('users', []):
-                        username = uconfig.get('name')
-                        self._host.give_mapped_user_access_to_share(
-                            source, userpath=uconfig.get('home', '/home/' + username))
+            # ACL are useless if the share relies on LXD's uid/gid mapping features.
+            mapping = share.get('mapping')
+            set_host_acl = share.get('set_host_acl', True) and mapping is None
+            if set_host_acl:
+                fingerprint = self._get_share_acl_fingerprint(source)
+                if existing_fingerprints.get(source) != fingerprint:
+                    self._set_host_acl(source)
+                fingerprints[source] = fingerprint
 
             shareconf = {'type': 'disk', 'source': source, 'path': share['dest'], }
-            container.devices['lxdockshare%s' % i] = shareconf
-        container.save(wait=True)
+            if mapping == 'shift':
+                # LXD will shift the uids/gids of the files of the share so that the users of the
+                # container can access them.
+                shareconf['shift'] = 'true'
+            # Let's keep the devices that match a share that is still defined.
+            name = next((k for k, d in existing_shares.items() if d == shareconf), None)
+            if name is not None:
+                del existing_shares[name]
+            else:
+                new_shares.append(shareconf)
+
+        # The devices that remain are stale: their names are reused for the new shares if possible.
+        used_names = {k for k in container.devices if k.startswith('lxdockshare')} - \
+            set(existing_shares)
+        available_names = (
+            'lxdockshare%s' % i for i in itertools.count(1)
+            if 'lxdockshare%s' % i not in used_names)
+        for shareconf in new_shares:
+            name = next(available_names)
+            existing_shares.pop(name, None)
+            self._set_device(name, shareconf)
+        for name in existing_shares:
+            self._set_device(name, None)
+
+        # Maps the current user to the root user of the container if necessary.
+        raw_idmap = self._get_raw_idmap()
+        if raw_idmap is not None and container.config.get('raw.idmap') != raw_idmap:
+            logger.warning(
+                'The uid/gid mapping of the container changed: the container must be restarted for '
+                'this change to be taken into account (lxdock halt && lxdock up).')
+            self._set_config('raw.idmap', raw_idmap)
+
+        if fingerprints or existing_fingerprints:
+            self._set_config('user.lxdock.shares_acl', json.dumps(fingerprints, sort_keys=True))
 
     def _setup_users(self):
         """ Creates users defined in the container's options if applicable. """
@@ -435,11 +691,8 @@ class Container:
             return
 
         logger.info('Ensuring users are created...')
-        for user_config in users:
-            name = user_config.get('name')
-            home = user_config.get('home')
-            password = user_config.get('password')
-            self._guest.create_user(name, home=home, password=password)
+        # Only the users that don't exist yet are created, using a single command.
+        self._guest.ensure_users(users)
 
     def _unsetup_hostnames(self):
         """ Removes the configuration associated with the hostnames of the container. """
@@ -447,28 +700,225 @@ class Container:
         if not hostnames:
             return
 
-        etchosts = EtcHosts()
-        for hostname in hostnames:
-            logger.info('Unsetting {hostname}. sudo needed.'.format(hostname=hostname))
-            etchosts.ensure_binding_absent(hostname)
-        if etchosts.changed:
-            etchosts.save()
-
-    def _wait_for_ip(self, seconds=10):
-        """ Waits some time before trying to get the IP of the container and returning it. """
-        for i in range(seconds):
-            time.sleep(1)
-            ip = get_ip(self._container)
-            if ip:
-                return ip
-        return ''
+        with host_etchosts_lock:
+            etchosts = EtcHosts()
+            for hostname in hostnames:
+                logger.info('Unsetting {hostname}. sudo needed.'.format(hostname=hostname))
+                etchosts.ensure_binding_absent(hostname)
+            if etchosts.changed:
+                etchosts.save()
+
+    @contextmanager
+    def _holding_package_cache(self):
+        """ Holds the lock of the shared package cache (if any) while the operations of the context
+        are performed.
+
+        The package cache is shared by the containers of the same release, which can be provisioned
+        concurrently. The lock should only be held while the package manager of the guest refreshes
+        its metadata and installs packages so that the other provisioning steps can still run
+        concurrently.
+        """
+        package_cache_dir = self._get_package_cache_dir()
+        if package_cache_dir is None:
+            yield
+            return
+        logger.debug('Waiting for the lock of the package cache {}'.format(package_cache_dir))
+        with lock_cache_dir(package_cache_dir):
+            yield
+
+    @contextmanager
+    def _logging_guest_output(self, log_dir=None):
+        """ Writes the output of the commands run in the guest to a log file (if applicable).
+
+        The output is appended to a file named after the container in `log_dir` (or in the directory
+        defined by the `provisioning_log_dir` option) while the operations of the context are
+        performed.
+        """
+        log_dir = log_dir or self.options.get('provisioning_log_dir')
+        if log_dir is None:
+            yield
+            return
+        log_dir = os.path.join(self.homedir, log_dir)
+        os.makedirs(log_dir, exist_ok=True)
+        log_path = os.path.join(log_dir, '{}.log'.format(self.name))
+        logger.info('Writing the output of the provisioning to {}'.format(log_path))
+        with open(log_path, 'ab') as log_file:
+            self._guest.output_log = log_file
+            try:
+                yield
+            finally:
+                self._guest.output_log = None
+
+    @contextmanager
+    def _using_guest_agent(self):
+        """ Runs the guest agent (if enabled) while the operations of the context are performed.
+
+        The agent is left running if it was already started by an enclosing context.
+        """
+        started = self.options.get('agent') and self._guest.agent is None and \
+            self._guest.start_agent()
+        try:
+            yield
+        finally:
+            if started:
+                self._guest.stop_agent()
+
+    def _wait_for_ip(self, events=None, seconds=10):
+        """ Waits for the container to get an IP address and returns it.
+
+        The IP address is checked each time `events` (an `EventListener` instance) receives an LXD
+        event related to the container, and periodically. An empty string is returned if the
+        container still has no IP after the specified amount of seconds.
+        """
+        events = events or EventListener(self.client)
+        return events.wait_for(
+            lambda: get_ip_from_state(self._state_cache.get_state(force=True)),
+            self.lxd_name, seconds)
+
+    def _get_cache_proxy_url(self):
+        """ Returns the URL of the caching proxy that should be used by the container, if any. """
+        return self.options.get('cache_proxy') or get_cache_proxy_url()
+
+    _package_cache_device_name = 'lxdockpkgcache'
+
+    def _get_package_cache_dir(self):
+        """ Returns the host directory used as the package cache of the container (if any). """
+        if not self.options.get('package_cache') or not self._guest.package_cache_path:
+            return None
+        release = self._container.config.get('image.release') or 'default'
+        return get_cache_dir('pkg', self._guest.name, release.replace('/', '_'))
+
+    def _get_raw_idmap(self):
+        """ Returns the raw.idmap value required by the shares of the container (or None).
+
+        Shares using the "raw_idmap" mapping require the current user of the host to be mapped to
+        the root user of the container. None is returned if no share uses this mapping or if a
+        raw.idmap value is explicitly defined using the lxc_config option.
+        """
+        uses_raw_idmap = any(
+            share.get('mapping') == 'raw_idmap' for share in self.options.get('shares', []))
+        if not uses_raw_idmap or 'raw.idmap' in self.options.get('lxc_config', {}):
+            return None
+        return 'uid {} 0\ngid {} 0'.format(os.getuid(), os.getgid())
+
+    def _get_share_acl_fingerprint(self, source):
+        """ Returns a fingerprint of the host-side ACL that should be set for a shared source.
+
+        The fingerprint changes if the ACL to set change (eg. because new users are defined) or if
+        the source itself was replaced. Note that it is stored in the configuration of the
+        container, so ACL are set again if the container is recreated.
+        """
+        try:
+            source_inode = os.stat(source).st_ino
+        except OSError:
+            source_inode = None
+        acl_targets = {
+            'inode': source_inode,
+            'mapped': not self.is_privileged,
+            'users': sorted(
+                uconfig.get('home', '/home/' + uconfig.get('name'))
+                for uconfig in self.options.get('users', [])),
+        }
+        return hashlib.sha1(json.dumps(acl_targets, sort_keys=True).encode()).hexdigest()
+
+    def _set_host_acl(self, source):
+        """ Sets the host-side ACL giving the users of the container access to a shared folder. """
+        logger.info('Setting host-side ACL for {}'.format(source))
+        mapped_userpaths = None
+        if not self.is_privileged:
+            # We are considering a safe container. So give the mapped root user permissions to
+            # read/write contents in the shared folders too. We also give these permissions to any
+            # user that was created with LXDock.
+            mapped_userpaths = [None, ] + [
+                uconfig.get('home', '/home/' + uconfig.get('name'))
+                for uconfig in self.options.get('users', [])]
+        self._host.give_access_to_share(source, mapped_userpaths=mapped_userpaths)
+
+    def _save_container(self):
+        """ Saves the pending changes of the configuration and of the devices of the container.
+
+        The pending changes (see `_set_config` and `_set_device`) are compared to the current
+        values of the PyLXD container: nothing is written if they are identical. Otherwise the
+        changes are sent using a single PATCH request if possible; a full update of the container
+        is performed if the LXD server doesn't support PATCH requests or if devices are removed.
+        """
+        config_changes, devices_changes = self._get_pending_changes()
+        self._pending_config, self._pending_devices = {}, {}
+        if not config_changes and not devices_changes:
+            return
+
+        container = self._container
+        container.config.update(config_changes)
+        for name, device in devices_changes.items():
+            if device is None:
+                container.devices.pop(name, None)
+            else:
+                container.devices[name] = device
+
+        removes_devices = any(device is None for device in devices_changes.values())
+        if not removes_devices and supports_api_extension(self.client, 'patch'):
+            data = {}
+            if config_changes:
+                data['config'] = config_changes
+            if devices_changes:
+                data['devices'] = devices_changes
+            patch_container(container, data, wait=True)
+        else:
+            container.save(wait=True)
+        self._state_cache.invalidate()
+
+    def _get_pending_changes(self):
+        """ Returns the pending changes that differ from the current values of the container.
+
+        A tuple of two dictionaries is returned: the changed configuration keys and the changed
+        devices (None values are used for devices to remove).
+        """
+        pending_config = getattr(self, '_pending_config', {})
+        pending_devices = getattr(self, '_pending_devices', {})
+        if not pending_config and not pending_devices:
+            return {}, {}
+        container = self._container
+        config_changes = {
+            k: v for k, v in pending_config.items() if container.config.get(k) != v}
+        devices_changes = {
+            k: d for k, d in pending_devices.items() if container.devices.get(k) != d}
+        return config_changes, devices_changes
+
+    def _set_config(self, key, value):
+        """ Registers a change to the configuration of the container (see `_save_container`). """
+        if not hasattr(self, '_pending_config'):
+            self._pending_config = {}
+        self._pending_config[key] = value
+
+    def _set_device(self, name, device):
+        """ Registers a change to the devices of the container (see `_save_container`).
+
+        `device` should be a dictionary describing the device, or None if it should be removed.
+        """
+        if not hasattr(self, '_pending_devices'):
+            self._pending_devices = {}
+        self._pending_devices[name] = device
 
     @property
     def _container(self):
         """ Returns the PyLXD Container instance associated with the considered container. """
-        if not hasattr(self, '_pylxd_container'):
-            self._pylxd_container = self._get_container()
-        return self._pylxd_container
+        return self._state_cache.container or self._get_container()
+
+    @property
+    def _fresh_container(self):
+        """ Returns the PyLXD Container instance associated with the considered container.
+
+        The state of the returned container is fetched again if it expired.
+        """
+        return self._state_cache.get() or self._get_container()
+
+    @property
+    def _state_cache(self):
+        """ Returns the `ContainerStateCache` instance associated with the considered container. """
+        if not hasattr(self, '_container_state_cache'):
+            self._container_state_cache = ContainerStateCache(
+                self.client, self.lxd_name, ttl=self._state_cache_ttl)
+        return self._container_state_cache
 
     @property
     def _guest(self):
@@ -476,8 +926,19 @@ class Container:
 
         None is returned if no guest class can be determined for the considered container. """
         if not hasattr(self, '_container_guest'):
-            guest_class = next((k for k in Guest.guests if k.detect(self._container)), Guest)
-            self._container_guest = guest_class(self._container)
+            # The name of the guest is stored in the configuration of the container once it has
+            # been detected so that the files of the container are not read again by later runs.
+            guest_name = self._container.config.get('user.lxdock.guest')
+            guest_class = Guest.get_guest_class(guest_name) if guest_name else None
+            if guest_class is None:
+                guest_class = Guest.detect_guest_class(self._container)
+                if guest_class is not None:
+                    self._set_config('user.lxdock.guest', guest_class.name)
+            self._container_guest = (guest_class or Guest)(self._container)
+            self._container_guest.uses_package_cache = bool(self.options.get('package_cache'))
+            if self.options.get('package_metadata_max_age') is not None:
+                self._container_guest.package_metadata_max_age = \
+                    self.options['package_metadata_max_age']
         return self._container_guest
 
     @property
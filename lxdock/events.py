@@ -0,0 +1,121 @@
+"""
+    LXD events
+    ==========
+    This module provides tools allowing to react to the events emitted by LXD (eg. operations
+    affecting containers) instead of polling LXD at fixed intervals.
+"""
+
+import json
+import logging
+import threading
+import time
+
+from ws4py.client.threadedclient import WebSocketClient
+
+
+__all__ = ['EventListener', ]
+
+logger = logging.getLogger(__name__)
+
+
+class _EventsWebsocketClient(WebSocketClient):
+    """ Forwards the events received on the LXD events websocket to an `EventListener`. """
+
+    listener = None
+
+    def received_message(self, message):
+        try:
+            event = json.loads(message.data.decode('utf-8'))
+        except ValueError:  # pragma: no cover
+            return
+        self.listener.dispatch(event)
+
+
+class EventListener:
+    """ Listens to the events emitted by LXD and wakes up the threads waiting for a condition.
+
+    A single listener (and thus a single subscription to the LXD events stream) can be shared by
+    all the containers of a project. Threads waiting for a condition (eg. a container having an IP
+    address) re-evaluate it each time an event related to the considered container is received. The
+    condition is also re-evaluated periodically because some changes (such as a DHCP lease being
+    obtained by a container) are not reported by LXD events. If the events stream cannot be
+    subscribed to, waiting for a condition falls back to this periodic evaluation.
+    """
+
+    # The initial and maximum delays (in seconds) between two evaluations of a condition when no
+    # events are received.
+    initial_poll_interval = 0.1
+    max_poll_interval = 1
+
+    def __init__(self, client):
+        self.client = client
+        self._condition = threading.Condition()
+        self._events_count = {}
+        self._websocket = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        """ Subscribes to the LXD events stream. """
+        try:
+            websocket = self.client.events(websocket_client=_EventsWebsocketClient)
+            websocket.listener = self
+            websocket.connect()
+        except Exception as e:
+            logger.debug('Unable to subscribe to LXD events: {}'.format(e))
+            return
+        self._websocket = websocket
+
+    def stop(self):
+        """ Unsubscribes from the LXD events stream. """
+        if self._websocket is not None:
+            self._websocket.close()
+            self._websocket = None
+
+    def dispatch(self, event):
+        """ Wakes up the threads waiting for a condition related to the containers of the event. """
+        with self._condition:
+            for name in self._get_container_names(event):
+                self._events_count[name] = self._events_count.get(name, 0) + 1
+            self._condition.notify_all()
+
+    def wait_for(self, predicate, container_name, timeout):
+        """ Waits until `predicate` returns a truthy value and returns this value.
+
+        `predicate` is evaluated each time an event related to the considered container is received
+        and periodically. The last value returned by `predicate` is returned if the condition is
+        still not met after `timeout` seconds.
+        """
+        deadline = time.monotonic() + timeout
+        poll_interval = self.initial_poll_interval
+        while True:
+            # The number of events is retrieved before evaluating the predicate in order to not miss
+            # events received during this evaluation.
+            events_count = self._events_count.get(container_name, 0)
+            result = predicate()
+            remaining = deadline - time.monotonic()
+            if result or remaining <= 0:
+                return result
+            with self._condition:
+                received = self._condition.wait_for(
+                    lambda: self._events_count.get(container_name, 0) != events_count,
+                    min(remaining, poll_interval))
+            poll_interval = self.initial_poll_interval if received \
+                else min(poll_interval * 2, self.max_poll_interval)
+
+    def _get_container_names(self, event):
+        """ Returns the names of the containers an event is related to. """
+        metadata = event.get('metadata') or {}
+        urls = list((metadata.get('resources') or {}).get('containers', []))
+        if metadata.get('source'):
+            urls.append(metadata['source'])
+        names = {url.rstrip('/').split('/')[-1] for url in urls if '/containers/' in url}
+        context_container = (metadata.get('context') or {}).get('container')
+        if context_container:
+            names.add(context_container)
+        return names
@@ -0,0 +1,175 @@
+"""
+    Guest agent
+    ===========
+    This module provides the `GuestAgent` class, which allows to perform many operations on a guest
+    (running commands, reading or writing files) through a single long-lived exec operation instead
+    of using a separate LXD API call for each operation.
+"""
+
+import base64
+import itertools
+import json
+import logging
+import pkgutil
+import shlex
+
+from ..logging import bind_current_container_name
+from ..utils.lxd import ExecChannel
+from .agent_script import PROTOCOL_VERSION
+
+
+__all__ = ['AgentError', 'GuestAgent', ]
+
+logger = logging.getLogger(__name__)
+
+
+class AgentError(Exception):
+    """ The guest agent cannot be started or stopped responding.
+
+    `request_sent` is True if the request that failed may have been received by the agent (and may
+    therefore have been performed, even partly).
+    """
+
+    def __init__(self, msg, request_sent=False):
+        super().__init__(msg)
+        self.request_sent = request_sent
+
+
+class GuestAgent:
+    """ Communicates with the agent script running in a guest.
+
+    The agent script (see the `agent_script` module) is installed in the guest by `install` and run
+    by `start`. Requests and responses are JSON objects exchanged as lines on the standard streams
+    of the agent, which means that each operation costs a message on an already opened channel
+    rather than an LXD API call. The output of the commands run by the agent is streamed back as
+    output frames while the commands are running: it is never buffered as a whole.
+    """
+
+    # The path of the agent script in the guest.
+    script_path = '/.lxdock.d/agent.py'
+
+    # The number of seconds to wait for the agent to be ready.
+    start_timeout = 10
+
+    def __init__(self, lxd_container):
+        self.lxd_container = lxd_container
+        self._channel = None
+        self._ids = itertools.count(1)
+
+    @classmethod
+    def get_script(cls):
+        """ Returns the source code (bytes) of the agent script. """
+        return pkgutil.get_data(__package__, 'agent_script.py')
+
+    @property
+    def is_running(self):
+        return self._channel is not None
+
+    def install(self):
+        """ Pushes the agent script into the guest; its parent directory must exist. """
+        logger.debug('Installing the guest agent in {}'.format(self.script_path))
+        self.lxd_container.files.put(self.script_path, self.get_script())
+
+    def start(self, upgrade=True):
+        """ Starts the agent in the guest and waits for it to be ready.
+
+        `AgentError` is raised if the agent cannot be started (eg. if it is not installed or if no
+        Python interpreter is available in the guest). The agent is installed again if it uses
+        another protocol version than the one of the current agent script, unless `upgrade` is
+        False.
+        """
+        script_path = shlex.quote(self.script_path)
+        command = (
+            '[ -f {path} ] || exit 127; '
+            'if command -v python3 > /dev/null; then exec python3 -u {path}; fi; '
+            'exec python -u {path}').format(path=script_path)
+        channel = ExecChannel(self.lxd_container, ['sh', '-c', command],
+                              stderr_handler=bind_current_container_name(self._log_stderr))
+        message = self._decode(channel.readline(timeout=self.start_timeout))
+        if not message.get('ready'):
+            channel.close()
+            raise AgentError('The guest agent could not be started')
+        if message.get('version') != PROTOCOL_VERSION:
+            # The agent was installed by another version of LXDock: it is upgraded.
+            channel.close()
+            if not upgrade:
+                raise AgentError('The guest agent uses an unsupported protocol version')
+            self.install()
+            return self.start(upgrade=False)
+        logger.debug('Guest agent started (protocol version {})'.format(message.get('version')))
+        self._channel = channel
+
+    def stop(self):
+        """ Stops the agent (if it is running). """
+        if self._channel is not None:
+            channel, self._channel = self._channel, None
+            channel.close()
+
+    def request(self, op, frame_handler=None, **kwargs):
+        """ Sends a request to the agent and returns its response (a dictionary).
+
+        The output frames sent by the agent before the response (if any) are passed to
+        `frame_handler`. `AgentError` is raised if the agent does not respond; the agent is then
+        considered stopped.
+        """
+        if self._channel is None:
+            raise AgentError('The guest agent is not running')
+        request_id = next(self._ids)
+        kwargs.update({'id': request_id, 'op': op})
+        try:
+            self._channel.send((json.dumps(kwargs) + '\n').encode('utf-8'))
+            response = self._decode(self._channel.readline())
+            while 'stream' in response and response.get('id') == request_id:
+                if frame_handler is not None:
+                    frame_handler(response)
+                response = self._decode(self._channel.readline())
+        except Exception as e:
+            response = {}
+            logger.debug('Unable to communicate with the guest agent: {}'.format(e))
+        if response.get('id') != request_id:
+            self._channel = None
+            raise AgentError('The guest agent stopped responding', request_sent=True)
+        return response
+
+    def run(self, cmd_args, environment=None, stdout_handler=None, stderr_handler=None):
+        """ Runs a command in the guest and returns its exit code.
+
+        The output of the command is passed to `stdout_handler` and `stderr_handler` (as bytes)
+        while the command is running.
+        """
+        handlers = {'stdout': stdout_handler, 'stderr': stderr_handler}
+
+        def handle_frame(frame):
+            handler = handlers.get(frame['stream'])
+            if handler is not None:
+                handler(base64.b64decode(frame['data'].encode('ascii')))
+
+        response = self.request(
+            'run', frame_handler=handle_frame, args=cmd_args, env=environment or {})
+        if not response['ok']:
+            raise AgentError(response['error'], request_sent=True)
+        return response['exit_code']
+
+    def read_file(self, guest_path):
+        """ Returns the content (bytes) of a file of the guest; None if it cannot be read. """
+        response = self.request('read_file', path=str(guest_path))
+        return base64.b64decode(response['data'].encode('ascii')) if response['ok'] else None
+
+    def write_file(self, guest_path, data, mode=None):
+        """ Writes data (bytes or string) to a file of the guest. """
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        response = self.request(
+            'write_file', path=str(guest_path), data=base64.b64encode(data).decode('ascii'),
+            mode=mode)
+        if not response['ok']:
+            raise AgentError(response['error'])
+
+    def _decode(self, line):
+        try:
+            return json.loads(line.decode('utf-8'))
+        except (AttributeError, ValueError):
+            return {}
+
+    def _log_stderr(self, data):
+        logger.debug('Guest agent: {}'.format(data.decode('utf-8', 'replace').rstrip()))
@@ -0,0 +1,121 @@
+"""
+    LXDock guest agent
+    ==================
+    This script is pushed into the guests and is run by LXDock using a single long-lived exec
+    operation. It reads requests from its standard input and writes responses to its standard
+    output. Each request and each response is a JSON object written on a single line. The output of
+    the commands run by the agent is streamed as "output frames" (messages defining a `stream` key)
+    that are written before the response of the related request.
+
+    This script only uses the standard library and must be compatible with Python 2.7 and Python 3
+    because it is run by the Python interpreter of the guest. It must not import LXDock modules.
+"""
+
+import base64
+import json
+import os
+import subprocess
+import sys
+import threading
+
+
+PROTOCOL_VERSION = 2
+
+# The maximum number of bytes of output sent in a single output frame.
+OUTPUT_CHUNK_SIZE = 32 * 1024
+
+# Messages can be written by the threads streaming the output of commands.
+_write_lock = threading.Lock()
+
+
+def _decode(data):
+    return data.decode('utf-8', 'replace')
+
+
+def _write_output_frame(request_id, stream, data):
+    write_message({'id': request_id, 'stream': stream, 'data': _decode(base64.b64encode(data))})
+
+
+def _stream_output(request_id, stream, pipe):
+    """ Sends the output of a command as output frames as soon as it is produced. """
+    while True:
+        data = os.read(pipe.fileno(), OUTPUT_CHUNK_SIZE)
+        if not data:
+            break
+        _write_output_frame(request_id, stream, data)
+    pipe.close()
+
+
+def handle_ping(request):
+    return {}
+
+
+def handle_run(request):
+    env = os.environ.copy()
+    env.update(request.get('env') or {})
+    try:
+        process = subprocess.Popen(
+            request['args'], stdin=open(os.devnull, 'rb'), stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE, env=env)
+    except OSError as e:
+        # Behaves like a shell if the command cannot be executed.
+        _write_output_frame(request.get('id'), 'stderr', str(e).encode('utf-8'))
+        return {'exit_code': 127}
+    threads = [
+        threading.Thread(target=_stream_output, args=(request.get('id'), stream, pipe))
+        for stream, pipe in (('stdout', process.stdout), ('stderr', process.stderr))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {'exit_code': process.wait()}
+
+
+def handle_read_file(request):
+    with open(request['path'], 'rb') as f:
+        return {'data': _decode(base64.b64encode(f.read()))}
+
+
+def handle_write_file(request):
+    with open(request['path'], 'wb') as f:
+        f.write(base64.b64decode(request['data'].encode('ascii')))
+    if request.get('mode') is not None:
+        os.chmod(request['path'], request['mode'])
+    return {}
+
+
+HANDLERS = {
+    'ping': handle_ping,
+    'read_file': handle_read_file,
+    'run': handle_run,
+    'write_file': handle_write_file,
+}
+
+
+def write_message(message):
+    with _write_lock:
+        sys.stdout.write(json.dumps(message) + '\n')
+        sys.stdout.flush()
+
+
+def main():
+    write_message({'ready': True, 'version': PROTOCOL_VERSION})
+    while True:
+        line = sys.stdin.readline()
+        if not line:
+            # The standard input is closed: LXDock does not need the agent anymore.
+            break
+        request = {}
+        try:
+            request = json.loads(line)
+            response = HANDLERS[request['op']](request)
+            response['ok'] = True
+        except Exception as e:
+            request = request if isinstance(request, dict) else {}
+            response = {'ok': False, 'error': '{}: {}'.format(e.__class__.__name__, e)}
+        response['id'] = request.get('id')
+        write_message(response)
+
+
+if __name__ == '__main__':
+    main()
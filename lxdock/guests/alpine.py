@@ -6,6 +6,16 @@ class AlpineGuest(Guest):
 
     name = 'alpine'
 
+    package_metadata_refresh_command = ['apk', 'update', ]
+    package_cache_path = '/var/cache/apk'
+
     def install_packages(self, packages):
-        self.run(['apk', 'update'])
-        self.run(['apk', 'add'] + packages)
+        packages = self.get_missing_packages(packages)
+        if packages:
+            self.refresh_package_metadata()
+            # Note: apk only keeps the downloaded packages if a cache directory is configured.
+            options = ['--cache-dir', self.package_cache_path] if self.uses_package_cache else []
+            self._run_package_install(['apk', 'add'] + options + packages)
+
+    def installed_packages(self, packages):
+        return set(packages) & set(self._get_command_output_lines(['apk', 'info', '-e'] + packages))
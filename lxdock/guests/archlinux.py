@@ -6,5 +6,17 @@ class ArchLinuxGuest(Guest):
 
     name = 'arch'
 
+    # Note: the package databases are not refreshed separately. Arch Linux doesn't support partial
+    # upgrades, which is what installing packages after a "pacman -Sy" run performs.
+    package_cache_path = '/var/cache/pacman/pkg'
+
     def install_packages(self, packages):
-        self.run(['pacman', '-S', '--noconfirm'] + packages)
+        packages = self.get_missing_packages(packages)
+        if packages:
+            self._run_package_install(['pacman', '-S', '--needed', '--noconfirm'] + packages)
+
+    def installed_packages(self, packages):
+        # pacman outputs a "name version" line for each installed package.
+        return set(packages) & {
+            line.split()[0] for line in self._get_command_output_lines(['pacman', '-Q'] + packages)
+            if line.strip()}
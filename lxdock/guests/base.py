@@ -5,15 +5,27 @@
     supported by LXDock (eg. debian, ...).
 """
 
+import functools
+import hashlib
+import json
 import logging
 import re
-import tarfile
-import tempfile
-from pathlib import Path, PurePosixPath
+import shlex
+import uuid
+from pathlib import PurePosixPath
 
 from pylxd.exceptions import NotFound
 
+from ..exceptions import ContainerOperationFailed
+from ..logging import bind_current_container_name
+from ..utils.archive import DEFAULT_CHUNK_SIZE, get_tar_extract_command, iter_tar_chunks
+from ..utils.ignore import IgnoreRules
+from ..utils.lxd import ExecChannel, execute_streaming
+from ..utils.manifest import compare_manifests, get_directory_manifest
 from ..utils.metaclass import with_metaclass
+from ..utils.output import CommandOutput
+from ..utils.transfer import put_file
+from .agent import AgentError, GuestAgent
 
 
 __all__ = ['Guest', ]
@@ -25,6 +37,23 @@ class InvalidGuest(Exception):
     """ The `Guest` subclass is not valid. """
 
 
+def parse_os_release(content):
+    """ Parses the content (bytes or string) of an "/etc/os-release" file into a dictionary. """
+    if isinstance(content, bytes):
+        content = content.decode('utf-8', 'replace')
+    fields = {}
+    for line in content.splitlines():
+        key, sep, value = line.strip().partition('=')
+        if not sep or key.startswith('#'):
+            continue
+        try:
+            value = ''.join(shlex.split(value))
+        except ValueError:
+            value = value.strip('"\'')
+        fields[key.strip()] = value
+    return fields
+
+
 class _GuestBase(type):
     """ Metaclass for all LXD guests.
 
@@ -76,8 +105,39 @@ class Guest(with_metaclass(_GuestBase)):
     # The `name` of a guest is a required attribute and should always be set on `Guest` subclasses.
     name = None
 
+    # The values of the `ID` (or `ID_LIKE`) field of "/etc/os-release" that identify the guest, in
+    # addition to its name (eg. the IDs of derivative distributions).
+    os_release_ids = ()
+
+    # The number of lines of the output of the commands run in the guest that are kept in memory.
+    output_max_lines = 100
+
+    # The number of lines of the error output of a failed command that are reported to the user.
+    error_output_max_lines = 20
+
+    # The command refreshing the metadata of the package manager of the guest (eg. its package
+    # indexes) if applicable. `Guest` subclasses should install packages without refreshing this
+    # metadata implicitly and call the `refresh_package_metadata` method instead.
+    package_metadata_refresh_command = None
+
+    # The number of seconds during which the metadata of the package manager is considered fresh
+    # once it has been refreshed.
+    package_metadata_max_age = 3600
+
+    # The directory where the package manager of the guest stores the packages it downloads. This
+    # directory can be mounted from a host directory shared by multiple containers, in which case
+    # `uses_package_cache` is set to True and the downloaded packages should be kept.
+    package_cache_path = None
+    uses_package_cache = False
+
     def __init__(self, lxd_container):
         self.lxd_container = lxd_container
+        self.last_stdout = self.last_stderr = ''
+        # A binary file object to which the whole output of the commands run in the guest is
+        # written, if any (eg. a provisioning log file).
+        self.output_log = None
+        # The `GuestAgent` instance used to perform operations on the guest, if it is running.
+        self.agent = None
 
     @classmethod
     def detect(cls, lxd_container):
@@ -104,20 +164,89 @@ class Guest(with_metaclass(_GuestBase)):
                 break
         return found
 
+    @classmethod
+    def detect_guest_class(cls, lxd_container):
+        """ Returns the `Guest` subclass corresponding to the OS of a container (None if unknown).
+
+        The "/etc/os-release" file of the container is read and parsed once: its `ID` field and
+        then the fields of its `ID_LIKE` field are looked up in a table associating the names and
+        the `os_release_ids` of the `Guest` subclasses with these subclasses. The `detect`
+        classmethod of each `Guest` subclass is only used if this file doesn't allow to determine
+        the OS of the container.
+        """
+        try:
+            os_release = parse_os_release(lxd_container.files.get('/etc/os-release'))
+        except NotFound:
+            os_release = {}
+        guest_classes = cls.get_guest_classes_by_os_release_id()
+        for os_id in [os_release.get('ID', ''), ] + os_release.get('ID_LIKE', '').split():
+            if os_id.lower() in guest_classes:
+                return guest_classes[os_id.lower()]
+        return next((k for k in cls.guests if k.detect(lxd_container)), None)
+
+    @classmethod
+    def get_guest_class(cls, name):
+        """ Returns the `Guest` subclass whose name is `name` (None if no such subclass exists). """
+        return next((k for k in cls.guests if k.name == name), None)
+
+    @classmethod
+    def get_guest_classes_by_os_release_id(cls):
+        """ Returns a dictionary associating "/etc/os-release" IDs with `Guest` subclasses. """
+        guest_classes = {}
+        # The names of the guests take precedence over their additional IDs.
+        for guest_class in cls.guests:
+            guest_classes.setdefault(guest_class.name.lower(), guest_class)
+        for guest_class in cls.guests:
+            for os_id in guest_class.os_release_ids:
+                guest_classes.setdefault(os_id, guest_class)
+        return guest_classes
+
     def add_ssh_pubkey_to_root_authorized_keys(self, pubkey):
         """ Add a given SSH public key to the root user's authorized keys. """
         logger.info("Adding {} to machine's authorized keys".format(pubkey))
         self.run(['mkdir', '-p', '/root/.ssh'])
-        self.lxd_container.files.put('/root/.ssh/authorized_keys', pubkey)
+        self.write_file('/root/.ssh/authorized_keys', pubkey)
 
     def create_user(self, username, home=None, password=None):
         """ Adds the passed user to the container system. """
+        self.run(self.get_create_user_command(username, home=home, password=password))
+
+    def ensure_users(self, users):
+        """ Creates the users that don't exist yet in the container system.
+
+        `users` should be a list of dictionaries defining the `name` of each user and optionally
+        its `home` and its `password`. The "/etc/passwd" file is read once in order to determine
+        the missing users, which are then created using a single batch of commands. A dictionary
+        associating the names of the created users with the exit codes of the related commands is
+        returned.
+        """
+        passwd = self.read_file('/etc/passwd') or b''
+        if isinstance(passwd, bytes):
+            passwd = passwd.decode('utf-8', 'replace')
+        existing_users = {line.split(':', 1)[0] for line in passwd.splitlines()}
+        missing_users = [u for u in users if u['name'] not in existing_users]
+        if not missing_users:
+            return {}
+
+        with self.batch() as batch:
+            for user in missing_users:
+                batch.run(self.get_create_user_command(
+                    user['name'], home=user.get('home'), password=user.get('password')))
+        results = {u['name']: code for u, code in zip(missing_users, batch.exit_codes)}
+        for name, exit_code in sorted(results.items()):
+            if exit_code != 0:
+                logger.warning(
+                    'Unable to create the user {} (exit code: {})'.format(name, exit_code))
+        return results
+
+    def get_create_user_command(self, username, home=None, password=None):
+        """ Returns the command (a list of arguments) adding the passed user to the system. """
         options = ['--create-home', ]
         if home is not None:
             options += ['--home-dir', home, ]
         if password is not None:
             options += ['-p', password, ]
-        self.run(['useradd', ] + options + [username, ])
+        return ['useradd', ] + options + [username, ]
 
     ########################################################
     # METHODS THAT SHOULD BE OVERRIDEN IN GUEST SUBCLASSES #
@@ -132,53 +261,403 @@ class Guest(with_metaclass(_GuestBase)):
         # This method should be overriden in `Guest` subclasses.
         self._warn_guest_not_supported('for installing packages')
 
+    def configure_package_proxy(self, proxy_url):
+        """ Configures the package manager of the guest to use the considered HTTP proxy.
+
+        Most package managers use the proxy defined by the `http_proxy` environment variable, which
+        LXDock defines for the commands run in the containers. `Guest` subclasses can write the
+        proxy in the configuration of their package manager so that it is also used outside of
+        LXDock.
+        """
+
+    def remove_package_proxy(self):
+        """ Stops the package manager of the guest from using the HTTP proxy (if applicable). """
+
+    def installed_packages(self, packages):
+        """ Returns the set of the considered packages that are already installed on the guest.
+
+        `Guest` subclasses should query the package database of the guest using a single command.
+        An empty set is returned by default, which means that all the packages are considered
+        missing.
+        """
+        return set()
+
     ##################
     # HELPER METHODS #
     ##################
 
-    def run(self, cmd_args):
-        """ Runs the specified command inside the current container. """
+    def get_error_message(self, msg, exit_code):
+        """ Returns an error message describing the failure of the last command run in the guest.
+
+        The exit code and the last lines of the error output of the command are appended to `msg`.
+        """
+        msg = '{} (exit code: {})'.format(msg, exit_code)
+        lines = self.last_stderr.splitlines()[-self.error_output_max_lines:]
+        if lines:
+            msg += ':\n' + '\n'.join('  ' + line for line in lines)
+        return msg
+
+    def get_missing_packages(self, packages):
+        """ Returns the list of the considered packages that are not installed on the guest yet. """
+        installed = self.installed_packages(packages)
+        missing = [p for p in packages if p not in installed]
+        if installed:
+            logger.debug('Packages already installed: {}'.format(', '.join(sorted(installed))))
+        return missing
+
+    _guest_package_metadata_stamp_path = '/.lxdock.d/package_metadata.stamp'
+
+    def refresh_package_metadata(self, force=False):
+        """ Refreshes the metadata of the package manager unless it was refreshed recently.
+
+        The time of the last refresh is stored in a stamp file on the guest. The metadata is not
+        refreshed if this stamp is less than `package_metadata_max_age` seconds old (unless `force`
+        is True). The check, the refresh and the update of the stamp are performed using a single
+        command, whose exit code is returned.
+        """
+        if not self.package_metadata_refresh_command:
+            return 0
+        stamp_path = shlex.quote(self._guest_package_metadata_stamp_path)
+        script = [
+            'now=$(date +%s)',
+            'stamp=$(cat {} 2>/dev/null)'.format(stamp_path),
+            'case "$stamp" in ""|*[!0-9]*) stamp=0 ;; esac',
+            'age=$((now - stamp))',
+            'if [ "$age" -ge 0 ] && [ "$age" -lt {} ]; then'.format(
+                0 if force else int(self.package_metadata_max_age)),
+            '  echo "Package metadata refreshed $age seconds ago, not refreshing"',
+            '  exit 0',
+            'fi',
+            '{} || exit $?'.format(
+                ' '.join(map(shlex.quote, self.package_metadata_refresh_command))),
+            'mkdir -p {}'.format(shlex.quote(str(
+                PurePosixPath(self._guest_package_metadata_stamp_path).parent))),
+            'echo "$now" > {}'.format(stamp_path),
+        ]
+        return self.run(['sh', '-c', '\n'.join(script)])
+
+    def run(self, cmd_args, log_level=logging.DEBUG):
+        """ Runs the specified command inside the current container.
+
+        The output of the command is logged line by line (using `log_level`) while the command runs.
+        Only the last lines of the output are kept in memory (see the `last_stdout` and
+        `last_stderr` attributes), which can be used to report errors (see `get_error_message`).
+        The whole output of the command is also written to `output_log` if it is set.
+        """
         logger.debug('Running {0}'.format(' '.join(cmd_args)))
-        exit_code, stdout, stderr = self.lxd_container.execute(cmd_args)
-        logger.debug(stdout)
-        logger.debug(stderr)
-        return exit_code
+        return self._execute(cmd_args, log_level=log_level)
+
+    def batch(self, stop_on_error=False):
+        """ Returns a `CommandBatch` instance allowing to run many steps using a single command.
 
-    def copy_file(self, host_path, guest_path):
+        The returned batch can be used as a context manager, in which case its steps are executed
+        when leaving the context (unless an exception was raised).
+        """
+        return CommandBatch(self, stop_on_error=stop_on_error)
+
+    def install_agent(self):
+        """ Installs the guest agent, which allows to perform many operations using a single exec.
+        """
+        self.run(['mkdir', '-p', str(PurePosixPath(GuestAgent.script_path).parent)])
+        GuestAgent(self.lxd_container).install()
+
+    def start_agent(self):
+        """ Starts the guest agent; returns False if it cannot be started.
+
+        Once the agent is started, the commands run in the guest and the files read or written by
+        the `read_file` and `write_file` methods go through the agent. The regular LXD API is used
+        if the agent cannot be started or if it stops responding.
+        """
+        if self.agent is not None:
+            return True
+        agent = GuestAgent(self.lxd_container)
+        try:
+            agent.start()
+        except AgentError as e:
+            logger.debug('Unable to start the guest agent: {}'.format(e))
+            return False
+        self.agent = agent
+        return True
+
+    def stop_agent(self):
+        """ Stops the guest agent (if it is running). """
+        if self.agent is not None:
+            agent, self.agent = self.agent, None
+            agent.stop()
+
+    def read_file(self, guest_path):
+        """ Returns the content (bytes) of a file of the guest; None if the file does not exist. """
+        if self.agent is not None:
+            try:
+                return self.agent.read_file(guest_path)
+            except AgentError as e:
+                self._handle_agent_error(e)
+        try:
+            return self.lxd_container.files.get(str(guest_path))
+        except NotFound:
+            return None
+
+    def write_file(self, guest_path, data):
+        """ Writes data (bytes or string) to a file of the guest; its parent directory must exist.
+        """
+        if self.agent is not None:
+            try:
+                return self.agent.write_file(guest_path, data)
+            except AgentError as e:
+                self._handle_agent_error(e)
+        self.lxd_container.files.put(str(guest_path), data)
+
+    def copy_file(self, host_path, guest_path, progress=None):
         """
         Copies a file from host_path (pathlib.Path) to guest_path (pathlib.PurePath).
         Ensures `mkdir -p` before calling LXD file put.
         """
         self.run(['mkdir', '-p', str(guest_path.parent)])
-        with host_path.open('rb') as f:
-            logger.debug('Copying host:{} to guest:{}'.format(host_path, guest_path))
-            self.lxd_container.files.put(str(guest_path), f.read())
+        self.put_file(host_path, guest_path, progress=progress)
 
-    _guest_temporary_tar_path = '/.lxdock.d/copied_directory.tar'
+    def put_file(self, host_path, guest_path, progress=None):
+        """
+        Uploads a file from host_path to guest_path; the parent directory must exist in the guest.
 
-    def copy_directory(self, host_path, guest_path):
+        The file is streamed to the container so that it is never entirely loaded in memory.
+        `progress` can be a callable that is called with the number of bytes sent so far and the
+        total size of the file.
+        """
+        logger.debug('Copying host:{} to guest:{}'.format(host_path, guest_path))
+        put_file(self.lxd_container, host_path, guest_path, progress=progress)
+
+    def copy_directory(self, host_path, guest_path, compression=None, exclude=None):
         """
         Copies a directory from host_path (pathlib.Path) to guest_path (pathlib.PurePath).
         This is natively supported since LXD 2.2 but we have to support 2.0+
         Refs: https://github.com/lxc/lxd/issues/2401
 
-        Uses tar to pack/unpack the directory.
+        Uses tar to pack/unpack the directory. The tarball is streamed in chunks to the standard
+        input of the tar command extracting it in the container, so that it is never entirely
+        stored on the host's disk, in memory or on the guest's disk. `compression` can be set to
+        'gz' or 'bz2' in order to compress the tarball. The files matching the patterns of the
+        .lxdockignore file of the directory or the `exclude` patterns are not copied.
         """
-        guest_tar_path = self._guest_temporary_tar_path
+        extract_command = get_tar_extract_command(guest_path, compression=compression)
         self.run(['mkdir', '-p', str(guest_path)])
-        with tempfile.NamedTemporaryFile() as f:
-            logger.debug("Creating tar file from {}".format(host_path))
-            tar = tarfile.open(f.name, 'w')
-            tar.add(str(host_path), arcname='.')
-            tar.close()
-            self.copy_file(Path(f.name), PurePosixPath(guest_tar_path))
-        self.run(['tar', '-xf', guest_tar_path, '-C', str(guest_path)])
-        self.run(['rm', '-f', str(guest_tar_path)])
+        logger.debug('Streaming tar file of host:{} to guest:{}'.format(host_path, guest_path))
+        exit_code = self._send_to_command(
+            extract_command,
+            iter_tar_chunks(
+                host_path, compression=compression,
+                ignore_rules=IgnoreRules.from_directory(host_path, exclude)))
+        if exit_code != 0:
+            logger.warning('Unable to copy host:{} to guest:{}: {}'.format(
+                host_path, guest_path, self.last_stderr))
+
+    _guest_sync_manifests_path = '/.lxdock.d/sync'
+
+    def sync_directory(self, host_path, guest_path, compression=None, exclude=None):
+        """
+        Synchronizes the content of guest_path (pathlib.PurePath) with host_path (pathlib.Path).
+
+        A manifest describing the synchronized files is stored on the guest. It is used to compute
+        the files that were added, changed or deleted on the host since the last synchronization, so
+        that only these files are transferred (in a single tarball streamed to tar, as done by
+        `copy_directory`) or deleted. The whole directory is copied if no manifest can be found. The
+        files matching the patterns of the .lxdockignore file of the directory or the `exclude`
+        patterns are not synchronized.
+        """
+        extract_command = get_tar_extract_command(guest_path, compression=compression)
+        manifest_path = str(PurePosixPath(self._guest_sync_manifests_path) / '{}.json'.format(
+            hashlib.sha1(str(guest_path).encode('utf-8')).hexdigest()))
+        old_manifest = self._get_sync_manifest(manifest_path, guest_path)
+        new_manifest = get_directory_manifest(
+            str(host_path), previous=old_manifest,
+            ignore_rules=IgnoreRules.from_directory(host_path, exclude))
+        changed, deleted = compare_manifests(old_manifest, new_manifest)
+
+        if changed or deleted:
+            logger.debug('Synchronizing host:{} to guest:{} ({} changed, {} deleted)'.format(
+                host_path, guest_path, len(changed), len(deleted)))
+            # The manifest is removed first: the next synchronization will copy the whole directory
+            # if something goes wrong.
+            exit_code = self.run(['sh', '-c', 'mkdir -p {} {} && rm -f {}'.format(
+                shlex.quote(str(guest_path)), shlex.quote(self._guest_sync_manifests_path),
+                shlex.quote(manifest_path))])
+            if exit_code == 0 and deleted:
+                # The paths are sent through the standard input of xargs, so that the number of
+                # deleted files is not limited by the maximum length of a command line.
+                paths = b''.join('{}\0'.format(path).encode('utf-8') for path in deleted)
+                exit_code = self._send_to_command(
+                    ['sh', '-c', 'cd "$1" && xargs -0 rm -rf --', 'sh', str(guest_path)],
+                    (paths[i:i + DEFAULT_CHUNK_SIZE]
+                     for i in range(0, len(paths), DEFAULT_CHUNK_SIZE)))
+            if exit_code == 0 and changed:
+                exit_code = self._send_to_command(
+                    extract_command,
+                    iter_tar_chunks(host_path, compression=compression, members=changed))
+            if exit_code != 0:
+                logger.warning(self.get_error_message(
+                    'Unable to synchronize host:{} to guest:{}'.format(host_path, guest_path),
+                    exit_code))
+                return
+        elif new_manifest == old_manifest:
+            logger.debug('guest:{} is up to date'.format(guest_path))
+            return
+
+        self.write_file(manifest_path, json.dumps(new_manifest))
 
     ##################################
     # PRIVATE METHODS AND PROPERTIES #
     ##################################
 
+    def _run_package_install(self, cmd_args):
+        """ Runs a command installing packages and reports its errors; returns its exit code. """
+        exit_code = self.run(cmd_args)
+        if exit_code != 0:
+            logger.warning(self.get_error_message('Unable to install packages', exit_code))
+        return exit_code
+
+    def _get_sync_manifest(self, manifest_path, guest_path):
+        """ Returns the manifest of the last synchronization of `guest_path` (or an empty one). """
+        content = self.read_file(manifest_path)
+        if content is None:
+            return {}
+        # The manifest cannot be trusted if the synchronized directory was removed.
+        if self.run(['test', '-d', str(guest_path)]) != 0:
+            return {}
+        try:
+            return json.loads(content.decode('utf-8'))
+        except ValueError:
+            return {}
+
+    def _execute(self, cmd_args, stdout_callback=None, log_level=logging.DEBUG):
+        """ Executes a command in the container and streams its output; returns its exit code. """
+        log_line = functools.partial(logger.log, log_level)
+        stdout = CommandOutput(
+            stdout_callback or log_line, max_lines=self.output_max_lines, tee=self.output_log)
+        stderr = CommandOutput(log_line, max_lines=self.output_max_lines, tee=self.output_log)
+        exit_code = None
+        try:
+            if self.agent is not None:
+                try:
+                    exit_code = self.agent.run(
+                        cmd_args, stdout_handler=stdout, stderr_handler=stderr)
+                except AgentError as e:
+                    self._handle_agent_error(e)
+                    if e.request_sent:
+                        # The command may have been run (even partly) by the agent: running it again
+                        # using the LXD API could perform non-idempotent operations twice.
+                        raise ContainerOperationFailed(
+                            'The guest agent failed while running "{}" ({}); the command may have '
+                            'been partly run'.format(' '.join(cmd_args), e)) from e
+            if exit_code is None:
+                # The output of the command is handled by the thread receiving it from LXD: the name
+                # of the container associated with the current thread is bound to the handlers so
+                # that the logged lines are prefixed with it.
+                exit_code = execute_streaming(
+                    self.lxd_container, cmd_args,
+                    stdout_handler=bind_current_container_name(stdout),
+                    stderr_handler=bind_current_container_name(stderr))
+        finally:
+            stdout.close()
+            stderr.close()
+            self.last_stdout, self.last_stderr = stdout.text, stderr.text
+        return exit_code
+
+    def _send_to_command(self, cmd_args, chunks):
+        """ Runs a command in the container and streams `chunks` (bytes) to its standard input.
+
+        The exit code of the command is returned. The last lines of its error output are kept in the
+        `last_stderr` attribute, as done by `run`.
+        """
+        stderr = CommandOutput(logger.debug, max_lines=self.output_max_lines)
+        channel = ExecChannel(
+            self.lxd_container, cmd_args, stderr_handler=bind_current_container_name(stderr))
+        try:
+            for chunk in chunks:
+                channel.send(chunk)
+        finally:
+            # Closing the standard input of the command signals the end of the data.
+            exit_code = channel.close()
+            stderr.close()
+            self.last_stdout, self.last_stderr = '', stderr.text
+        return exit_code
+
+    def _get_command_output_lines(self, cmd_args):
+        """ Runs a command and returns the lines of its standard output (all of them). """
+        lines = []
+        logger.debug('Running {0}'.format(' '.join(cmd_args)))
+        self._execute(cmd_args, stdout_callback=lines.append)
+        return lines
+
+    def _handle_agent_error(self, error):
+        """ Stops using the guest agent after an error; the regular LXD API is used instead. """
+        logger.warning('The guest agent failed ({}), falling back to the LXD API'.format(error))
+        self.stop_agent()
+
     def _warn_guest_not_supported(self, for_msg):  # pragma: no cover
         """ Warns the user that a specific operation cannot be performed. """
         logger.warn('Guest not supported {}, doing nothing...'.format(for_msg))
+
+
+class CommandBatch:
+    """ Collects commands and file writes in order to run them in a guest as a single script.
+
+    Each step of the batch is executed in the guest using a single exec operation, which saves the
+    round trips to LXD that running each command separately would require. The exit code of each
+    step is reported back in the `exit_codes` list once the batch is executed (None is used for the
+    steps that were not executed). If `stop_on_error` is True, the steps following a failing step
+    are not executed.
+    """
+
+    def __init__(self, guest, stop_on_error=False):
+        self.guest = guest
+        self.stop_on_error = stop_on_error
+        self.steps = []
+        self.exit_codes = []
+        self._token = '__lxdock_step_{}'.format(uuid.uuid4().hex)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.execute()
+
+    def run(self, cmd_args):
+        """ Adds a command to the batch; returns the index of the related step. """
+        self.steps.append(' '.join(map(shlex.quote, cmd_args)))
+        return len(self.steps) - 1
+
+    def write_file(self, guest_path, content):
+        """ Adds a step writing `content` (a string) to a file; returns the index of the step. """
+        self.steps.append("printf '%s' {} > {}".format(
+            shlex.quote(content), shlex.quote(str(guest_path))))
+        return len(self.steps) - 1
+
+    def execute(self):
+        """ Executes the steps of the batch and returns their exit codes. """
+        self.exit_codes = [None, ] * len(self.steps)
+        if not self.steps:
+            return self.exit_codes
+        logger.debug('Running batch:\n{}'.format('\n'.join(self.steps)))
+        self.guest._execute(['sh', '-c', self.script], stdout_callback=self._handle_stdout_line)
+        return self.exit_codes
+
+    @property
+    def script(self):
+        """ Returns the shell script executing the steps of the batch. """
+        lines = []
+        for i, step in enumerate(self.steps):
+            lines.append(step)
+            # The exit code of each step is reported on the standard output using a unique token.
+            lines.append('__lxdock_status=$?')
+            lines.append("printf '{} {} %d\\n' \"$__lxdock_status\"".format(self._token, i))
+            if self.stop_on_error:
+                lines.append('[ "$__lxdock_status" -eq 0 ] || exit "$__lxdock_status"')
+        return '\n'.join(lines)
+
+    def _handle_stdout_line(self, line):
+        output, token, status = line.partition(self._token)
+        if output:
+            logger.debug(output)
+        if token:
+            index, exit_code = status.split()
+            self.exit_codes[int(index)] = int(exit_code)
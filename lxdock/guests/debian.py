@@ -6,6 +6,26 @@ class DebianGuest(Guest):
 
     name = 'debian'
 
+    package_metadata_refresh_command = ['apt-get', 'update', ]
+    package_cache_path = '/var/cache/apt/archives'
+
     def install_packages(self, packages):
-        self.run(['apt-get', 'update'])
-        self.run(['apt-get', 'install', '-y'] + packages)
+        packages = self.get_missing_packages(packages)
+        if packages:
+            self.refresh_package_metadata()
+            self._run_package_install(['apt-get', 'install', '-y'] + packages)
+
+    def configure_package_proxy(self, proxy_url):
+        self.write_file(
+            '/etc/apt/apt.conf.d/01lxdock-proxy', 'Acquire::http::Proxy "{}";\n'.format(proxy_url))
+
+    def remove_package_proxy(self):
+        self.run(['rm', '-f', '/etc/apt/apt.conf.d/01lxdock-proxy', ])
+
+    def installed_packages(self, packages):
+        # dpkg-query outputs a "name status" line for each known package (eg. "python install ok
+        # installed"); the packages that are not known are reported on the standard error.
+        lines = self._get_command_output_lines(
+            ['dpkg-query', '--show', '--showformat', '${Package} ${Status}\\n'] + packages)
+        return set(packages) & {
+            line.split()[0] for line in lines if line.strip().endswith(' installed')}
@@ -6,11 +6,21 @@ class GentooGuest(Guest):
 
     name = 'gentoo'
 
+    # Note: the source archives downloaded by Portage are stored in DISTDIR.
+    package_cache_path = '/usr/portage/distfiles'
+
     def install_packages(self, packages):
-        # Ensure that we have this Gentoo helper toolkit.
-        # It contains "equery" that can check which package has been installed.
-        self.run(['emerge', 'app-portage/gentoolkit'])
-        for p in packages:
-            retcode = self.run(['equery', 'list', p])
-            if retcode != 0:  # Not installed yet
-                self.run(['emerge', p])
+        packages = self.get_missing_packages(packages)
+        if packages:
+            self._run_package_install(['emerge', '--noreplace'] + packages)
+
+    def installed_packages(self, packages):
+        # The packages installed by Portage are recorded in /var/db/pkg/<category>/<name>-<version>
+        # directories, so we don't need any specific tool to check which packages are installed.
+        script = (
+            'for atom in "$@"; do '
+            'case "$atom" in */*) pattern="$atom" ;; *) pattern="*/$atom" ;; esac; '
+            'for d in /var/db/pkg/$pattern-[0-9]*; do [ -d "$d" ] && echo "$atom" && break; done; '
+            'done')
+        return set(packages) & set(
+            self._get_command_output_lines(['sh', '-c', script, 'sh', ] + packages))
@@ -5,6 +5,24 @@ class OpenSUSEGuest(Guest):
     """ This guest can provision openSUSE containers. """
 
     name = 'opensuse'
+    os_release_ids = ('opensuse-leap', 'opensuse-tumbleweed', 'sles', 'suse', )
+
+    package_metadata_refresh_command = ['zypper', '--non-interactive', 'refresh', ]
+    package_cache_path = '/var/cache/zypp/packages'
 
     def install_packages(self, packages):
-        self.run(['zypper', '--non-interactive', 'install', ] + packages)
+        packages = self.get_missing_packages(packages)
+        if packages:
+            self.refresh_package_metadata()
+            if self.uses_package_cache:
+                # zypper only keeps the downloaded packages of the repositories configured to do so.
+                self.run(['zypper', '--non-interactive', 'modifyrepo', '--keep-packages', '--all'])
+            # The metadata is refreshed explicitly: we don't want zypper to refresh it implicitly.
+            self._run_package_install(
+                ['zypper', '--non-interactive', '--no-refresh', 'install', ] + packages)
+
+    def installed_packages(self, packages):
+        # Note: rpm writes "package ... is not installed" on its standard output for the packages
+        # that are not installed.
+        return set(packages) & set(self._get_command_output_lines(
+            ['rpm', '-q', '--queryformat', '%{NAME}\\n'] + packages))
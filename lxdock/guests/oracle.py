@@ -6,5 +6,30 @@ class OracleLinuxGuest(Guest):
 
     name = 'ol'
 
+    package_metadata_refresh_command = ['yum', '-y', 'makecache', ]
+    package_cache_path = '/var/cache/yum'
+
     def install_packages(self, packages):
-        self.run(['yum', '-y', 'install'] + packages)
+        packages = self.get_missing_packages(packages)
+        if packages:
+            self.refresh_package_metadata()
+            # The metadata is refreshed explicitly: we don't want yum to refresh it implicitly.
+            options = ['--setopt=metadata_expire=never', ]
+            if self.uses_package_cache:
+                options.append('--setopt=keepcache=1')
+            self._run_package_install(['yum', '-y'] + options + ['install'] + packages)
+
+    def configure_package_proxy(self, proxy_url):
+        # The proxy is defined in the [main] section, replacing the previous proxy (if any).
+        self.run([
+            'sed', '-i', '-e', '/^proxy=/d', '-e', '/^\\[main\\]/a proxy={}'.format(proxy_url),
+            '/etc/yum.conf', ])
+
+    def remove_package_proxy(self):
+        self.run(['sed', '-i', '-e', '/^proxy=/d', '/etc/yum.conf', ])
+
+    def installed_packages(self, packages):
+        # Note: rpm writes "package ... is not installed" on its standard output for the packages
+        # that are not installed.
+        return set(packages) & set(self._get_command_output_lines(
+            ['rpm', '-q', '--queryformat', '%{NAME}\\n'] + packages))
@@ -8,10 +8,12 @@
 import logging
 import os
 import platform
+import pwd
 import shlex
 import subprocess
 from pathlib import Path
 
+from ..utils.acl import AclNotSupported, give_users_access_to_tree
 from ..utils.lxd import get_lxd_dir
 from ..utils.metaclass import with_metaclass
 
@@ -92,6 +94,32 @@ class Host(with_metaclass(_HostBase)):
         except FileNotFoundError:  # pragma: no cover
             pass
 
+    def give_access_to_share(self, source, mapped_userpaths=None):
+        """ Give read/write access to `source` for the current user and for mapped users.
+
+        `mapped_userpaths` can be a list of paths that are relative to the LXD base directory (None
+        stands for the root of the container); the lxd user and the mapped users owning these paths
+        are given access to `source`. All the required ACL entries are set natively in a single pass
+        over the tree of `source`; `setfacl` is used if this is not possible.
+        """
+        mapped_userpaths = mapped_userpaths or []
+        access_uids = [self._get_mapped_uid(userpath) for userpath in mapped_userpaths]
+        if mapped_userpaths:
+            try:
+                access_uids.append(pwd.getpwnam('lxd').pw_uid)
+            except KeyError:  # pragma: no cover
+                pass
+        try:
+            give_users_access_to_tree(
+                source, access_uids=access_uids, default_uids=[os.getuid(), ])
+        except AclNotSupported:
+            logger.debug('POSIX ACL cannot be set natively on {}, using setfacl'.format(source))
+            self.give_current_user_access_to_share(source)
+            for userpath in mapped_userpaths:
+                self.give_mapped_user_access_to_share(source, userpath=userpath)
+        except OSError as e:
+            logger.warning('Unable to set ACL on {}: {}'.format(source, e))
+
     def give_current_user_access_to_share(self, source):
         """ Give read/write access to `source` for the current user. """
         self.run(['setfacl', '-Rdm',  'u:{}:rwX'.format(os.getuid()), source])
@@ -101,6 +129,19 @@ class Host(with_metaclass(_HostBase)):
 
         `userpath` is a path that is relative to the LXD base directory (where LXD store contaners).
         """
+        host_userpath_uid = self._get_mapped_uid(userpath)
+        self.run([
+            'setfacl', '-Rm',
+            'user:lxd:rwx,default:user:lxd:rwx,'
+            'user:{0}:rwx,default:user:{0}:rwx'.format(host_userpath_uid), source,
+        ])
+
+    ##################
+    # HELPER METHODS #
+    ##################
+
+    def _get_mapped_uid(self, userpath=None):
+        """ Returns the UID on the host-side of the user owning `userpath` in the container. """
         # LXD uses user namespaces when running safe containers. This means that it maps a set of
         # uids and gids on the host to a set of uids and gids in the container.
         # When considering unprivileged containers we want to ensure that the "root user" (or any
@@ -113,19 +154,13 @@ class Host(with_metaclass(_HostBase)):
         container_path_parts += userpath.split('/') if userpath else []
         container_path = os.path.join(*container_path_parts)
         container_path_stats = os.stat(container_path)
-        host_userpath_uid = container_path_stats.st_uid
-        self.run([
-            'setfacl', '-Rm',
-            'user:lxd:rwx,default:user:lxd:rwx,'
-            'user:{0}:rwx,default:user:{0}:rwx'.format(host_userpath_uid), source,
-        ])
-
-    ##################
-    # HELPER METHODS #
-    ##################
+        return container_path_stats.st_uid
 
     def run(self, cmd_args):
-        """ Runs the specified command on the host. """
+        """ Runs the specified command on the host and returns its exit code.
+
+        The output of the command is not captured: it is directly written to the terminal.
+        """
         cmd = ' '.join(map(shlex.quote, cmd_args))
         logger.debug('Running {0} on the host'.format(cmd))
-        subprocess.Popen(cmd, shell=True).wait()
+        return subprocess.Popen(cmd, shell=True).wait()
@@ -1,5 +1,7 @@
 import logging
 import sys
+import threading
+from functools import wraps
 
 from colorlog import ColoredFormatter
 
@@ -13,6 +15,12 @@ LOG_COLORS = {
 }
 
 
+# Holds the name of the container that is handled by the current thread (if any). This is used to
+# prefix log messages with the right container name when multiple containers are processed
+# concurrently.
+_container_context = threading.local()
+
+
 class _AtMostWarningFilter(logging.Filter):
     def filter(self, record):
         return record.levelno < logging.ERROR
@@ -34,6 +42,59 @@ def get_per_container_formatter(container_name):
         '%(log_color)s==> {name}: %(message)s'.format(name=container_name), log_colors=LOG_COLORS)
 
 
+class _PerThreadContainerFormatter(logging.Formatter):
+    """ Prefixes each message with the name of the container handled by the emitting thread. """
+
+    def __init__(self):
+        super().__init__()
+        self._default_formatter = get_default_formatter()
+        self._container_formatters = {}
+
+    def format(self, record):
+        container_name = getattr(_container_context, 'name', None)
+        if container_name is None:
+            return self._default_formatter.format(record)
+        formatter = self._container_formatters.get(container_name)
+        if formatter is None:
+            formatter = get_per_container_formatter(container_name)
+            self._container_formatters[container_name] = formatter
+        return formatter.format(record)
+
+
+def get_per_thread_container_formatter():
+    """ Returns a logging formatter which prefixes each message with the name of the container
+    associated with the thread emitting the message.
+    """
+    return _PerThreadContainerFormatter()
+
+
+def set_current_container_name(container_name):
+    """ Associates a container name with the current thread (None removes the association). """
+    _container_context.name = container_name
+
+
+def bind_current_container_name(func):
+    """ Returns a function calling `func` with the container name associated with the current
+    thread.
+
+    This allows the messages logged by callbacks that are run in other threads (eg. the threads
+    receiving the output of the commands run in containers) to be prefixed with the right container
+    name.
+    """
+    container_name = getattr(_container_context, 'name', None)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        previous_container_name = getattr(_container_context, 'name', None)
+        _container_context.name = container_name
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _container_context.name = previous_container_name
+
+    return wrapper
+
+
 logger = logging.getLogger(__name__)
 
 console_stdout_handler = logging.StreamHandler(sys.stdout)
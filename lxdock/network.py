@@ -2,11 +2,21 @@ import io
 import re
 import subprocess
 import tempfile
+import threading
+
+
+# This lock must be held while updating the host's /etc/hosts file. This prevents containers that
+# are processed concurrently from overwriting the bindings of each other.
+host_etchosts_lock = threading.Lock()
 
 
 def get_ip(container):
     """ Returns the IP adress of a specific container. """
-    state = container.state()
+    return get_ip_from_state(container.state())
+
+
+def get_ip_from_state(state):
+    """ Returns the IP adress of a container using its state (as returned by PyLXD). """
     if state.network is None:  # container is not running
         return ''
     eth0 = state.network['eth0']
@@ -18,6 +28,24 @@ def get_ip(container):
     return ''
 
 
+RE_INET_ADDRESS = re.compile(r'\binet (\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})/')
+
+
+def get_interface_ipv4(interface):
+    """ Returns the IPv4 address of a network interface of the host (eg. the LXD bridge).
+
+    An empty string is returned if the interface doesn't exist or has no IPv4 address.
+    """
+    try:
+        output = subprocess.check_output(
+            ['ip', '-4', '-o', 'addr', 'show', 'dev', interface],
+            stderr=subprocess.DEVNULL, universal_newlines=True)
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+    m = RE_INET_ADDRESS.search(output)
+    return m.group(1) if m else ''
+
+
 RE_ETCHOST_LINE = re.compile(r'^(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})\s+([\w\-_.]+)$')
 
 
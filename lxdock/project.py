@@ -1,24 +1,60 @@
 import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
 from . import constants
 from .container import Container
+from .events import EventListener
 from .exceptions import ProjectError
 from .logging import (console_stderr_handler, console_stdout_handler, get_default_formatter,
-                      get_per_container_formatter)
-from .network import ContainerEtcHosts, EtcHosts
+                      get_per_container_formatter, get_per_thread_container_formatter,
+                      set_current_container_name)
+from .network import ContainerEtcHosts, EtcHosts, host_etchosts_lock
+from .utils.lxd import get_lxdock_containers
 
 
 logger = logging.getLogger(__name__)
 
 
+class StageLimiter:
+    """ Limits the number of containers that can go through each lifecycle stage at the same time.
+
+    Each container goes through the stages on its own. This means that stages of different
+    containers can overlap (eg. a container can be provisioned while another one is created) while
+    the number of containers going through a specific stage is bounded.
+    """
+
+    def __init__(self, limits=None):
+        self._semaphores = {
+            name: threading.BoundedSemaphore(limit) for name, limit in (limits or {}).items()}
+
+    @contextmanager
+    def stage(self, name):
+        """ Waits until the considered stage can be entered and holds a slot for this stage. """
+        semaphore = self._semaphores.get(name)
+        if semaphore is None:
+            yield
+            return
+        with semaphore:
+            yield
+
+
 class Project:
     """ A project is used to orchestrate a collection of containers. """
 
-    def __init__(self, name, homedir, client, containers):
+    def __init__(self, name, homedir, client, containers, parallelism=1, stage_parallelism=None):
         self.name = name
         self.homedir = homedir
         self.client = client
         self.containers = containers
+        # The maximum number of containers that can be processed at the same time by the actions of
+        # the project (eg. `up`).
+        self.parallelism = parallelism
+        # The maximum number of containers that can go through each stage of the `up` action at the
+        # same time (eg. {'provision': 2}).
+        self.stage_parallelism = stage_parallelism or {}
 
     @classmethod
     def from_config(cls, project_name, client, config):
@@ -26,34 +62,50 @@ class Project:
         containers = []
         for container_config in config.containers:
             containers.append(Container(project_name, config.homedir, client, **container_config))
-        return cls(project_name, config.homedir, client, containers)
+        parallelism = config['parallelism'] if 'parallelism' in config else 1
+        stage_parallelism = config['stage_parallelism'] if 'stage_parallelism' in config else None
+        return cls(
+            project_name, config.homedir, client, containers, parallelism=parallelism,
+            stage_parallelism=stage_parallelism)
 
     #####################
     # CONTAINER ACTIONS #
     #####################
 
-    def destroy(self, container_names=None):
-        """ Destroys the containers of the project. """
+    def destroy(self, container_names=None, jobs=None, load_state=True):
+        """ Destroys the containers of the project.
+
+        `load_state` can be set to False if the states of the containers were already loaded (see
+        `load_containers_state`) in order to avoid fetching them again.
+        """
         containers = [self.get_container_by_name(name) for name in container_names] \
             if container_names else self.containers
-        for container in self._containers_generator(containers=containers):
-            container.destroy()
+        if load_state:
+            self.load_containers_state(containers)
+        self._unsetup_hostnames(self._get_running_containers(containers))
+        self._run_concurrently(
+            lambda c: c.destroy(unsetup_hostnames=False), containers, jobs=jobs, reverse=True)
         self._update_guest_etchosts()
 
-    def halt(self, container_names=None):
+    def halt(self, container_names=None, jobs=None):
         """ Stops containers of the project. """
         containers = [self.get_container_by_name(name) for name in container_names] \
             if container_names else self.containers
-        for container in self._containers_generator(containers=containers):
-            container.halt()
+        self.load_containers_state(containers)
+        self._unsetup_hostnames(self._get_running_containers(containers))
+        self._run_concurrently(
+            lambda c: c.halt(unsetup_hostnames=False), containers, jobs=jobs, reverse=True)
         self._update_guest_etchosts()
 
-    def provision(self, container_names=None):
-        """ Provisions the containers of the project. """
+    def provision(self, container_names=None, log_dir=None):
+        """ Provisions the containers of the project.
+
+        The output of the commands run in the containers is logged in `log_dir` if specified.
+        """
         containers = [self.get_container_by_name(name) for name in container_names] \
             if container_names else self.containers
-        for container in self._containers_generator(containers=containers):
-            container.provision()
+        # Containers are provisioned one at a time but after the containers they depend on.
+        self._run_concurrently(lambda c: c.provision(log_dir=log_dir), containers, jobs=1)
 
     def shell(self, container_name=None, **kwargs):
         """ Opens a new shell in our first container. """
@@ -70,25 +122,57 @@ class Project:
         """ Shows the statuses of the containers of the project. """
         containers = [self.get_container_by_name(name) for name in container_names] \
             if container_names else self.containers
+        self.load_containers_state(containers)
         max_name_length = max(len(c.name) for c in containers)
         logger.info('Current container states:')
         for container in containers:
             logger.info('{container_name} ({status})'.format(
                 container_name=container.name.ljust(max_name_length + 10), status=container.status))
 
-    def up(self, container_names=None, **kwargs):
-        """ Creates, starts and provisions the containers of the project. """
+    def up(self, container_names=None, jobs=None, **kwargs):
+        """ Creates, starts and provisions the containers of the project.
+
+        At most `jobs` containers (or `parallelism` containers if `jobs` is not specified) are
+        brought up at the same time. The containers the considered containers depend on are brought
+        up first: a container is brought up once they are provisioned, or once they are up if its
+        dependencies use the "up" condition. Each container goes through the stages of the `up`
+        action on its own and the number of containers going through each stage is bounded by
+        `stage_parallelism`.
+        """
         containers = [self.get_container_by_name(name) for name in container_names] \
             if container_names else self.containers
+        containers = self._with_dependencies(containers)
+        self.load_containers_state(containers)
         [logger.info('Bringing container "{}" up'.format(c.name)) for c in containers]
-        for container in self._containers_generator(containers=containers):
-            container.up(**kwargs)
+        limiter = StageLimiter(self.stage_parallelism)
+        # A single subscription to the LXD events stream is shared by all the containers.
+        with EventListener(self.client) as events:
+            def up(container, reach_milestone):
+                def stage(name):
+                    if name == 'provision':
+                        # The container is up once it reaches the provision stage: the containers
+                        # that only wait for it to be up can be brought up while it is provisioned.
+                        reach_milestone(container, constants.DEPENDENCY_CONDITION_UP)
+                    return limiter.stage(name)
+                container.up(stage=stage, events=events, **kwargs)
+
+            self._run_concurrently(up, containers, jobs=jobs, milestones=True)
         self._update_guest_etchosts()
 
     ##################################
     # UTILITY METHODS AND PROPERTIES #
     ##################################
 
+    def load_containers_state(self, containers=None):
+        """ Fetches the states of the considered containers using a single LXD API call.
+
+        The `Container` instances will use these states instead of fetching their own states from
+        LXD one by one.
+        """
+        lxd_containers = get_lxdock_containers(self.client)
+        for container in containers or self.containers:
+            container.set_lxd_container(lxd_containers.get(container.lxd_name))
+
     def get_container_by_name(self, name):
         """ Returns the `Container` instance associated with the given name. """
         containers_dict = {c.name: c for c in self.containers}
@@ -113,18 +197,208 @@ class Project:
         console_stdout_handler.setFormatter(get_default_formatter())
         console_stderr_handler.setFormatter(get_default_formatter())
 
+    def _get_dependencies(self, container):
+        """ Returns the containers the considered container depends on.
+
+        A list of (container, condition) tuples is returned, where `condition` is the milestone of
+        the dependency that the considered container waits for (see `DEPENDENCY_CONDITIONS`).
+        """
+        containers_dict = {c.name: c for c in self.containers}
+        dependencies = []
+        for dependency in container.options.get('depends_on', []):
+            if isinstance(dependency, str):
+                dependency = {'name': dependency, }
+            name = dependency['name']
+            if name not in containers_dict:
+                raise ProjectError(
+                    'The container "{container}" depends on "{name}" but no container with this '
+                    'name is defined for this project.'.format(container=container.name, name=name))
+            dependencies.append((
+                containers_dict[name],
+                dependency.get('condition', constants.DEPENDENCY_CONDITION_PROVISIONED)))
+        return dependencies
+
+    def _get_dependency_graph(self, containers, reverse=False):
+        """ Returns a dictionary associating each container with the containers it must wait for.
+
+        Each container is associated with a dictionary associating the containers it must wait for
+        with the conditions (milestones) it waits for. Only dependencies among the considered
+        containers are taken into account. If `reverse` is True, the containers must wait for the
+        containers that depend on them to be processed instead (eg. in order to stop an application
+        container before stopping its database container).
+        """
+        graph = {c: {} for c in containers}
+        for container in containers:
+            for dependency, condition in self._get_dependencies(container):
+                if dependency not in graph:
+                    continue
+                if reverse:
+                    graph[dependency][container] = constants.DEPENDENCY_CONDITION_PROVISIONED
+                else:
+                    graph[container][dependency] = condition
+        # Ensures that the dependency graph is acyclic.
+        self._sort_topologically(graph, containers)
+        return graph
+
+    def _sort_topologically(self, graph, containers):
+        """ Returns the containers ordered so that each one comes after the ones it must wait for.
+
+        The initial order of the containers is preserved as much as possible.
+        """
+        ordered, remaining = [], list(containers)
+        while remaining:
+            ready = [c for c in remaining if set(graph[c]).issubset(ordered)]
+            if not ready:
+                raise ProjectError(
+                    'The following containers have circular dependencies: {names}'.format(
+                        names=', '.join(c.name for c in remaining)))
+            ordered.extend(ready)
+            remaining = [c for c in remaining if c not in ready]
+        return ordered
+
+    def _with_dependencies(self, containers):
+        """ Returns the considered containers and all the containers they depend on. """
+        required, candidates = set(), list(containers)
+        while candidates:
+            container = candidates.pop()
+            if container not in required:
+                required.add(container)
+                candidates.extend(d for d, _ in self._get_dependencies(container))
+        return [c for c in self.containers if c in required]
+
+    def _run_concurrently(self, action, containers, jobs=None, reverse=False, milestones=False):
+        """ Calls `action` for each container using a bounded pool of worker threads.
+
+        Containers are scheduled according to their dependencies (or in the reverse order if
+        `reverse` is True): a container is processed as soon as all the containers it must wait for
+        have reached the milestones it waits for, which means that independent containers are
+        processed concurrently. A container reaches all the milestones once it has been processed.
+        If `milestones` is True, `action` is called with a second argument: a callable that can be
+        called with a container and a milestone (eg. "up") in order to signal that this milestone
+        has been reached before the container is completely processed.
+
+        The containers are processed one at a time if the number of jobs is 1. Otherwise the first
+        exception raised by `action` (if any) is re-raised once all the containers have been
+        processed; the containers that had to wait for a failed container are skipped.
+        """
+        graph = self._get_dependency_graph(containers, reverse=reverse)
+        jobs = jobs or self.parallelism
+        if jobs <= 1 or len(containers) <= 1:
+            ordered_containers = self._sort_topologically(graph, containers)
+            for container in self._containers_generator(containers=ordered_containers):
+                if milestones:
+                    action(container, lambda container, milestone: None)
+                else:
+                    action(container)
+            return
+
+        # The worker threads report the milestones reached by the containers and the end of their
+        # processing through a queue consumed by the thread scheduling the containers.
+        notifications = queue.Queue()
+
+        def reach_milestone(container, milestone):
+            notifications.put((container, milestone, None))
+
+        def run(container):
+            set_current_container_name(container.name)
+            error = None
+            try:
+                if milestones:
+                    action(container, reach_milestone)
+                else:
+                    action(container)
+            except Exception as e:
+                error = e
+            finally:
+                set_current_container_name(None)
+                notifications.put((container, None, error))
+
+        pending, running = list(containers), set()
+        reached = {c: set() for c in containers}
+        failed, errors = set(), []
+
+        def schedule_ready_containers(executor):
+            skipped = True
+            while skipped:
+                skipped = False
+                for container in list(pending):
+                    waiting_for = {
+                        d for d, condition in graph[container].items()
+                        if condition not in reached[d]}
+                    if waiting_for & failed:
+                        logger.error(
+                            'Skipping container "{name}" because a container it depends on '
+                            'failed.'.format(name=container.name))
+                        pending.remove(container)
+                        failed.add(container)
+                        skipped = True
+                    elif not waiting_for:
+                        pending.remove(container)
+                        running.add(container)
+                        executor.submit(run, container)
+
+        console_stdout_handler.setFormatter(get_per_thread_container_formatter())
+        console_stderr_handler.setFormatter(get_per_thread_container_formatter())
+        try:
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                schedule_ready_containers(executor)
+                while running:
+                    container, milestone, error = notifications.get()
+                    if milestone is not None:
+                        reached[container].add(milestone)
+                    elif error is not None:
+                        running.remove(container)
+                        errors.append(error)
+                        failed.add(container)
+                    else:
+                        running.remove(container)
+                        reached[container].update(constants.DEPENDENCY_CONDITIONS)
+                    schedule_ready_containers(executor)
+        finally:
+            console_stdout_handler.setFormatter(get_default_formatter())
+            console_stderr_handler.setFormatter(get_default_formatter())
+
+        if errors:
+            raise errors[0]
+
+    def _get_running_containers(self, containers):
+        """ Returns the considered containers that exist and are not stopped.
+
+        Only these containers are actually stopped when halting or destroying containers, so only
+        their hostnames have to be removed from the host's /etc/hosts file.
+        """
+        return [c for c in containers if c.exists and not c.is_stopped]
+
+    def _unsetup_hostnames(self, containers):
+        """ Removes the hostnames of the considered containers from the host's /etc/hosts file.
+
+        All the bindings are removed at once so that the /etc/hosts file is written only once,
+        whatever the number of containers.
+        """
+        hostnames = [h for c in containers for h in c.options.get('hostnames', [])]
+        if not hostnames:
+            return
+
+        with host_etchosts_lock:
+            etchosts = EtcHosts()
+            for hostname in hostnames:
+                logger.info('Unsetting {hostname}. sudo needed.'.format(hostname=hostname))
+                etchosts.ensure_binding_absent(hostname)
+            if etchosts.changed:
+                etchosts.save()
+
     def _update_guest_etchosts(self):
         """ Updates /etc/hosts on **all** running lxdock-managed containers.
 
         ... even those outside the current project. This way, containers can contact themselves
         using the same domain names the host uses.
         """
-        def should_update(c):
-            return c.config.get('user.lxdock.made') and c.status_code == constants.CONTAINER_RUNNING
         # At this point, our host's /etc/hosts is fully updated. No need to go fetch IP's and stuff
         # we can just re-use what we've already computed in every container up/halt ops before.
         etchosts = EtcHosts()
-        containers = (c for c in self.client.containers.all() if should_update(c))
+        containers = (
+            c for c in get_lxdock_containers(self.client).values()
+            if c.status_code == constants.CONTAINER_RUNNING)
         for container in containers:
             container_etchosts = ContainerEtcHosts(container)
             container_etchosts.lxdock_bindings = etchosts.lxdock_bindings
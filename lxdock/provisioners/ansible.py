@@ -41,23 +41,27 @@ class AnsibleProvisioner(Provisioner):
 
     def setup_guest_alpine(self):
         # On alpine guests we have to ensure that ssd is started!
-        self.guest.run(['rc-update', 'add', 'sshd'])
-        self.guest.run(['/etc/init.d/sshd', 'start'])
+        with self.guest.batch() as batch:
+            batch.run(['rc-update', 'add', 'sshd'])
+            batch.run(['/etc/init.d/sshd', 'start'])
 
     def setup_guest_arch(self):
         # On archlinux guests we have to ensure that sshd is started!
-        self.guest.run(['systemctl', 'enable', 'sshd'])
-        self.guest.run(['systemctl', 'start', 'sshd'])
+        with self.guest.batch() as batch:
+            batch.run(['systemctl', 'enable', 'sshd'])
+            batch.run(['systemctl', 'start', 'sshd'])
 
     def setup_guest_centos(self):
         # On centos guests we have to ensure that sshd is started!
-        self.guest.run(['systemctl', 'enable', 'sshd'])
-        self.guest.run(['systemctl', 'start', 'sshd'])
+        with self.guest.batch() as batch:
+            batch.run(['systemctl', 'enable', 'sshd'])
+            batch.run(['systemctl', 'start', 'sshd'])
 
     def setup_guest_fedora(self):
         # On fedora guests we have to ensure that sshd is started!
-        self.guest.run(['systemctl', 'enable', 'sshd'])
-        self.guest.run(['systemctl', 'start', 'sshd'])
+        with self.guest.batch() as batch:
+            batch.run(['systemctl', 'enable', 'sshd'])
+            batch.run(['systemctl', 'start', 'sshd'])
 
     def setup_guest_ol(self):
         # On oracle linux guests we have to ensure that sshd is started!
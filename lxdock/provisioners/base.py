@@ -104,14 +104,26 @@ class Provisioner(with_metaclass(_ProvisionerBase)):
         """ Setups the provisioner if applicable. """
         # Ensure that the packages required to properly use the considered provisioner are installed
         # on the guest.
-        required_packages = getattr(
-            self, 'guest_required_packages_{}'.format(self.guest.name), None)
-        if required_packages is not None:
+        required_packages = self.get_required_packages()
+        if required_packages:
             logger.info(
                 'Installing packages required for the {} provisioner '
                 'on the guest'.format(self.name))
             self.guest.install_packages(required_packages)
 
+        self.setup_guest()
+
+    def get_required_packages(self):
+        """ Returns the list of the packages required by the provisioner on the considered guest.
+
+        Callers that setup multiple provisioners at once can use this method in order to install
+        the packages required by all the provisioners using a single `install_packages` call, and
+        then call the `setup_guest` method of each provisioner.
+        """
+        return list(getattr(self, 'guest_required_packages_{}'.format(self.guest.name), None) or [])
+
+    def setup_guest(self):
+        """ Performs the setup operations that are specific to the considered guest (if any). """
         # We allow `Provisioner` subclasses to define their own "setup_guest_{guestname}" methods
         # if setup operations have to be done on some specific guest prior to any provisioning
         # actions.
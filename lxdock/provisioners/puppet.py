@@ -72,6 +72,7 @@ class PuppetProvisioner(Provisioner):
         'environment': str,
         'environment_path': IsDir(),
         'environment_variables': dict,
+        'exclude': [str],
         'options': str,
     }, finalize_options, validate_paths)
 
@@ -101,24 +102,29 @@ class PuppetProvisioner(Provisioner):
                 "also specify `binary_path` that contains the puppet executable "
                 "in LXDock file.")
         if retcode != 0:
-            raise ProvisionFailed(fail_msg)
+            raise ProvisionFailed(self.guest.get_error_message(fail_msg, retcode))
 
-        # Copy manifests dir
+        # Synchronize manifests dir (only the files that changed since the last provisioning are
+        # transferred). Files matching the `exclude` patterns or the patterns of .lxdockignore files
+        # are not transferred.
+        exclude = self.options.get('exclude')
         manifests_path = self.options.get('manifests_path')
         if manifests_path is not None:
-            self.guest.copy_directory(
-                Path(manifests_path), PurePosixPath(self._guest_manifests_path))
+            self.guest.sync_directory(
+                Path(manifests_path), PurePosixPath(self._guest_manifests_path), exclude=exclude)
 
-        # Copy module dir
+        # Synchronize module dir
         module_path = self.options.get('module_path')
         if module_path is not None:
-            self.guest.copy_directory(Path(module_path), PurePosixPath(self._guest_module_path))
+            self.guest.sync_directory(
+                Path(module_path), PurePosixPath(self._guest_module_path), exclude=exclude)
 
-        # Copy environment dir
+        # Synchronize environment dir
         environment_path = self.options.get('environment_path')
         if environment_path is not None:
-            self.guest.copy_directory(
-                Path(environment_path), PurePosixPath(self._guest_environment_path))
+            self.guest.sync_directory(
+                Path(environment_path), PurePosixPath(self._guest_environment_path),
+                exclude=exclude)
 
         # Copy hiera file
         hiera_file = self.options.get('hiera_config_path')
@@ -133,7 +139,10 @@ class PuppetProvisioner(Provisioner):
         else:
             logger.info("Running Puppet with {}...".format(self.options['manifest_file']))
 
-        self.guest.run(['sh', '-c', ' '.join(command)])
+        # Puppet exits with 2 if changes were applied (--detailed-exitcodes).
+        retcode = self.guest.run(['sh', '-c', ' '.join(command)], log_level=logging.INFO)
+        if retcode not in (0, 2):
+            logger.warning(self.guest.get_error_message('Puppet failed', retcode))
 
     ##################################
     # PRIVATE METHODS AND PROPERTIES #
@@ -1,3 +1,4 @@
+import logging
 import os
 
 from voluptuous import Any, Exclusive, IsFile
@@ -5,6 +6,9 @@ from voluptuous import Any, Exclusive, IsFile
 from .base import Provisioner
 
 
+logger = logging.getLogger(__name__)
+
+
 class ShellProvisioner(Provisioner):
     """ Allows to perform provisioning shell operations on the host/guest sides. """
 
@@ -22,22 +26,29 @@ class ShellProvisioner(Provisioner):
             # to copy the content of the script to a temporary file in the container, ensure
             # that the script is executable and then run the script.
             guest_scriptpath = os.path.join('/tmp/', os.path.basename(self.options['script']))
-            with open(self.homedir_expanded_path(self.options['script'])) as fd:
-                self.guest.lxd_container.files.put(guest_scriptpath, fd.read())
+            self.guest.put_file(
+                self.homedir_expanded_path(self.options['script']), guest_scriptpath)
             self.guest.run(['chmod', '+x', guest_scriptpath])
-            self.guest.run([guest_scriptpath, ])
+            self._run_on_guest([guest_scriptpath, ])
         elif 'script' in self.options and self._is_for_host:
             # Second case: the script is executed on the host side.
             self.host.run([self.homedir_expanded_path(self.options['script']), ])
-        elif 'inline' in self.options:
+        elif 'inline' in self.options and self._is_for_guest:
             # Final case: we run a command directly inside the container or outside.
-            host_or_guest = getattr(self, self._side)
-            host_or_guest.run(['sh', '-c', self.options['inline']])
+            self._run_on_guest(['sh', '-c', self.options['inline']])
+        elif 'inline' in self.options:
+            self.host.run(['sh', '-c', self.options['inline']])
 
     ##################################
     # PRIVATE METHODS AND PROPERTIES #
     ##################################
 
+    def _run_on_guest(self, cmd_args):
+        """ Runs a command in the guest (its output is logged at the INFO level). """
+        exit_code = self.guest.run(cmd_args, log_level=logging.INFO)
+        if exit_code != 0:
+            logger.warning(self.guest.get_error_message('The shell command failed', exit_code))
+
     @property
     def _is_for_guest(self):
         """ Returns True if this provisioner should run on the guest side. """
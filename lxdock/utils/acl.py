@@ -0,0 +1,273 @@
+"""
+    POSIX ACL utilities
+    ===================
+    This module provides a native engine allowing to give users access to the files of a directory
+    tree by setting POSIX ACL directly (using the related extended attributes) instead of spawning
+    `setfacl` processes.
+"""
+
+import errno
+import itertools
+import json
+import logging
+import os
+import stat
+import struct
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from .cache import get_cache_dir
+
+
+__all__ = ['AclNotSupported', 'give_users_access_to_tree', ]
+
+logger = logging.getLogger(__name__)
+
+# The names of the extended attributes holding the access ACL and the default ACL of files.
+ACL_XATTR_ACCESS = 'system.posix_acl_access'
+ACL_XATTR_DEFAULT = 'system.posix_acl_default'
+
+# The tags of ACL entries (see linux/posix_acl.h).
+ACL_USER_OBJ = 0x01
+ACL_USER = 0x02
+ACL_GROUP_OBJ = 0x04
+ACL_GROUP = 0x08
+ACL_MASK = 0x10
+ACL_OTHER = 0x20
+
+# The identifier used by entries that are not related to a specific user or group.
+ACL_UNDEFINED_ID = 0xffffffff
+
+_ACL_VERSION = 2
+_acl_header = struct.Struct('<I')
+_acl_entry = struct.Struct('<HHI')
+
+_stamps_lock = threading.Lock()
+
+
+class AclNotSupported(Exception):
+    """ POSIX ACL cannot be set natively on the considered platform or file system. """
+
+
+def decode_acl(data):
+    """ Decodes the value of a POSIX ACL extended attribute into a list of (tag, perm, id). """
+    version, = _acl_header.unpack_from(data)
+    if version != _ACL_VERSION:
+        raise ValueError('Unsupported POSIX ACL version: {}'.format(version))
+    return [
+        _acl_entry.unpack_from(data, offset)
+        for offset in range(_acl_header.size, len(data), _acl_entry.size)]
+
+
+def encode_acl(entries):
+    """ Encodes a list of (tag, perm, id) into the value of a POSIX ACL extended attribute. """
+    # Note: the kernel requires ACL entries to be sorted by tag and then by identifier.
+    entries = sorted(entries, key=lambda e: (e[0], e[2]))
+    return _acl_header.pack(_ACL_VERSION) + b''.join(_acl_entry.pack(*e) for e in entries)
+
+
+def acl_from_mode(mode):
+    """ Returns the ACL entries that are equivalent to the permission bits of a file mode. """
+    return [
+        (ACL_USER_OBJ, (mode >> 6) & 7, ACL_UNDEFINED_ID),
+        (ACL_GROUP_OBJ, (mode >> 3) & 7, ACL_UNDEFINED_ID),
+        (ACL_OTHER, mode & 7, ACL_UNDEFINED_ID),
+    ]
+
+
+def add_users_to_acl(entries, uids, perm=7):
+    """ Returns the ACL entries giving `perm` permissions to the specified users.
+
+    The mask entry is recomputed (as `setfacl` does) so that it grants the permissions of all the
+    entries of the group class.
+    """
+    acl = {(tag, id_): p for tag, p, id_ in entries}
+    for uid in uids:
+        acl[(ACL_USER, uid)] = perm
+    acl.pop((ACL_MASK, ACL_UNDEFINED_ID), None)
+    mask = 0
+    for (tag, id_), p in acl.items():
+        if tag in (ACL_USER, ACL_GROUP_OBJ, ACL_GROUP):
+            mask |= p
+    acl[(ACL_MASK, ACL_UNDEFINED_ID)] = mask
+    return sorted(((tag, p, id_) for (tag, id_), p in acl.items()), key=lambda e: (e[0], e[2]))
+
+
+def give_users_access_to_tree(path, access_uids=(), default_uids=(), jobs=None, force=False):
+    """ Gives read/write access to the files of the tree rooted at `path` to the specified users.
+
+    The users whose UIDs are listed in `access_uids` get access to all the files and directories
+    of the tree, including the files that will be created later on (through default ACL entries).
+    The users whose UIDs are listed in `default_uids` only get default ACL entries on directories.
+    All the entries are set in a single pass over the tree using a pool of `jobs` threads.
+
+    A stamp is persisted in the cache directory once a tree is processed: the tree is skipped the
+    next time unless `force` is True. False is returned if the tree is skipped. `AclNotSupported`
+    is raised if POSIX ACL cannot be set natively.
+    """
+    access_uids = sorted(set(access_uids))
+    default_uids = sorted(set(default_uids) | set(access_uids))
+    _check_acl_support(path)
+
+    stamp_key = json.dumps([os.path.realpath(path), access_uids, default_uids])
+    stamp = _get_tree_stamp(path)
+    if not force and _load_stamps().get(stamp_key) == stamp:
+        logger.debug('ACL already set on {}, skipping'.format(path))
+        return False
+
+    start = time.monotonic()
+    count = errors = 0
+    max_workers = jobs or min(32, (os.cpu_count() or 1) + 4)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = set()
+        batches = _walk_tree_in_batches(path)
+        while True:
+            # The number of batches submitted to the pool is bounded so that the memory used doesn't
+            # grow with the size of the tree: the tree is walked as the batches are processed.
+            for files in itertools.islice(batches, 2 * max_workers - len(pending)):
+                pending.add(executor.submit(_set_acl_on_files, files, access_uids, default_uids))
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                batch_count, batch_errors = future.result()
+                count += batch_count
+                errors += batch_errors
+    logger.debug('Processed ACL of {} files of {} in {:.2f}s'.format(
+        count, path, time.monotonic() - start))
+
+    if errors:
+        logger.warning('Unable to set ACL on {} files of {}'.format(errors, path))
+    else:
+        _save_stamp(stamp_key, stamp)
+    return True
+
+
+def _check_acl_support(path):
+    """ Raises `AclNotSupported` if POSIX ACL cannot be set natively on `path`. """
+    if not hasattr(os, 'getxattr'):
+        raise AclNotSupported()
+    try:
+        os.getxattr(path, ACL_XATTR_ACCESS)
+    except OSError as e:
+        if e.errno in (errno.ENOTSUP, errno.EOPNOTSUPP):
+            raise AclNotSupported()
+        elif e.errno != errno.ENODATA:
+            raise
+
+
+def _get_acl(path, name):
+    """ Returns the ACL entries stored in the `name` extended attribute (None if it is not set). """
+    try:
+        return decode_acl(os.getxattr(path, name, follow_symlinks=False))
+    except OSError as e:
+        if e.errno == errno.ENODATA:
+            return None
+        raise
+
+
+def _set_acl(path, name, entries, new_entries):
+    """ Stores the new ACL entries in the `name` extended attribute if they changed. """
+    if sorted(new_entries) == sorted(entries):
+        return
+    try:
+        os.setxattr(path, name, encode_acl(new_entries), follow_symlinks=False)
+    except OSError as e:
+        if e.errno in (errno.ENOTSUP, errno.EOPNOTSUPP):
+            raise AclNotSupported()
+        raise
+
+
+def _set_acl_on_files(files, access_uids, default_uids):
+    """ Sets the ACL of a batch of (path, is_dir) tuples.
+
+    A tuple containing the number of processed files and the number of errors is returned.
+    """
+    errors = 0
+    for path, is_dir in files:
+        try:
+            access_acl = _get_acl(path, ACL_XATTR_ACCESS)
+            if access_acl is None:
+                access_acl = acl_from_mode(os.stat(path, follow_symlinks=False).st_mode)
+            if access_uids:
+                _set_acl(
+                    path, ACL_XATTR_ACCESS, access_acl, add_users_to_acl(access_acl, access_uids))
+            if is_dir and default_uids:
+                default_acl = _get_acl(path, ACL_XATTR_DEFAULT)
+                # Like `setfacl`, we build a new default ACL from the base entries of the access ACL
+                # if the directory has no default ACL yet.
+                base_acl = default_acl if default_acl is not None else [
+                    e for e in access_acl if e[0] in (ACL_USER_OBJ, ACL_GROUP_OBJ, ACL_OTHER)]
+                _set_acl(
+                    path, ACL_XATTR_DEFAULT, default_acl or [],
+                    add_users_to_acl(base_acl, default_uids))
+        except OSError as e:
+            logger.debug('Unable to set ACL on {}: {}'.format(path, e))
+            errors += 1
+    return len(files), errors
+
+
+def _walk_tree_in_batches(path, batch_size=256):
+    """ Walks the tree rooted at `path` and yields batches of (path, is_dir) tuples.
+
+    Symbolic links are not followed and are not included in the batches.
+    """
+    batch = [(path, os.path.isdir(path))]
+    directories = [path] if batch[0][1] else []
+    while directories:
+        directory = directories.pop()
+        try:
+            names = os.listdir(directory)
+        except OSError as e:
+            logger.debug('Unable to list the files of {}: {}'.format(directory, e))
+            continue
+        for name in names:
+            # Note: os.scandir is not used because it is not available on Python 3.4.
+            entry_path = os.path.join(directory, name)
+            try:
+                mode = os.lstat(entry_path).st_mode
+            except OSError:
+                continue
+            if stat.S_ISLNK(mode):
+                continue
+            is_dir = stat.S_ISDIR(mode)
+            if is_dir:
+                directories.append(entry_path)
+            batch.append((entry_path, is_dir))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def _get_tree_stamp(path):
+    """ Returns a value identifying the tree rooted at `path`. """
+    stats = os.stat(path)
+    return '{}:{}'.format(stats.st_dev, stats.st_ino)
+
+
+def _get_stamps_path():
+    return os.path.join(get_cache_dir(), 'acl_stamps.json')
+
+
+def _load_stamps():
+    """ Returns the persisted stamps of the trees that were already processed. """
+    try:
+        with open(_get_stamps_path()) as fd:
+            return json.load(fd)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_stamp(key, stamp):
+    """ Persists the stamp of a tree that was processed. """
+    with _stamps_lock:
+        stamps = _load_stamps()
+        stamps[key] = stamp
+        stamps_path = _get_stamps_path()
+        tmp_path = '{}.{}.tmp'.format(stamps_path, os.getpid())
+        with open(tmp_path, 'w') as fd:
+            json.dump(stamps, fd)
+        os.replace(tmp_path, stamps_path)
@@ -0,0 +1,71 @@
+"""
+    Archive utilities
+    =================
+    This module provides tools allowing to build archives (eg. tarballs of directories) that are
+    streamed in chunks instead of being stored in temporary files or in memory.
+"""
+
+import os
+import tarfile
+import threading
+
+from .ignore import walk
+
+
+# The default size (in bytes) of the chunks of streamed archives.
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+# The options of the tar command extracting a tarball read on its standard input, for each supported
+# compression (tar cannot detect the compression of a tarball read on its standard input).
+TAR_EXTRACT_OPTIONS = {None: '-xf', 'gz': '-xzf', 'bz2': '-xjf', }
+
+
+def get_tar_extract_command(path, compression=None):
+    """ Returns the tar command extracting a tarball read on its standard input into `path`.
+
+    `compression` should be the compression used to build the tarball (see `iter_tar_chunks`).
+    `ValueError` is raised if this compression is not supported.
+    """
+    if compression not in TAR_EXTRACT_OPTIONS:
+        raise ValueError('Unsupported tarball compression: {}'.format(compression))
+    return ['tar', TAR_EXTRACT_OPTIONS[compression], '-', '-C', str(path)]
+
+
+def iter_tar_chunks(
+        path, compression=None, chunk_size=DEFAULT_CHUNK_SIZE, members=None, ignore_rules=None):
+    """ Generates the content of a tarball of the directory located at `path` in chunks.
+
+    The tarball is built by a separate thread and goes through a pipe, so that the memory used by
+    this generator doesn't depend on the size of the directory. `compression` can be set to 'gz' or
+    'bz2' in order to compress the tarball. `members` can be a list of paths (relative to `path`)
+    in order to only include these entries (and not their children) in the tarball. Entries matching
+    `ignore_rules` (an `IgnoreRules` instance) are excluded from the tarball. Any error that occurs
+    while building the tarball is raised once all the chunks have been generated.
+    """
+    read_fd, write_fd = os.pipe()
+    errors = []
+
+    def write_tar():
+        try:
+            with os.fdopen(write_fd, 'wb') as stream:
+                with tarfile.open(fileobj=stream, mode='w|{}'.format(compression or '')) as tar:
+                    tar_members = members
+                    if tar_members is None:
+                        # The tree is walked by ourselves in order to prune excluded directories.
+                        tar.add(str(path), arcname='.', recursive=False)
+                        tar_members = (relpath for relpath, _ in walk(path, ignore_rules))
+                    for member in tar_members:
+                        tar.add(
+                            os.path.join(str(path), member), arcname='./{}'.format(member),
+                            recursive=False)
+        except Exception as e:
+            errors.append(e)
+
+    writer = threading.Thread(target=write_tar, daemon=True)
+    writer.start()
+    with os.fdopen(read_fd, 'rb') as stream:
+        for chunk in iter(lambda: stream.read(chunk_size), b''):
+            yield chunk
+    writer.join()
+    if errors:
+        raise errors[0]
@@ -0,0 +1,61 @@
+"""
+    Cache utilities
+    ===============
+    This module provides tools allowing to store data that should persist between LXDock runs in the
+    cache directory of the current user.
+"""
+
+import fcntl
+import json
+import os
+from contextlib import contextmanager
+
+
+def get_cache_dir(*parts):
+    """ Returns the path (as a string) towards the LXDock's cache directory.
+
+    The cache directory is created if it doesn't exist. `parts` can be used to specify a
+    subdirectory of the cache directory.
+    """
+    base_dir = os.environ.get('XDG_CACHE_HOME', None) or os.path.expanduser('~/.cache')
+    path = os.path.join(base_dir, 'lxdock', *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+@contextmanager
+def lock_cache_dir(path):
+    """ Holds an exclusive lock on a cache directory while the operations of the context run.
+
+    The lock is a `flock` lock on a file stored in the directory: it can be used to serialize the
+    accesses to a directory that is shared by multiple threads or by multiple LXDock processes.
+    """
+    with open(os.path.join(path, '.lxdock.lock'), 'a') as fd:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+def get_cache_proxy_state_path():
+    """ Returns the path of the file describing the caching proxy that is currently running.
+
+    This file is written by the `lxdock cache-proxy` command while the proxy runs.
+    """
+    return os.path.join(get_cache_dir(), 'proxy.json')
+
+
+def get_cache_proxy_url():
+    """ Returns the URL of the caching proxy run by `lxdock cache-proxy`, or None if none runs. """
+    try:
+        with open(get_cache_proxy_state_path()) as fd:
+            state = json.load(fd)
+        # The state file of a proxy process that was killed can be left behind.
+        os.kill(state['pid'], 0)
+    except PermissionError:
+        # The proxy process exists but belongs to another user.
+        pass
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    return state['url']
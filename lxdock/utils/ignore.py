@@ -0,0 +1,118 @@
+"""
+    Ignore rules
+    ============
+    This module provides tools allowing to exclude some files from the directories that are copied
+    from the host to the guests, using patterns defined in .lxdockignore files or in LXDock files.
+"""
+
+import os
+import re
+import stat
+
+
+class IgnoreRules:
+    """ Represents a set of patterns used to exclude files from a directory.
+
+    Patterns follow the syntax of .gitignore files: blank lines and lines starting with # are
+    ignored, patterns starting with ! re-include previously excluded files, patterns ending with a
+    slash only match directories and patterns containing a slash (other than a trailing one) are
+    relative to the root of the directory while other patterns match files at any depth. `*`, `?`,
+    `[...]` and `**` wildcards can be used.
+    """
+
+    # The name of the files that can be used to define ignore patterns in a directory.
+    filename = '.lxdockignore'
+
+    def __init__(self, patterns=None):
+        self._rules = [
+            self._compile(pattern) for pattern in (patterns or [])
+            if pattern.strip() and not pattern.strip().startswith('#')]
+
+    def __bool__(self):
+        return bool(self._rules)
+
+    @classmethod
+    def from_directory(cls, path, patterns=None):
+        """ Returns the rules of the .lxdockignore file of a directory and the given `patterns`. """
+        file_patterns = []
+        try:
+            with open(os.path.join(str(path), cls.filename)) as f:
+                file_patterns = f.read().splitlines()
+        except FileNotFoundError:
+            pass
+        return cls(file_patterns + list(patterns or []))
+
+    def match(self, relpath, is_dir=False):
+        """ Returns True if the entry located at `relpath` (a relative POSIX path) is excluded. """
+        excluded = False
+        for regex, negate, dir_only in self._rules:
+            if dir_only and not is_dir:
+                continue
+            if regex.match(relpath):
+                excluded = not negate
+        return excluded
+
+    def _compile(self, pattern):
+        pattern = pattern.strip()
+        negate = pattern.startswith('!')
+        if negate:
+            pattern = pattern[1:]
+        dir_only = pattern.endswith('/')
+        pattern = pattern.rstrip('/')
+        anchored = '/' in pattern
+        pattern = pattern.lstrip('/')
+        regex = _translate(pattern)
+        if not anchored:
+            regex = '(?:.*/)?' + regex
+        return re.compile(regex + '$'), negate, dir_only
+
+
+def walk(path, ignore_rules=None, relpath=''):
+    """ Yields (relative path, stat result) tuples for the entries located under `path`.
+
+    The stat results are obtained using `os.lstat`: symbolic links are not followed. Entries
+    matching the ignore rules are not yielded and excluded directories are not walked through, so
+    that their content is never listed.
+    """
+    # Note: os.scandir is not used because it is not available on Python 3.4.
+    directory = os.path.join(str(path), relpath) if relpath else str(path)
+    for name in os.listdir(directory):
+        entry_relpath = '{}/{}'.format(relpath, name) if relpath else name
+        stats = os.lstat(os.path.join(directory, name))
+        is_dir = stat.S_ISDIR(stats.st_mode)
+        if ignore_rules and ignore_rules.match(entry_relpath, is_dir=is_dir):
+            continue
+        yield entry_relpath, stats
+        if is_dir:
+            yield from walk(path, ignore_rules, entry_relpath)
+
+
+def _translate(pattern):
+    """ Translates a glob pattern into a regular expression (`*` doesn't match slashes). """
+    i, n = 0, len(pattern)
+    regex = ''
+    while i < n:
+        if pattern.startswith('**/', i):
+            regex += '(?:.*/)?'
+            i += 3
+            continue
+        elif pattern.startswith('**', i):
+            regex += '.*'
+            i += 2
+            continue
+        c = pattern[i]
+        if c == '*':
+            regex += '[^/]*'
+        elif c == '?':
+            regex += '[^/]'
+        elif c == '[' and pattern.find(']', i + 1) != -1:
+            j = pattern.find(']', i + 1)
+            chars = pattern[i + 1:j].replace('\\', '\\\\')
+            if chars.startswith('!'):
+                chars = '^' + chars[1:]
+            regex += '[{}]'.format(chars)
+            i = j
+        else:
+            regex += re.escape(c)
+        i += 1
+    return regex
@@ -6,8 +6,195 @@
 """
 
 import os
+import queue
+import time
+from urllib.parse import urlparse
+
+from pylxd.models import Container as PyLXDContainer
+from ws4py.client import WebSocketBaseClient
+from ws4py.manager import WebSocketManager
 
 
 def get_lxd_dir():
     """ Returns the path (as a string) towards the LXD's directory. """
     return os.environ.get('LXD_DIR', None) or '/var/lib/lxd'
+
+
+def get_lxdock_containers(client):
+    """ Returns the PyLXD containers managed by LXDock, fetched using a single LXD API call.
+
+    The containers are fetched using a recursive listing, which means that the returned PyLXD
+    containers already hold their configuration, their devices and their status. The returned
+    dictionary associates each container name with the related PyLXD container.
+    """
+    response = client.api.containers.get(params={'recursion': 1})
+    containers = {}
+    for metadata in response.json()['metadata']:
+        if not metadata.get('config', {}).get('user.lxdock.made'):
+            continue
+        # Only keep the attributes supported by PyLXD's container model (LXD can return attributes
+        # that are not supported by the PyLXD version we use).
+        attributes = {k: v for k, v in metadata.items() if k in PyLXDContainer.__attributes__}
+        containers[metadata['name']] = PyLXDContainer(client, **attributes)
+    return containers
+
+
+def patch_container(container, data, wait=True):
+    """ Partially updates a PyLXD container using a single PATCH request.
+
+    Only the keys present in the `data` dictionary (eg. some configuration keys or devices) are
+    updated by LXD; the other settings of the container are left untouched. Note that the PyLXD
+    container itself is not updated by this function.
+    """
+    api = container.api
+    response = api.session.patch(api._api_endpoint, json=data, timeout=api._timeout)
+    api._assert_response(response, allowed_status_codes=(200, 202))
+    if response.json()['type'] == 'async' and wait:
+        container.client.operations.wait_for_operation(response.json()['operation'])
+
+
+def supports_api_extension(client, extension):
+    """ Returns True if the LXD server the client is connected to supports the given extension. """
+    return extension in client.host_info.get('api_extensions', [])
+
+
+def execute_streaming(container, commands, stdout_handler=None, stderr_handler=None,
+                      environment=None):
+    """ Executes a command in a PyLXD container and streams its output; returns its exit code.
+
+    Unlike PyLXD's `Container.execute` method, which returns the whole output of the command once
+    it is finished, this function passes each chunk (bytes) of the standard output or of the
+    standard error to `stdout_handler` or `stderr_handler` as soon as it is received.
+    """
+    response = container.api['exec'].post(json={
+        'command': commands,
+        'environment': environment or {},
+        'wait-for-websocket': True,
+        'interactive': False,
+    })
+    fds = response.json()['metadata']['metadata']['fds']
+    operation_id = response.json()['operation'].split('/')[-1]
+    websocket_path = urlparse(
+        container.client.api.operations[operation_id].websocket._api_endpoint).path
+    websocket_url = container.client.websocket_url
+
+    manager = WebSocketManager()
+    try:
+        stdin = _StdinWebsocketClient(websocket_url)
+        stdin.resource = '{}?secret={}'.format(websocket_path, fds['0'])
+        stdin.connect()
+        for fd, handler in (('1', stdout_handler), ('2', stderr_handler)):
+            websocket = _OutputWebsocketClient(manager, handler, websocket_url)
+            websocket.resource = '{}?secret={}'.format(websocket_path, fds[fd])
+            websocket.connect()
+        manager.start()
+        while len(manager.websockets.values()) > 0:
+            time.sleep(.05)
+    finally:
+        manager.stop()
+
+    operation = container.client.operations.get(operation_id)
+    return operation.metadata['return']
+
+
+class ExecChannel:
+    """ Runs a long-lived command in a PyLXD container and uses its standard streams as a channel.
+
+    Data can be sent to the standard input of the command at any time and the lines written by the
+    command on its standard output can be read one by one. This allows to exchange many messages
+    with a process running in a container using a single exec operation. The standard error of the
+    command is passed to `stderr_handler` (if any).
+    """
+
+    def __init__(self, container, commands, stderr_handler=None, environment=None):
+        self.container = container
+        self._lines = queue.Queue()
+        self._buffer = b''
+
+        response = container.api['exec'].post(json={
+            'command': commands,
+            'environment': environment or {},
+            'wait-for-websocket': True,
+            'interactive': False,
+        })
+        fds = response.json()['metadata']['metadata']['fds']
+        self._operation_id = response.json()['operation'].split('/')[-1]
+        websocket_path = urlparse(
+            container.client.api.operations[self._operation_id].websocket._api_endpoint).path
+        websocket_url = container.client.websocket_url
+
+        self._manager = WebSocketManager()
+        self._stdin = WebSocketBaseClient(websocket_url)
+        self._stdin.resource = '{}?secret={}'.format(websocket_path, fds['0'])
+        self._stdin.connect()
+        self._stdout = _OutputWebsocketClient(self._manager, self._received_output, websocket_url)
+        self._stdout.resource = '{}?secret={}'.format(websocket_path, fds['1'])
+        self._stdout.connect()
+        stderr = _OutputWebsocketClient(self._manager, stderr_handler, websocket_url)
+        stderr.resource = '{}?secret={}'.format(websocket_path, fds['2'])
+        stderr.connect()
+        self._manager.start()
+
+    def send(self, data):
+        """ Sends data (bytes) to the standard input of the command. """
+        self._stdin.send(data, binary=True)
+
+    def readline(self, timeout=None):
+        """ Returns the next line (bytes) written by the command on its standard output.
+
+        None is returned if the standard output of the command is closed or if no line is received
+        within `timeout` seconds.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while deadline is None or time.monotonic() < deadline:
+            try:
+                return self._lines.get(timeout=.05)
+            except queue.Empty:
+                if self._stdout not in self._manager.websockets.values():
+                    return None
+        return None
+
+    def close(self):
+        """ Closes the standard input of the command, waits for its end and returns its exit code.
+        """
+        self._stdin.close()
+        try:
+            while len(self._manager.websockets.values()) > 0:
+                time.sleep(.05)
+        finally:
+            self._manager.stop()
+        operation = self.container.client.operations.get(self._operation_id)
+        return operation.metadata['return']
+
+    def _received_output(self, data):
+        lines = (self._buffer + data).split(b'\n')
+        self._buffer = lines.pop()
+        for line in lines:
+            self._lines.put(line)
+
+
+class _OutputWebsocketClient(WebSocketBaseClient):  # pragma: no cover
+    """ Passes the output received on the websocket of an exec operation to a handler. """
+
+    def __init__(self, manager, handler, *args, **kwargs):
+        self.manager = manager
+        self.handler = handler
+        super().__init__(*args, **kwargs)
+
+    def handshake_ok(self):
+        self.manager.add(self)
+
+    def received_message(self, message):
+        if len(message.data) == 0:
+            # An empty message means that the output stream is closed.
+            self.close()
+            self.manager.remove(self)
+        elif self.handler is not None:
+            self.handler(message.data)
+
+
+class _StdinWebsocketClient(WebSocketBaseClient):  # pragma: no cover
+    """ Closes the standard input of an exec operation as soon as it is connected. """
+
+    def handshake_ok(self):
+        self.close()
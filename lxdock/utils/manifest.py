@@ -0,0 +1,80 @@
+"""
+    Directory manifests
+    ===================
+    This module provides tools allowing to describe the content of directories using manifests and
+    to compute the differences between two manifests (eg. in order to only transfer the files of a
+    directory that changed since the last time it was copied somewhere).
+"""
+
+import hashlib
+import os
+import stat
+
+from .ignore import walk
+
+
+def get_directory_manifest(path, previous=None, ignore_rules=None):
+    """ Returns a manifest describing the files, directories and symlinks located under `path`.
+
+    The manifest is a dictionary associating the relative (POSIX) path of each entry with a list
+    containing its type ('f', 'd' or 'l'), its mode, its size, its modification time (in
+    nanoseconds) and a digest of its content (the SHA-1 of files or the target of symlinks). If a
+    `previous` manifest is provided, the digests of the files whose mode, size and modification
+    time didn't change are reused instead of being computed again. Entries matching `ignore_rules`
+    (an `IgnoreRules` instance) are not included in the manifest.
+    """
+    previous = previous or {}
+    manifest = {}
+    for relpath, stats in walk(path, ignore_rules):
+        entry_path = os.path.join(str(path), relpath)
+        if stat.S_ISLNK(stats.st_mode):
+            manifest[relpath] = ['l', 0, 0, 0, os.readlink(entry_path)]
+            continue
+        if stat.S_ISDIR(stats.st_mode):
+            manifest[relpath] = ['d', stats.st_mode, 0, 0, None]
+            continue
+        file_entry = ['f', stats.st_mode, stats.st_size, stats.st_mtime_ns, None]
+        previous_entry = previous.get(relpath)
+        if previous_entry is not None and previous_entry[:4] == file_entry[:4]:
+            file_entry[4] = previous_entry[4]
+        else:
+            file_entry[4] = _get_file_digest(entry_path)
+        manifest[relpath] = file_entry
+    return manifest
+
+
+def compare_manifests(old, new):
+    """ Returns the entries that should be transferred and deleted to go from `old` to `new`.
+
+    A tuple of two sorted lists of relative paths is returned: the paths of the entries that were
+    added or whose content changed, and the paths of the entries that were deleted (or whose type
+    changed). Note that entries whose modification time is the only thing that changed are not
+    considered as changed, and that the children of deleted directories are not listed.
+    """
+    changed = sorted(
+        relpath for relpath, entry in new.items()
+        if relpath not in old or _get_content_key(old[relpath]) != _get_content_key(entry))
+    deleted = {
+        relpath for relpath, entry in old.items()
+        if relpath not in new or new[relpath][0] != entry[0]}
+    deleted = sorted(
+        relpath for relpath in deleted
+        if not any(parent in deleted for parent in _get_parents(relpath)))
+    return changed, deleted
+
+
+def _get_content_key(entry):
+    return entry[0], entry[1], entry[4]
+
+
+def _get_file_digest(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _get_parents(relpath):
+    parts = relpath.split('/')
+    return ['/'.join(parts[:i]) for i in range(1, len(parts))]
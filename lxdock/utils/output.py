@@ -0,0 +1,57 @@
+"""
+    Command output utilities
+    ========================
+    This module provides tools allowing to process the output of commands (eg. commands executed in
+    containers) line by line while they run, using a bounded amount of memory.
+"""
+
+import codecs
+import collections
+
+
+class CommandOutput:
+    """ Receives the output of a command in chunks (bytes) and processes it line by line.
+
+    Each complete line is passed to `line_callback` (eg. a logging function) as soon as it is
+    received. Only the last `max_lines` lines are kept (in a ring buffer) so that they can be used
+    to report errors. The raw output can also be written to `tee`, a binary file object.
+    """
+
+    # The maximum length of a line; longer lines (eg. progress bars) are split.
+    max_line_length = 64 * 1024
+
+    def __init__(self, line_callback=None, max_lines=100, tee=None):
+        self.line_callback = line_callback
+        self.lines = collections.deque(maxlen=max_lines)
+        self.tee = tee
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self._partial_line = ''
+
+    def __call__(self, data):
+        if self.tee is not None:
+            self.tee.write(data)
+        lines = (self._partial_line + self._decoder.decode(data)).split('\n')
+        self._partial_line = lines.pop()
+        for line in lines:
+            self._add_line(line)
+        while len(self._partial_line) > self.max_line_length:
+            self._add_line(self._partial_line[:self.max_line_length])
+            self._partial_line = self._partial_line[self.max_line_length:]
+
+    def close(self):
+        """ Processes the last line of the output if it doesn't end with a newline. """
+        last_line = self._partial_line + self._decoder.decode(b'', final=True)
+        self._partial_line = ''
+        if last_line:
+            self._add_line(last_line)
+
+    @property
+    def text(self):
+        """ Returns the last lines of the output. """
+        return '\n'.join(self.lines)
+
+    def _add_line(self, line):
+        line = line.rstrip('\r')
+        self.lines.append(line)
+        if self.line_callback is not None:
+            self.line_callback(line)
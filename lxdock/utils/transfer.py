@@ -0,0 +1,54 @@
+"""
+    Transfer utilities
+    ==================
+    This module provides tools allowing to upload files to containers without loading them entirely
+    in memory.
+"""
+
+import logging
+import os
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class FileUploadBody:
+    """ Wraps a binary file object so that it can be streamed as the body of an HTTP request.
+
+    The HTTP client reads the file in small blocks as it sends them, and the size of the file is
+    exposed through `__len__` so that a Content-Length header is used. `progress` can be a callable
+    that is called with the number of bytes read so far and the total size after each block.
+    """
+
+    def __init__(self, fileobj, size, progress=None):
+        self.fileobj = fileobj
+        self.size = size
+        self.progress = progress
+        self.bytes_read = 0
+
+    def __len__(self):
+        return self.size
+
+    def read(self, size=-1):
+        chunk = self.fileobj.read(size)
+        self.bytes_read += len(chunk)
+        if chunk and self.progress is not None:
+            self.progress(self.bytes_read, self.size)
+        return chunk
+
+
+def put_file(lxd_container, host_path, guest_path, progress=None):
+    """ Uploads the file located at `host_path` on the host to `guest_path` in the container.
+
+    The file is streamed: the memory used doesn't depend on its size. `progress` can be a callable
+    that is called with the number of bytes sent so far and the total size of the file.
+    """
+    start = time.monotonic()
+    with open(str(host_path), 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        lxd_container.files.put(str(guest_path), FileUploadBody(f, size, progress=progress))
+    elapsed = max(time.monotonic() - start, 1e-6)
+    logger.debug('Uploaded {} bytes to guest:{} in {:.2f}s ({:.1f} MB/s)'.format(
+        size, guest_path, elapsed, size / elapsed / 1024 ** 2))
+    return size
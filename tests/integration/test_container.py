@@ -86,6 +86,20 @@ class TestContainer(LXDTestCase):
         assert container._container.config['user.lxdock.provisioned'] == 'true'
         assert container._container.files.get('/dummytest').strip() == b'dummytest'
 
+    def test_can_provision_a_container_using_the_guest_agent(self):
+        container_options = {
+            'name': self.containername('willprovision'), 'image': 'ubuntu/xenial', 'mode': 'pull',
+            'agent': True,
+            'provisioning': [
+                {'type': 'shell', 'inline': 'echo dummytest > /dummytest', }
+            ],
+        }
+        container = Container('myproject', THIS_DIR, self.client, **container_options)
+        container.up()
+        assert container._container.config['user.lxdock.provisioned'] == 'true'
+        assert container._container.files.get('/.lxdock.d/agent.py')
+        assert container._container.files.get('/dummytest').strip() == b'dummytest'
+
     def test_can_provision_a_container_shell_inline(self):
         container_options = {
             'name': self.containername('willprovision'), 'image': 'ubuntu/xenial', 'mode': 'pull',
@@ -219,12 +233,11 @@ class TestContainer(LXDTestCase):
         guest_mock = unittest.mock.Mock()
         container._container_guest = guest_mock
         container.up()
-        assert guest_mock.create_user.call_count == 3
-        assert guest_mock.create_user.call_args_list[0][0][0] == 'user01'
-        assert guest_mock.create_user.call_args_list[1][0][0] == 'user02'
-        assert guest_mock.create_user.call_args_list[2][0][0] == 'user03'
-        assert guest_mock.create_user.call_args_list[1][1]['home'] == '/opt/user02'
-        assert guest_mock.create_user.call_args_list[2][1]['password'] == password
+        assert guest_mock.ensure_users.call_count == 1
+        users = guest_mock.ensure_users.call_args[0][0]
+        assert [u['name'] for u in users] == ['user01', 'user02', 'user03']
+        assert users[1]['home'] == '/opt/user02'
+        assert users[2]['password'] == password
 
     def test_get_container_lxc_config(self):
         """Test that _get_container generates a valid lxc_config
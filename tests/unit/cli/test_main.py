@@ -24,6 +24,29 @@ def test_main_function_can_run_a_lxdock_command(mock_help_action):
 
 
 class TestLXDock:
+    @unittest.mock.patch('lxdock.cache_proxy.CachingProxy')
+    def test_can_run_the_cache_proxy_action(self, mock_proxy):
+        LXDock(['cache-proxy', '--host', '10.0.3.1', '--max-size', '100'])
+        assert mock_proxy.call_args[1] == {
+            'host': '10.0.3.1', 'port': 3142, 'max_size': 100 * 1024 ** 2}
+        assert mock_proxy.return_value.serve_forever.call_count == 1
+
+    @unittest.mock.patch('lxdock.cache_proxy.CachingProxy')
+    @unittest.mock.patch('lxdock.network.get_interface_ipv4', return_value='10.0.3.1')
+    def test_can_run_the_cache_proxy_action_on_the_lxd_bridge_by_default(
+            self, mock_get_ipv4, mock_proxy):
+        LXDock(['cache-proxy', ])
+        assert mock_get_ipv4.call_args == unittest.mock.call('lxdbr0')
+        assert mock_proxy.call_args[1]['host'] == '10.0.3.1'
+
+    @unittest.mock.patch('lxdock.cache_proxy.CachingProxy')
+    @unittest.mock.patch('lxdock.network.get_interface_ipv4', return_value='')
+    def test_exit_if_the_address_of_the_lxd_bridge_cannot_be_found(
+            self, mock_get_ipv4, mock_proxy):
+        with pytest.raises(SystemExit):
+            LXDock(['cache-proxy', '--bridge', 'unknown', ])
+        assert mock_proxy.call_count == 0
+
     @unittest.mock.patch.object(LXDock, 'project_config')
     @unittest.mock.patch.object(Config, 'serialize')
     def test_can_display_the_config_file_of_the_project(self, serialize_mock, mock_config):
@@ -54,7 +77,8 @@ class TestLXDock:
             return_value=get_project(os.path.join(FIXTURE_ROOT, 'project01')))
         LXDock(['destroy'])
         assert mock_project_destroy.call_count == 1
-        assert mock_project_destroy.call_args == [{'container_names': [], }, ]
+        assert mock_project_destroy.call_args == [
+            {'container_names': [], 'jobs': None, 'load_state': False, }, ]
 
     @unittest.mock.patch('builtins.input', return_value='Y')
     @unittest.mock.patch.object(LXDock, 'project')
@@ -67,7 +91,8 @@ class TestLXDock:
             return_value=get_project(os.path.join(FIXTURE_ROOT, 'project01')))
         LXDock(['destroy', 'default'])
         assert mock_project_destroy.call_count == 1
-        assert mock_project_destroy.call_args == [{'container_names': ['default', ], }, ]
+        assert mock_project_destroy.call_args == [
+            {'container_names': ['default', ], 'jobs': None, 'load_state': False, }, ]
 
     @unittest.mock.patch.object(LXDock, 'project')
     @unittest.mock.patch.object(Project, 'destroy')
@@ -79,7 +104,8 @@ class TestLXDock:
             return_value=get_project(os.path.join(FIXTURE_ROOT, 'project01')))
         LXDock(['destroy', '--force'])
         assert mock_project_destroy.call_count == 1
-        assert mock_project_destroy.call_args == [{'container_names': [], }, ]
+        assert mock_project_destroy.call_args == [
+            {'container_names': [], 'jobs': None, 'load_state': False, }, ]
 
     @unittest.mock.patch.object(LXDock, 'project')
     @unittest.mock.patch.object(Project, 'destroy')
@@ -91,7 +117,8 @@ class TestLXDock:
             return_value=get_project(os.path.join(FIXTURE_ROOT, 'project01')))
         LXDock(['destroy'])
         assert mock_project_destroy.call_count == 1
-        assert mock_project_destroy.call_args == [{'container_names': [], }, ]
+        assert mock_project_destroy.call_args == [
+            {'container_names': [], 'jobs': None, 'load_state': False, }, ]
 
     @unittest.mock.patch.object(LXDock, 'project')
     @unittest.mock.patch.object(Project, 'halt')
@@ -101,7 +128,7 @@ class TestLXDock:
             return_value=get_project(os.path.join(FIXTURE_ROOT, 'project01')))
         LXDock(['halt'])
         assert mock_project_halt.call_count == 1
-        assert mock_project_halt.call_args == [{'container_names': [], }, ]
+        assert mock_project_halt.call_args == [{'container_names': [], 'jobs': None, }, ]
 
     @unittest.mock.patch.object(LXDock, 'project')
     @unittest.mock.patch.object(Project, 'halt')
@@ -111,7 +138,8 @@ class TestLXDock:
             return_value=get_project(os.path.join(FIXTURE_ROOT, 'project01')))
         LXDock(['halt', 'c1', 'c2'])
         assert mock_project_halt.call_count == 1
-        assert mock_project_halt.call_args == [{'container_names': ['c1', 'c2', ], }, ]
+        assert mock_project_halt.call_args == [
+            {'container_names': ['c1', 'c2', ], 'jobs': None, }, ]
 
     def test_can_print_the_global_help(self):
         argv = ['help']
@@ -131,7 +159,7 @@ class TestLXDock:
             return_value=get_project(os.path.join(FIXTURE_ROOT, 'project01')))
         LXDock(['provision'])
         assert mock_project_provision.call_count == 1
-        assert mock_project_provision.call_args == [{'container_names': [], }, ]
+        assert mock_project_provision.call_args == [{'container_names': [], 'log_dir': None, }, ]
 
     @unittest.mock.patch.object(LXDock, 'project')
     @unittest.mock.patch.object(Project, 'provision')
@@ -141,7 +169,19 @@ class TestLXDock:
             return_value=get_project(os.path.join(FIXTURE_ROOT, 'project01')))
         LXDock(['provision', 'c1', 'c2'])
         assert mock_project_provision.call_count == 1
-        assert mock_project_provision.call_args == [{'container_names': ['c1', 'c2', ], }, ]
+        assert mock_project_provision.call_args == [
+            {'container_names': ['c1', 'c2', ], 'log_dir': None, }, ]
+
+    @unittest.mock.patch.object(LXDock, 'project')
+    @unittest.mock.patch.object(Project, 'provision')
+    def test_can_run_the_provision_action_with_a_log_directory(
+            self, mock_project_provision, mock_project):
+        mock_project.__get__ = unittest.mock.Mock(
+            return_value=get_project(os.path.join(FIXTURE_ROOT, 'project01')))
+        LXDock(['provision', '--log-dir', 'logs', ])
+        assert mock_project_provision.call_count == 1
+        assert mock_project_provision.call_args == [
+            {'container_names': [], 'log_dir': os.path.abspath('logs'), }, ]
 
     @unittest.mock.patch.object(LXDock, 'project')
     @unittest.mock.patch.object(Project, 'shell')
@@ -217,7 +257,7 @@ class TestLXDock:
             return_value=get_project(os.path.join(FIXTURE_ROOT, 'project01')))
         LXDock(['status'])
         assert mock_project_status.call_count == 1
-        assert mock_project_status.call_args == [{'container_names': [], }, ]
+        assert mock_project_status.call_args == [{'container_names': [], 'log_dir': None, }, ]
 
     @unittest.mock.patch.object(LXDock, 'project')
     @unittest.mock.patch.object(Project, 'status')
@@ -227,7 +267,8 @@ class TestLXDock:
             return_value=get_project(os.path.join(FIXTURE_ROOT, 'project01')))
         LXDock(['status', 'c1', 'c2'])
         assert mock_project_status.call_count == 1
-        assert mock_project_status.call_args == [{'container_names': ['c1', 'c2', ], }, ]
+        assert mock_project_status.call_args == [
+            {'container_names': ['c1', 'c2', ], 'log_dir': None, }, ]
 
     @unittest.mock.patch.object(LXDock, 'project')
     @unittest.mock.patch.object(Project, 'up')
@@ -238,7 +279,8 @@ class TestLXDock:
         LXDock(['up'])
         assert mock_project_up.call_count == 1
         assert mock_project_up.call_args == [
-            {'container_names': [], 'provisioning_mode': None, }, ]
+            {'container_names': [], 'provisioning_mode': None, 'jobs': None,
+             'log_dir': None, }, ]
 
     @unittest.mock.patch.object(LXDock, 'project')
     @unittest.mock.patch.object(Project, 'up')
@@ -249,7 +291,8 @@ class TestLXDock:
         LXDock(['up', 'c1', 'c2'])
         assert mock_project_up.call_count == 1
         assert mock_project_up.call_args == [
-            {'container_names': ['c1', 'c2', ], 'provisioning_mode': None, }, ]
+            {'container_names': ['c1', 'c2', ], 'provisioning_mode': None, 'jobs': None,
+             'log_dir': None, }, ]
 
     @unittest.mock.patch.object(LXDock, 'project')
     @unittest.mock.patch.object(Project, 'up')
@@ -260,7 +303,8 @@ class TestLXDock:
         LXDock(['up', '--provision', ])
         assert mock_project_up.call_count == 1
         assert mock_project_up.call_args == [
-            {'container_names': [], 'provisioning_mode': ProvisioningMode.ENABLED, }, ]
+            {'container_names': [], 'provisioning_mode': ProvisioningMode.ENABLED,
+             'jobs': None, 'log_dir': None, }, ]
 
     @unittest.mock.patch.object(LXDock, 'project')
     @unittest.mock.patch.object(Project, 'up')
@@ -271,7 +315,34 @@ class TestLXDock:
         LXDock(['up', '--no-provision', ])
         assert mock_project_up.call_count == 1
         assert mock_project_up.call_args == [
-            {'container_names': [], 'provisioning_mode': ProvisioningMode.DISABLED, }, ]
+            {'container_names': [], 'provisioning_mode': ProvisioningMode.DISABLED,
+             'jobs': None, 'log_dir': None, }, ]
+
+    @unittest.mock.patch.object(LXDock, 'project')
+    @unittest.mock.patch.object(Project, 'up')
+    def test_can_run_the_up_action_with_multiple_jobs(self, mock_project_up, mock_project):
+        mock_project.__get__ = unittest.mock.Mock(
+            return_value=get_project(os.path.join(FIXTURE_ROOT, 'project01')))
+        LXDock(['up', '--jobs', '4', ])
+        assert mock_project_up.call_count == 1
+        assert mock_project_up.call_args == [
+            {'container_names': [], 'provisioning_mode': None, 'jobs': 4,
+             'log_dir': None, }, ]
+
+    @unittest.mock.patch.object(LXDock, 'project')
+    @unittest.mock.patch.object(Project, 'up')
+    def test_can_run_the_up_action_with_a_log_directory(self, mock_project_up, mock_project):
+        mock_project.__get__ = unittest.mock.Mock(
+            return_value=get_project(os.path.join(FIXTURE_ROOT, 'project01')))
+        LXDock(['up', '--log-dir', 'logs', ])
+        assert mock_project_up.call_count == 1
+        assert mock_project_up.call_args == [
+            {'container_names': [], 'provisioning_mode': None, 'jobs': None,
+             'log_dir': os.path.abspath('logs'), }, ]
+
+    def test_exit_if_the_number_of_jobs_is_not_a_positive_integer(self):
+        with pytest.raises(SystemExit):
+            LXDock(['up', '--jobs', '0', ])
 
     def test_exit_if_no_action_is_provided(self):
         with pytest.raises(SystemExit):
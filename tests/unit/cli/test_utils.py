@@ -1,6 +1,9 @@
+import argparse
 import unittest.mock
 
-from lxdock.cli.utils import yesno
+import pytest
+
+from lxdock.cli.utils import positive_int, yesno
 
 
 class TestYesNoFunction(object):
@@ -23,3 +26,14 @@ class TestYesNoFunction(object):
             assert not yesno('True or False?')
         with unittest.mock.patch('builtins.input', return_value='no'):
             assert not yesno('True or False?')
+
+
+class TestPositiveIntFunction(object):
+    def test_can_convert_positive_integers(self):
+        assert positive_int('1') == 1
+        assert positive_int('16') == 16
+
+    def test_raises_an_error_if_the_value_is_not_a_positive_integer(self):
+        for value in ['0', '-2', 'foo', '1.5']:
+            with pytest.raises(argparse.ArgumentTypeError):
+                positive_int(value)
@@ -82,3 +82,56 @@ class TestValidateProvisionerSchemas:
                 }]
             })
         assert "['provisioning'][1]['a']" in str(e)
+
+
+class TestValidateProjectOptions:
+    def test_can_validate_the_parallelism_option(self):
+        schema = get_schema()
+        assert schema({'name': 'dummy-test', 'parallelism': 4})['parallelism'] == 4
+        with pytest.raises(Invalid):
+            schema({'name': 'dummy-test', 'parallelism': 0})
+        with pytest.raises(Invalid):
+            schema({'name': 'dummy-test', 'containers': [{'name': 'web', 'parallelism': 2}]})
+
+    def test_can_validate_the_depends_on_option(self):
+        schema = get_schema()
+        validated = schema({
+            'name': 'dummy-test',
+            'containers': [{'name': 'web', 'depends_on': ['db', ]}, {'name': 'db'}, ],
+        })
+        assert validated['containers'][0]['depends_on'] == ['db', ]
+        validated = schema({
+            'name': 'dummy-test',
+            'containers': [
+                {'name': 'web', 'depends_on': [{'name': 'db', 'condition': 'up'}, ]},
+                {'name': 'db'},
+            ],
+        })
+        assert validated['containers'][0]['depends_on'] == [{'name': 'db', 'condition': 'up'}, ]
+        with pytest.raises(Invalid):
+            schema({'name': 'dummy-test', 'depends_on': ['db', ]})
+        with pytest.raises(Invalid):
+            schema({
+                'name': 'dummy-test',
+                'containers': [{'name': 'web', 'depends_on': [{'name': 'db', 'condition': 'x'}]}],
+            })
+
+    def test_can_validate_the_stage_parallelism_option(self):
+        schema = get_schema()
+        validated = schema({'name': 'dummy-test', 'stage_parallelism': {'provision': 2, }})
+        assert validated['stage_parallelism'] == {'provision': 2, }
+        with pytest.raises(Invalid):
+            schema({'name': 'dummy-test', 'stage_parallelism': {'unknown': 2, }})
+        with pytest.raises(Invalid):
+            schema({'name': 'dummy-test', 'stage_parallelism': {'provision': 0, }})
+
+    def test_can_validate_the_mapping_option_of_shares(self):
+        schema = get_schema()
+        validated = schema({
+            'name': 'dummy-test', 'shares': [{'source': '.', 'dest': '/a', 'mapping': 'shift'}, ]})
+        assert validated['shares'][0]['mapping'] == 'shift'
+        with pytest.raises(Invalid):
+            schema({
+                'name': 'dummy-test',
+                'shares': [{'source': '.', 'dest': '/a', 'mapping': 'unknown'}, ],
+            })
@@ -0,0 +1,27 @@
+import unittest.mock
+
+import pytest
+
+
+@pytest.fixture
+def mocked_execute_streaming():
+    """ Replaces the websockets-based streaming execution of the commands run in guests.
+
+    The returned mock records the calls to `execute_streaming`. The exit code and the output of the
+    commands are provided by its `command_result` attribute, a mock called with the commands and
+    returning (exit code, stdout, stderr) tuples; the output is passed to the handlers in one go.
+    """
+    mocked = unittest.mock.Mock()
+    mocked.command_result.return_value = (0, '', '')
+
+    def execute_streaming(container, commands, stdout_handler=None, stderr_handler=None,
+                          environment=None):
+        exit_code, stdout, stderr = mocked.command_result(commands)
+        for handler, output in ((stdout_handler, stdout), (stderr_handler, stderr)):
+            if handler is not None and output:
+                handler(output.encode('utf-8'))
+        return exit_code
+
+    mocked.side_effect = execute_streaming
+    with unittest.mock.patch('lxdock.guests.base.execute_streaming', mocked):
+        yield mocked
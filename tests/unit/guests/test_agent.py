@@ -0,0 +1,161 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest.mock
+
+import pytest
+
+from lxdock.cli.main import LXDock
+from lxdock.exceptions import ContainerOperationFailed
+from lxdock.guests import Guest
+from lxdock.guests.agent import AgentError, GuestAgent
+from lxdock.guests.agent_script import PROTOCOL_VERSION
+
+
+class LocalChannel:
+    """ Runs the agent script on the host instead of running it in a container. """
+
+    def __init__(self, container, commands, stderr_handler=None, environment=None):
+        self.script_file = tempfile.NamedTemporaryFile(suffix='.py')
+        self.script_file.write(GuestAgent.get_script())
+        self.script_file.flush()
+        self.process = subprocess.Popen(
+            [sys.executable, '-u', self.script_file.name], stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE)
+
+    def send(self, data):
+        self.process.stdin.write(data)
+        self.process.stdin.flush()
+
+    def readline(self, timeout=None):
+        return self.process.stdout.readline().rstrip(b'\n') or None
+
+    def close(self):
+        self.process.stdin.close()
+        exit_code = self.process.wait()
+        self.process.stdout.close()
+        self.script_file.close()
+        return exit_code
+
+
+class DummyGuest(Guest):
+    name = 'dummy'
+
+
+@unittest.mock.patch('lxdock.guests.agent.ExecChannel', LocalChannel)
+class TestGuestAgent:
+    def test_can_run_commands_and_read_or_write_files(self):
+        agent = GuestAgent(unittest.mock.Mock())
+        agent.start()
+        try:
+            assert agent.is_running
+            stdout, stderr = [], []
+            assert agent.run(
+                ['sh', '-c', 'echo out; echo err >&2; exit 3'], stdout_handler=stdout.append,
+                stderr_handler=stderr.append) == 3
+            assert stdout == [b'out\n', ] and stderr == [b'err\n', ]
+            assert agent.run(['/nonexistent/command']) == 127
+            with tempfile.TemporaryDirectory() as d:
+                agent.write_file('{}/f1'.format(d), 'dummy f1', mode=0o600)
+                assert os.stat('{}/f1'.format(d)).st_mode & 0o777 == 0o600
+                assert agent.read_file('{}/f1'.format(d)) == b'dummy f1'
+                assert agent.read_file('{}/nonexistent'.format(d)) is None
+        finally:
+            agent.stop()
+        assert not agent.is_running
+        with pytest.raises(AgentError):
+            agent.run(['ls', ])
+
+    def test_streams_the_output_of_commands_while_they_are_running(self):
+        agent = GuestAgent(unittest.mock.Mock())
+        agent.start()
+        received = []
+        try:
+            # The command waits for the first line to be received before writing the second one.
+            with tempfile.TemporaryDirectory() as d:
+                fifo_path = os.path.join(d, 'fifo')
+                os.mkfifo(fifo_path)
+
+                def handle_stdout(data):
+                    received.append(data)
+                    if data == b'first\n':
+                        with open(fifo_path, 'w') as fd:
+                            fd.write('second\n')
+
+                assert agent.run(
+                    ['sh', '-c', 'echo first; cat {}'.format(fifo_path)],
+                    stdout_handler=handle_stdout) == 0
+        finally:
+            agent.stop()
+        assert received == [b'first\n', b'second\n']
+
+    def test_guests_use_the_agent_once_it_is_started(self, mocked_execute_streaming):
+        lxd_container = unittest.mock.Mock()
+        guest = DummyGuest(lxd_container)
+        assert guest.start_agent()
+        try:
+            assert guest.run(['sh', '-c', 'echo out']) == 0
+            assert guest.last_stdout == 'out'
+            with tempfile.TemporaryDirectory() as d:
+                guest.write_file('{}/f1'.format(d), b'dummy f1')
+                assert guest.read_file('{}/f1'.format(d)) == b'dummy f1'
+        finally:
+            guest.stop_agent()
+        assert mocked_execute_streaming.call_count == 0
+        assert lxd_container.files.put.call_count == 0
+        assert guest.agent is None
+
+    def test_guests_do_not_run_again_the_commands_the_agent_received(
+            self, mocked_execute_streaming):
+        guest = DummyGuest(unittest.mock.Mock())
+        assert guest.start_agent()
+        # The command kills the agent that runs it.
+        with pytest.raises(ContainerOperationFailed) as excinfo:
+            guest.run(['sh', '-c', 'kill $PPID'])
+        assert 'may have been partly run' in excinfo.value.msg
+        assert excinfo.value.__cause__.request_sent
+        assert mocked_execute_streaming.call_count == 0
+        assert guest.agent is None
+        assert guest.run(['ls', ]) == 0
+        assert mocked_execute_streaming.call_count == 1
+
+    @unittest.mock.patch.object(LXDock, 'project')
+    def test_the_cli_reports_commands_interrupted_by_an_agent_failure(
+            self, mock_project, mocked_execute_streaming):
+        guest = DummyGuest(unittest.mock.Mock())
+        assert guest.start_agent()
+        mock_project.__get__ = unittest.mock.Mock(return_value=unittest.mock.Mock(
+            up=unittest.mock.Mock(side_effect=lambda **kwargs: guest.run(
+                ['sh', '-c', 'kill $PPID']))))
+        with unittest.mock.patch('lxdock.cli.main.logger') as mock_logger:
+            with pytest.raises(SystemExit):
+                LXDock(['up'])
+        assert 'may have been partly run' in mock_logger.error.call_args[0][0]
+        assert mocked_execute_streaming.call_count == 0
+
+
+def test_guests_fall_back_to_the_lxd_api_if_the_agent_cannot_be_started(mocked_execute_streaming):
+    lxd_container = unittest.mock.Mock()
+    mocked_execute_streaming.command_result.return_value = (0, 'ok', '')
+    guest = DummyGuest(lxd_container)
+    with unittest.mock.patch('lxdock.guests.agent.ExecChannel') as mock_channel:
+        mock_channel.return_value.readline.return_value = None
+        assert not guest.start_agent()
+    assert mock_channel.return_value.close.call_count == 1
+    assert guest.agent is None
+    assert guest.run(['ls', ]) == 0
+    assert mocked_execute_streaming.call_count == 1
+
+
+def test_upgrades_the_agent_if_it_uses_another_protocol_version():
+    lxd_container = unittest.mock.Mock()
+    agent = GuestAgent(lxd_container)
+    with unittest.mock.patch('lxdock.guests.agent.ExecChannel') as mock_channel:
+        mock_channel.return_value.readline.side_effect = [
+            b'{"ready": true, "version": 0}',
+            '{{"ready": true, "version": {}}}'.format(PROTOCOL_VERSION).encode(), ]
+        agent.start()
+    assert agent.is_running
+    assert mock_channel.return_value.close.call_count == 1
+    assert lxd_container.files.put.call_args[0] == (GuestAgent.script_path, GuestAgent.get_script())
@@ -4,11 +4,32 @@ from lxdock.guests import AlpineGuest
 
 
 class TestAlpineGuest:
-    def test_can_install_packages(self):
+    def test_can_install_packages(self, mocked_execute_streaming):
         lxd_container = unittest.mock.Mock()
-        lxd_container.execute.return_value = ('ok', 'ok', '')
+        mocked_execute_streaming.command_result.return_value = ('ok', 'ok', '')
         guest = AlpineGuest(lxd_container)
         guest.install_packages(['python', 'openssh', ])
-        assert lxd_container.execute.call_count == 2
-        assert lxd_container.execute.call_args_list[0][0] == (['apk', 'update'], )
-        assert lxd_container.execute.call_args_list[1][0] == (['apk', 'add', 'python', 'openssh'], )
+        assert mocked_execute_streaming.call_count == 3
+        assert mocked_execute_streaming.call_args_list[0][0][1:] == \
+            (['apk', 'info', '-e', 'python', 'openssh', ], )
+        assert '\napk update || exit $?\n' in \
+            mocked_execute_streaming.call_args_list[1][0][1][2]
+        assert mocked_execute_streaming.call_args_list[2][0][1:] == \
+            (['apk', 'add', 'python', 'openssh', ], )
+
+    def test_only_installs_the_packages_that_are_not_installed_yet(self, mocked_execute_streaming):
+        lxd_container = unittest.mock.Mock()
+        mocked_execute_streaming.command_result.return_value = (1, 'python\n', '')
+        guest = AlpineGuest(lxd_container)
+        guest.install_packages(['python', 'openssh', ])
+        assert mocked_execute_streaming.call_count == 3
+        assert mocked_execute_streaming.call_args_list[2][0][1:] == \
+            (['apk', 'add', 'openssh', ], )
+
+    def test_does_not_run_the_package_manager_if_all_the_packages_are_installed(
+            self, mocked_execute_streaming):
+        lxd_container = unittest.mock.Mock()
+        mocked_execute_streaming.command_result.return_value = (0, 'python\nopenssh\n', '')
+        guest = AlpineGuest(lxd_container)
+        guest.install_packages(['python', 'openssh', ])
+        assert mocked_execute_streaming.call_count == 1
@@ -4,11 +4,31 @@ from lxdock.guests import ArchLinuxGuest
 
 
 class TestArchLinuxGuest:
-    def test_can_install_packages(self):
+    def test_can_install_packages(self, mocked_execute_streaming):
         lxd_container = unittest.mock.Mock()
-        lxd_container.execute.return_value = ('ok', 'ok', '')
+        mocked_execute_streaming.command_result.return_value = ('ok', 'ok', '')
         guest = ArchLinuxGuest(lxd_container)
         guest.install_packages(['python', 'openssh', ])
-        assert lxd_container.execute.call_count == 1
-        assert lxd_container.execute.call_args[0] == \
-            (['pacman', '-S', '--noconfirm', 'python', 'openssh'], )
+        assert mocked_execute_streaming.call_count == 2
+        assert mocked_execute_streaming.call_args_list[0][0][1:] == \
+            (['pacman', '-Q', 'python', 'openssh', ], )
+        assert mocked_execute_streaming.call_args_list[1][0][1:] == \
+            (['pacman', '-S', '--needed', '--noconfirm', 'python', 'openssh', ], )
+
+    def test_only_installs_the_packages_that_are_not_installed_yet(self, mocked_execute_streaming):
+        lxd_container = unittest.mock.Mock()
+        mocked_execute_streaming.command_result.return_value = (1, 'python 3.6.1-1\n', '')
+        guest = ArchLinuxGuest(lxd_container)
+        guest.install_packages(['python', 'openssh', ])
+        assert mocked_execute_streaming.call_count == 2
+        assert mocked_execute_streaming.call_args_list[1][0][1:] == \
+            (['pacman', '-S', '--needed', '--noconfirm', 'openssh', ], )
+
+    def test_does_not_run_the_package_manager_if_all_the_packages_are_installed(
+            self, mocked_execute_streaming):
+        lxd_container = unittest.mock.Mock()
+        mocked_execute_streaming.command_result.return_value = (
+            0, 'python 3.6.1-1\nopenssh 7.5p1-2\n', '')
+        guest = ArchLinuxGuest(lxd_container)
+        guest.install_packages(['python', 'openssh', ])
+        assert mocked_execute_streaming.call_count == 1
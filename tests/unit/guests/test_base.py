@@ -1,13 +1,26 @@
+import io
+import logging
 import os
 import pathlib
+import subprocess
+import tarfile
 import tempfile
+import threading
 import unittest.mock
 
 import pytest
 from pylxd.exceptions import NotFound
 
-from lxdock.guests import Guest
-from lxdock.guests.base import InvalidGuest
+from lxdock.guests import CentosGuest, DebianGuest, Guest, OpenSUSEGuest, UbuntuGuest
+from lxdock.guests.base import CommandBatch, InvalidGuest, parse_os_release
+from lxdock.logging import _container_context, set_current_container_name
+
+
+def test_can_parse_os_release_files():
+    assert parse_os_release(
+        b'# Comment\nNAME="Ubuntu"\nID=ubuntu\nID_LIKE=debian\n'
+        b'PRETTY_NAME=\'Ubuntu 16.04\'\n\n') == {
+            'NAME': 'Ubuntu', 'ID': 'ubuntu', 'ID_LIKE': 'debian', 'PRETTY_NAME': 'Ubuntu 16.04'}
 
 
 class TestGuest:
@@ -29,76 +42,256 @@ class TestGuest:
         assert not DummyGuest.detect(lxd_container_2)
         assert not DummyGuest.detect(lxd_container_3)
 
-    def test_can_add_ssh_pubkey_to_root_authorized_keys(self):
+    def test_can_detect_the_guest_class_using_a_single_read_of_the_os_release_file(self):
+        lxd_container = unittest.mock.Mock()
+        lxd_container.files.get.return_value = \
+            b'NAME="CentOS Linux"\nID="centos"\nID_LIKE="rhel fedora"\n'
+        assert Guest.detect_guest_class(lxd_container) is CentosGuest
+        assert lxd_container.files.get.call_count == 1
+
+    def test_can_detect_the_guest_class_of_derivative_distributions_using_id_like(self):
+        lxd_container = unittest.mock.Mock()
+        lxd_container.files.get.return_value = b'ID=linuxmint\nID_LIKE="ubuntu debian"\n'
+        assert Guest.detect_guest_class(lxd_container) is UbuntuGuest
+        lxd_container.files.get.return_value = b'ID="opensuse-leap"\nID_LIKE="suse opensuse"\n'
+        assert Guest.detect_guest_class(lxd_container) is OpenSUSEGuest
+
+    def test_returns_none_if_the_guest_class_cannot_be_detected(self):
+        lxd_container = unittest.mock.Mock()
+        lxd_container.files.get.side_effect = NotFound(response=unittest.mock.Mock())
+        assert Guest.detect_guest_class(lxd_container) is None
+
+    def test_can_return_a_guest_class_from_its_name(self):
+        assert Guest.get_guest_class('debian') is DebianGuest
+        assert Guest.get_guest_class('unknown') is None
+
+    def test_can_add_ssh_pubkey_to_root_authorized_keys(self, mocked_execute_streaming):
         class DummyGuest(Guest):
             name = 'dummy'
         lxd_container = unittest.mock.Mock()
-        lxd_container.execute.return_value = ('ok', 'ok', '')
+        mocked_execute_streaming.command_result.return_value = ('ok', 'ok', '')
         guest = DummyGuest(lxd_container)
         guest.add_ssh_pubkey_to_root_authorized_keys('pubkey')
-        assert lxd_container.execute.call_count == 1
-        assert lxd_container.execute.call_args[0] == (['mkdir', '-p', '/root/.ssh'], )
+        assert mocked_execute_streaming.call_count == 1
+        assert mocked_execute_streaming.call_args[0][1:] == (['mkdir', '-p', '/root/.ssh'], )
         assert lxd_container.files.put.call_count == 1
         assert lxd_container.files.put.call_args[0] == ('/root/.ssh/authorized_keys', 'pubkey', )
 
-    def test_can_create_a_user_with_a_default_home_directory(self):
+    def test_can_create_a_user_with_a_default_home_directory(self, mocked_execute_streaming):
         class DummyGuest(Guest):
             name = 'dummy'
         lxd_container = unittest.mock.Mock()
-        lxd_container.execute.return_value = ('ok', 'ok', '')
+        mocked_execute_streaming.command_result.return_value = ('ok', 'ok', '')
         guest = DummyGuest(lxd_container)
         guest.create_user('usertest')
-        assert lxd_container.execute.call_count == 1
-        assert lxd_container.execute.call_args[0] == (['useradd', '--create-home', 'usertest'], )
+        assert mocked_execute_streaming.call_count == 1
+        assert mocked_execute_streaming.call_args[0][1:] == \
+            (['useradd', '--create-home', 'usertest'], )
 
-    def test_can_create_a_user_with_a_custom_home_directory(self):
+    def test_can_create_a_user_with_a_custom_home_directory(self, mocked_execute_streaming):
         class DummyGuest(Guest):
             name = 'dummy'
         lxd_container = unittest.mock.Mock()
-        lxd_container.execute.return_value = ('ok', 'ok', '')
+        mocked_execute_streaming.command_result.return_value = ('ok', 'ok', '')
         guest = DummyGuest(lxd_container)
         guest.create_user('usertest', home='/opt/usertest')
-        assert lxd_container.execute.call_count == 1
-        assert lxd_container.execute.call_args[0] == \
+        assert mocked_execute_streaming.call_count == 1
+        assert mocked_execute_streaming.call_args[0][1:] == \
             (['useradd', '--create-home', '--home-dir', '/opt/usertest', 'usertest'], )
 
-    def test_can_create_a_user_with_a_custom_password(self):
+    def test_can_create_the_missing_users_using_a_single_command(self, mocked_execute_streaming):
+        class DummyGuest(Guest):
+            name = 'dummy'
+
+        def execute(cmd_args):
+            # The batch is run on the host using a fake useradd command failing for "user03".
+            script = 'useradd() { case "$*" in *user03) return 9;; esac; }\n' + cmd_args[2]
+            process = subprocess.Popen(['sh', '-c', script], stdout=subprocess.PIPE)
+            stdout, _ = process.communicate()
+            return process.returncode, stdout.decode(), ''
+
+        lxd_container = unittest.mock.Mock()
+        lxd_container.files.get.return_value = \
+            b'root:x:0:0:root:/root:/bin/bash\nuser01:x:1000:1000::/home/user01:/bin/sh\n'
+        mocked_execute_streaming.command_result.side_effect = execute
+        guest = DummyGuest(lxd_container)
+        results = guest.ensure_users([
+            {'name': 'user01'}, {'name': 'user02', 'home': '/opt/user02'}, {'name': 'user03'}, ])
+        assert results == {'user02': 0, 'user03': 9}
+        assert lxd_container.files.get.call_count == 1
+        assert mocked_execute_streaming.call_count == 1
+        script = mocked_execute_streaming.call_args[0][1][2]
+        assert 'useradd --create-home --home-dir /opt/user02 user02' in script
+        assert 'user01' not in script
+
+    def test_does_not_run_any_command_if_all_the_users_exist(self, mocked_execute_streaming):
+        class DummyGuest(Guest):
+            name = 'dummy'
+        lxd_container = unittest.mock.Mock()
+        lxd_container.files.get.return_value = b'user01:x:1000:1000::/home/user01:/bin/sh\n'
+        guest = DummyGuest(lxd_container)
+        assert guest.ensure_users([{'name': 'user01'}, ]) == {}
+        assert mocked_execute_streaming.call_count == 0
+
+    def test_can_create_a_user_with_a_custom_password(self, mocked_execute_streaming):
         class DummyGuest(Guest):
             name = 'dummy'
         lxd_container = unittest.mock.Mock()
-        lxd_container.execute.return_value = ('ok', 'ok', '')
+        mocked_execute_streaming.command_result.return_value = ('ok', 'ok', '')
         password = '$6$cGzZBkDjOhGW$6C9wwqQteFEY4lQ6ZJBggE568SLSS7bIMKexwOD' \
                    '39mJQrJcZ5vIKJVIfwsKOZajhbPw0.Zqd0jU2NDLAnp9J/1'
         guest = DummyGuest(lxd_container)
         guest.create_user('usertest', password=password)
-        assert lxd_container.execute.call_count == 1
-        assert lxd_container.execute.call_args[0] == \
+        assert mocked_execute_streaming.call_count == 1
+        assert mocked_execute_streaming.call_args[0][1:] == \
             (['useradd', '--create-home', '-p', password, 'usertest'], )
 
-    def test_can_copy_file(self):
+    @unittest.mock.patch('lxdock.guests.base.logger')
+    def test_can_run_commands_and_log_their_output_line_by_line(
+            self, mock_logger, mocked_execute_streaming):
+        class DummyGuest(Guest):
+            name = 'dummy'
+        lxd_container = unittest.mock.Mock()
+        mocked_execute_streaming.command_result.return_value = (1, 'out 1\nout 2\n', 'err 1\n')
+        guest = DummyGuest(lxd_container)
+        guest.output_log = io.BytesIO()
+        assert guest.run(['ls', '/nonexistent']) == 1
+        assert mock_logger.debug.call_args_list == [unittest.mock.call('Running ls /nonexistent'), ]
+        logged = [c[0] for c in mock_logger.log.call_args_list]
+        assert logged == [
+            (logging.DEBUG, 'out 1'), (logging.DEBUG, 'out 2'), (logging.DEBUG, 'err 1')]
+        assert guest.last_stdout == 'out 1\nout 2'
+        assert guest.last_stderr == 'err 1'
+        assert guest.output_log.getvalue() == b'out 1\nout 2\nerr 1\n'
+
+    def test_can_describe_the_failure_of_the_last_command(self, mocked_execute_streaming):
+        class DummyGuest(Guest):
+            name = 'dummy'
+            error_output_max_lines = 2
+        mocked_execute_streaming.command_result.return_value = (1, 'out\n', 'e1\ne2\ne3\n')
+        guest = DummyGuest(unittest.mock.Mock())
+        assert guest.run(['ls', ]) == 1
+        assert guest.get_error_message('ls failed', 1) == 'ls failed (exit code: 1):\n  e2\n  e3'
+
+    @unittest.mock.patch('lxdock.guests.base.logger')
+    def test_reports_the_error_output_of_failed_package_installations(
+            self, mock_logger, mocked_execute_streaming):
+        mocked_execute_streaming.command_result.return_value = (100, '', 'E: Unable to locate\n')
+        guest = DebianGuest(unittest.mock.Mock())
+        guest.install_packages(['dummy', ])
+        assert mock_logger.warning.call_args[0][0] == \
+            'Unable to install packages (exit code: 100):\n  E: Unable to locate'
+
+    def test_handles_the_output_of_commands_with_the_container_name_of_the_calling_thread(self):
         class DummyGuest(Guest):
             name = 'dummy'
+
+        def execute_streaming(container, commands, stdout_handler=None, stderr_handler=None):
+            # The output of the commands is received by another thread, as with LXD websockets.
+            thread = threading.Thread(target=stdout_handler, args=(b'out 1\n', ))
+            thread.start()
+            thread.join()
+            return 0
+
+        container_names = []
+        guest = DummyGuest(unittest.mock.Mock())
+        set_current_container_name('web')
+        try:
+            with unittest.mock.patch(
+                    'lxdock.guests.base.execute_streaming', side_effect=execute_streaming):
+                guest._execute(['ls', ], stdout_callback=lambda line: container_names.append(
+                    getattr(_container_context, 'name', None)))
+        finally:
+            set_current_container_name(None)
+        assert container_names == ['web', ]
+
+    @pytest.mark.parametrize('stop_on_error,exit_codes', [
+        (False, [0, 3, 0]), (True, [0, 3, None])])
+    def test_can_run_batches_of_commands_using_a_single_execution(
+            self, stop_on_error, exit_codes, mocked_execute_streaming):
+        class DummyGuest(Guest):
+            name = 'dummy'
+
+        def execute(cmd_args):
+            # The script of the batch is run on the host in order to get the reported exit codes.
+            process = subprocess.Popen(cmd_args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            stdout, stderr = process.communicate()
+            return process.returncode, stdout.decode(), stderr.decode()
+
         lxd_container = unittest.mock.Mock()
-        lxd_container.execute.return_value = ('ok', 'ok', '')
-        lxd_container.files.put.return_value = True
+        mocked_execute_streaming.command_result.side_effect = execute
         guest = DummyGuest(lxd_container)
+        with tempfile.TemporaryDirectory() as d:
+            with guest.batch(stop_on_error=stop_on_error) as batch:
+                assert isinstance(batch, CommandBatch)
+                batch.write_file('{}/f1'.format(d), 'echo "it\'s $HOME"\n')
+                batch.run(['sh', '-c', 'exit 3'])
+                batch.run(['touch', '{}/f 2'.format(d)])
+            assert mocked_execute_streaming.call_count == 1
+            assert batch.exit_codes == exit_codes
+            with open('{}/f1'.format(d)) as f1:
+                assert f1.read() == 'echo "it\'s $HOME"\n'
+            assert os.path.exists('{}/f 2'.format(d)) is not stop_on_error
+
+    def test_refreshes_the_package_metadata_only_if_it_is_not_fresh(self, mocked_execute_streaming):
+        class DummyGuest(Guest):
+            name = 'dummy'
+            package_metadata_refresh_command = ['echo', 'refreshed', ]
+
+        def execute(cmd_args):
+            # The script is run on the host, using a stamp file stored in a temporary directory.
+            cmd_args = [a.replace('/.lxdock.d', '{}/.lxdock.d'.format(d)) for a in cmd_args]
+            process = subprocess.Popen(cmd_args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            stdout, stderr = process.communicate()
+            return process.returncode, stdout.decode(), stderr.decode()
+
+        lxd_container = unittest.mock.Mock()
+        mocked_execute_streaming.command_result.side_effect = execute
+        guest = DummyGuest(lxd_container)
+        with tempfile.TemporaryDirectory() as d:
+            assert guest.refresh_package_metadata() == 0
+            assert guest.last_stdout == 'refreshed'
+            assert guest.refresh_package_metadata() == 0
+            assert guest.last_stdout != 'refreshed'
+            assert guest.refresh_package_metadata(force=True) == 0
+            assert guest.last_stdout == 'refreshed'
+            guest.package_metadata_max_age = 0
+            assert guest.refresh_package_metadata() == 0
+            assert guest.last_stdout == 'refreshed'
+            DummyGuest.package_metadata_refresh_command = ['false', ]
+            assert guest.refresh_package_metadata() != 0
+
+    def test_can_copy_file(self, mocked_execute_streaming):
+        class DummyGuest(Guest):
+            name = 'dummy'
+        lxd_container = unittest.mock.Mock()
+        mocked_execute_streaming.command_result.return_value = ('ok', 'ok', '')
+        uploaded = {}
+
+        def put(path, data):
+            # The file is streamed in blocks.
+            uploaded[path] = b''.join(iter(lambda: data.read(4), b''))
+
+        lxd_container.files.put.side_effect = put
+        guest = DummyGuest(lxd_container)
+        progress = unittest.mock.Mock()
         with tempfile.NamedTemporaryFile() as f:
             f.write(b'dummy file')
             f.flush()
-            guest.copy_file(pathlib.Path(f.name), pathlib.PurePath('/a/b/c'))
-        assert lxd_container.execute.call_count == 1
-        assert lxd_container.execute.call_args[0] == (['mkdir', '-p', '/a/b'], )
+            guest.copy_file(pathlib.Path(f.name), pathlib.PurePath('/a/b/c'), progress=progress)
+        assert mocked_execute_streaming.call_count == 1
+        assert mocked_execute_streaming.call_args[0][1:] == (['mkdir', '-p', '/a/b'], )
         assert lxd_container.files.put.call_count == 1
-        assert lxd_container.files.put.call_args[0] == ('/a/b/c', b'dummy file')
+        assert uploaded == {'/a/b/c': b'dummy file'}
+        assert progress.call_args_list[-1][0] == (10, 10)
 
-    @unittest.mock.patch('tarfile.TarFile.add')
-    @unittest.mock.patch('tarfile.TarFile.close')
-    def test_can_copy_directory(self, mock_close, mock_add):
+    @pytest.mark.parametrize(
+        'compression,tar_flags', [(None, '-xf'), ('gz', '-xzf'), ('bz2', '-xjf')])
+    def test_can_copy_directory(self, compression, tar_flags, mocked_execute_streaming):
         class DummyGuest(Guest):
             name = 'dummy'
         lxd_container = unittest.mock.Mock()
-        lxd_container.execute.return_value = ('ok', 'ok', '')
-        lxd_container.files.put.return_value = True
+        mocked_execute_streaming.command_result.return_value = ('ok', 'ok', '')
         guest = DummyGuest(lxd_container)
         with tempfile.TemporaryDirectory() as d:
             os.mkdir('{}/d1'.format(d))
@@ -109,23 +302,132 @@ class TestGuest:
                 f2.write(b'dummy f2')
             with open('{}/f3'.format(d), 'wb') as f3:
                 f3.write(b'dummy f3')
-            guest.copy_directory(pathlib.Path(d), pathlib.PurePosixPath('/a/b/c'))
+            with unittest.mock.patch('lxdock.guests.base.ExecChannel') as mock_channel:
+                mock_channel.return_value.close.return_value = 0
+                guest.copy_directory(
+                    pathlib.Path(d), pathlib.PurePosixPath('/a/b/c'), compression=compression)
 
-        assert mock_add.call_count == 1
-        assert mock_add.call_args[0][0] == str(pathlib.Path(d))
-        assert mock_add.call_args[1]['arcname'] == '.'
+        assert mocked_execute_streaming.call_count == 1
+        assert mocked_execute_streaming.call_args_list[0][0][1:] == (['mkdir', '-p', '/a/b/c'], )
+        # The tarball is streamed to the standard input of tar: it is never written on the guest.
+        assert mock_channel.call_args[0] == (lxd_container, ['tar', tar_flags, '-', '-C', '/a/b/c'])
+        assert lxd_container.files.put.call_count == 0
+        assert mock_channel.return_value.close.call_count == 1
+        data = b''.join(c[0][0] for c in mock_channel.return_value.send.call_args_list)
+        tar = tarfile.open(fileobj=io.BytesIO(data))
+        assert sorted(tar.getnames()) == ['.', './d1', './d1/d2', './d1/d2/f2', './d1/f1', './f3']
+        assert tar.extractfile('./d1/d2/f2').read() == b'dummy f2'
 
-        assert mock_close.call_count == 1
+    def test_can_exclude_files_when_copying_a_directory(self, mocked_execute_streaming):
+        class DummyGuest(Guest):
+            name = 'dummy'
+        lxd_container = unittest.mock.Mock()
+        guest = DummyGuest(lxd_container)
+        with tempfile.TemporaryDirectory() as d:
+            os.makedirs(os.path.join(d, '.git', 'objects'))
+            os.makedirs(os.path.join(d, 'build'))
+            for name in ('f1', 'f2.log', 'build/f3'):
+                open(os.path.join(d, name), 'w').close()
+            with open(os.path.join(d, '.lxdockignore'), 'w') as f:
+                f.write('*.log\n')
+            with unittest.mock.patch('lxdock.guests.base.ExecChannel') as mock_channel:
+                mock_channel.return_value.close.return_value = 0
+                guest.copy_directory(
+                    pathlib.Path(d), pathlib.PurePosixPath('/a/b/c'), exclude=['.git/', 'build'])
+        data = b''.join(c[0][0] for c in mock_channel.return_value.send.call_args_list)
+        tar = tarfile.open(fileobj=io.BytesIO(data))
+        assert sorted(tar.getnames()) == ['.', './.lxdockignore', './f1']
 
-        print(lxd_container.execute.call_args_list)
-        assert lxd_container.execute.call_count == 4
-        assert lxd_container.execute.call_args_list[0][0] == (['mkdir', '-p', '/a/b/c'], )
-        assert lxd_container.execute.call_args_list[1][0] == ([
-            'mkdir', '-p', str(pathlib.PurePosixPath(guest._guest_temporary_tar_path).parent)], )
-        assert lxd_container.execute.call_args_list[2][0] == ([
-            'tar', '-xf', guest._guest_temporary_tar_path, '-C', '/a/b/c'], )
-        assert lxd_container.execute.call_args_list[3][0] == ([
-            'rm', '-f', guest._guest_temporary_tar_path], )
+    def test_can_synchronize_only_the_files_that_changed(self, mocked_execute_streaming):
+        class DummyGuest(Guest):
+            name = 'dummy'
+        guest_files = {}
 
-        assert lxd_container.files.put.call_count == 1
-        assert lxd_container.files.put.call_args[0][0] == guest._guest_temporary_tar_path
+        def get(path):
+            if path not in guest_files:
+                raise NotFound(response=unittest.mock.Mock())
+            return guest_files[path]
+
+        def put(path, data):
+            guest_files[path] = data
+
+        channels = []
+
+        def exec_channel(container, cmd_args, stderr_handler=None):
+            channel = unittest.mock.Mock()
+            channel.close.return_value = 0
+            channels.append((cmd_args, channel))
+            return channel
+
+        def sent_data(channel):
+            return b''.join(c[0][0] for c in channel.send.call_args_list)
+
+        lxd_container = unittest.mock.Mock()
+        mocked_execute_streaming.command_result.return_value = (0, '', '')
+        lxd_container.files.get.side_effect = get
+        lxd_container.files.put.side_effect = put
+        guest = DummyGuest(lxd_container)
+        with tempfile.TemporaryDirectory() as d, \
+                unittest.mock.patch('lxdock.guests.base.ExecChannel', exec_channel):
+            for name in ('f1', 'f2', 'f3'):
+                with open(os.path.join(d, name), 'wb') as f:
+                    f.write(name.encode())
+
+            # The whole directory is copied the first time; the tarball is streamed to tar.
+            guest.sync_directory(pathlib.Path(d), pathlib.PurePosixPath('/a/b/c'))
+            assert [c[0] for c in channels] == [['tar', '-xf', '-', '-C', '/a/b/c'], ]
+            tar = tarfile.open(fileobj=io.BytesIO(sent_data(channels[0][1])))
+            assert sorted(tar.getnames()) == ['./f1', './f2', './f3']
+            # Only the manifest is written on the guest.
+            assert len(guest_files) == 1
+            manifest_path = next(p for p in guest_files if p.endswith('.json'))
+            guest_files[manifest_path] = guest_files[manifest_path].encode('utf-8')
+
+            # Nothing is transferred if nothing changed.
+            channels.clear()
+            lxd_container.reset_mock()
+            mocked_execute_streaming.reset_mock()
+            guest.sync_directory(pathlib.Path(d), pathlib.PurePosixPath('/a/b/c'))
+            assert lxd_container.files.put.call_count == 0
+            assert mocked_execute_streaming.call_count == 1
+            assert channels == []
+
+            # Only changed files are transferred and deleted files are removed. The deleted paths
+            # are sent to the standard input of xargs.
+            lxd_container.reset_mock()
+            mocked_execute_streaming.reset_mock()
+            with open(os.path.join(d, 'f2'), 'wb') as f:
+                f.write(b'changed')
+            os.unlink(os.path.join(d, 'f3'))
+            guest.sync_directory(pathlib.Path(d), pathlib.PurePosixPath('/a/b/c'))
+            assert [c[0] for c in channels] == [
+                ['sh', '-c', 'cd "$1" && xargs -0 rm -rf --', 'sh', '/a/b/c'],
+                ['tar', '-xf', '-', '-C', '/a/b/c'],
+            ]
+            assert sent_data(channels[0][1]) == b'f3\0'
+            tar = tarfile.open(fileobj=io.BytesIO(sent_data(channels[1][1])))
+            assert tar.getnames() == ['./f2']
+            assert lxd_container.files.put.call_args[0][0] == manifest_path
+
+    @unittest.mock.patch('lxdock.guests.base.logger')
+    def test_does_not_store_the_manifest_if_the_synchronization_fails(
+            self, mock_logger, mocked_execute_streaming):
+        class DummyGuest(Guest):
+            name = 'dummy'
+        lxd_container = unittest.mock.Mock()
+        lxd_container.files.get.side_effect = NotFound(response=unittest.mock.Mock())
+        guest = DummyGuest(lxd_container)
+        with tempfile.TemporaryDirectory() as d:
+            open(os.path.join(d, 'f1'), 'w').close()
+            with unittest.mock.patch('lxdock.guests.base.ExecChannel') as mock_channel:
+                mock_channel.return_value.close.return_value = 2
+
+                def send(data):
+                    mock_channel.call_args[1]['stderr_handler'](b'tar: write error\n')
+
+                mock_channel.return_value.send.side_effect = send
+                guest.sync_directory(pathlib.Path(d), pathlib.PurePosixPath('/a/b/c'))
+        assert lxd_container.files.put.call_count == 0
+        assert mock_logger.warning.call_args[0][0] == (
+            'Unable to synchronize host:{} to guest:/a/b/c (exit code: 2):\n'
+            '  tar: write error'.format(d))
@@ -4,13 +4,49 @@ from lxdock.guests import DebianGuest
 
 
 class TestDebianGuest:
-    def test_can_install_packages(self):
+    def test_can_install_packages(self, mocked_execute_streaming):
         lxd_container = unittest.mock.Mock()
-        lxd_container.execute.return_value = ('ok', 'ok', '')
+        mocked_execute_streaming.command_result.return_value = ('ok', 'ok', '')
         guest = DebianGuest(lxd_container)
         guest.install_packages(['python', 'openssh', ])
-        assert lxd_container.execute.call_count == 2
-        assert lxd_container.execute.call_args_list[0][0] == \
-            (['apt-get', 'update', ], )
-        assert lxd_container.execute.call_args_list[1][0] == \
+        assert mocked_execute_streaming.call_count == 3
+        assert mocked_execute_streaming.call_args_list[0][0][1:] == ([
+            'dpkg-query', '--show', '--showformat', '${Package} ${Status}\\n', 'python', 'openssh',
+        ], )
+        assert '\napt-get update || exit $?\n' in \
+            mocked_execute_streaming.call_args_list[1][0][1][2]
+        assert mocked_execute_streaming.call_args_list[2][0][1:] == \
             (['apt-get', 'install', '-y', 'python', 'openssh', ], )
+
+    def test_only_installs_the_packages_that_are_not_installed_yet(self, mocked_execute_streaming):
+        lxd_container = unittest.mock.Mock()
+        mocked_execute_streaming.command_result.return_value = (
+            1, 'python install ok installed\nopenssh deinstall ok config-files\n', '')
+        guest = DebianGuest(lxd_container)
+        guest.install_packages(['python', 'openssh', ])
+        assert mocked_execute_streaming.call_count == 3
+        assert mocked_execute_streaming.call_args_list[2][0][1:] == \
+            (['apt-get', 'install', '-y', 'openssh', ], )
+
+    def test_does_not_run_the_package_manager_if_all_the_packages_are_installed(
+            self, mocked_execute_streaming):
+        lxd_container = unittest.mock.Mock()
+        mocked_execute_streaming.command_result.return_value = (
+            0, 'python install ok installed\nopenssh install ok installed\n', '')
+        guest = DebianGuest(lxd_container)
+        guest.install_packages(['python', 'openssh', ])
+        assert mocked_execute_streaming.call_count == 1
+
+    def test_can_configure_apt_to_use_a_proxy(self):
+        lxd_container = unittest.mock.Mock()
+        guest = DebianGuest(lxd_container)
+        guest.configure_package_proxy('http://10.0.3.1:3142')
+        assert lxd_container.files.put.call_args[0] == (
+            '/etc/apt/apt.conf.d/01lxdock-proxy', 'Acquire::http::Proxy "http://10.0.3.1:3142";\n')
+
+    def test_can_remove_the_proxy_of_apt(self, mocked_execute_streaming):
+        lxd_container = unittest.mock.Mock()
+        guest = DebianGuest(lxd_container)
+        guest.remove_package_proxy()
+        assert mocked_execute_streaming.call_args[0][1:] == \
+            (['rm', '-f', '/etc/apt/apt.conf.d/01lxdock-proxy', ], )
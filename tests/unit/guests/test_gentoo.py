@@ -1,30 +1,49 @@
+import os
+import subprocess
+import tempfile
 import unittest.mock
 
 from lxdock.guests import GentooGuest
 
 
 class TestGentooGuest:
-    def test_should_install_packages_if_not_installed(self):
-        lxd_container = unittest.mock.Mock()
-        # Retcode 1: "No installed packages matching {keyword}"
-        lxd_container.execute.return_value = (1, 'ok', '')
-        guest = GentooGuest(lxd_container)
-        guest.install_packages(['python', 'openssh', ])
-        assert lxd_container.execute.call_count == 5
-        assert lxd_container.execute.call_args_list[0][0] == \
-            (['emerge', 'app-portage/gentoolkit'], )
-        for i, p in enumerate(['python', 'openssh', ]):
-            assert lxd_container.execute.call_args_list[2 * i + 1][0] == (['equery', 'list', p], )
-            assert lxd_container.execute.call_args_list[2 * i + 2][0] == (['emerge', p], )
+    def get_guest(self, mocked_execute_streaming, vardb_path):
+        def execute(cmd_args):
+            # The commands are run on the host, using a fake Portage database.
+            if cmd_args[0] != 'sh':
+                return 0, '', ''
+            cmd_args = [a.replace('/var/db/pkg', vardb_path) for a in cmd_args]
+            process = subprocess.Popen(cmd_args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            stdout, stderr = process.communicate()
+            return process.returncode, stdout.decode(), stderr.decode()
 
-    def test_should_not_reinstall_packages_if_already_installed(self):
-        lxd_container = unittest.mock.Mock()
-        # Retcode 0: the package has been found locally
-        lxd_container.execute.return_value = (0, 'ok', '')
-        guest = GentooGuest(lxd_container)
-        guest.install_packages(['python', 'openssh', ])
-        assert lxd_container.execute.call_count == 3
-        assert lxd_container.execute.call_args_list[0][0] == \
-            (['emerge', 'app-portage/gentoolkit'], )
-        for i, p in enumerate(['python', 'openssh', ]):
-            assert lxd_container.execute.call_args_list[i + 1][0] == (['equery', 'list', p], )
+        mocked_execute_streaming.command_result.side_effect = execute
+        return GentooGuest(unittest.mock.Mock())
+
+    def test_can_tell_which_packages_are_installed_using_a_single_command(
+            self, mocked_execute_streaming):
+        with tempfile.TemporaryDirectory() as d:
+            os.makedirs('{}/dev-lang/python-exec-2.4.4'.format(d))
+            os.makedirs('{}/app-portage/gentoolkit-0.3.3'.format(d))
+            guest = self.get_guest(mocked_execute_streaming, d)
+            assert guest.installed_packages(
+                ['dev-lang/python', 'net-misc/openssh', 'gentoolkit', 'python-exec']) == \
+                {'gentoolkit', 'python-exec'}
+        assert mocked_execute_streaming.call_count == 1
+
+    def test_should_install_packages_if_not_installed(self, mocked_execute_streaming):
+        with tempfile.TemporaryDirectory() as d:
+            os.makedirs('{}/dev-lang/python-3.5.3'.format(d))
+            guest = self.get_guest(mocked_execute_streaming, d)
+            guest.install_packages(['dev-lang/python', 'net-misc/openssh', ])
+        assert mocked_execute_streaming.call_count == 2
+        assert mocked_execute_streaming.call_args_list[1][0][1:] == \
+            (['emerge', '--noreplace', 'net-misc/openssh', ], )
+
+    def test_should_not_reinstall_packages_if_already_installed(self, mocked_execute_streaming):
+        with tempfile.TemporaryDirectory() as d:
+            os.makedirs('{}/dev-lang/python-3.5.3'.format(d))
+            os.makedirs('{}/net-misc/openssh-7.5_p1-r1'.format(d))
+            guest = self.get_guest(mocked_execute_streaming, d)
+            guest.install_packages(['dev-lang/python', 'net-misc/openssh', ])
+        assert mocked_execute_streaming.call_count == 1
@@ -4,11 +4,33 @@ from lxdock.guests import OpenSUSEGuest
 
 
 class TestOpenSUSEGuest:
-    def test_can_install_packages(self):
+    def test_can_install_packages(self, mocked_execute_streaming):
         lxd_container = unittest.mock.Mock()
-        lxd_container.execute.return_value = ('ok', 'ok', '')
+        mocked_execute_streaming.command_result.return_value = ('ok', 'ok', '')
         guest = OpenSUSEGuest(lxd_container)
         guest.install_packages(['python', 'openssh', ])
-        assert lxd_container.execute.call_count == 1
-        assert lxd_container.execute.call_args[0] == \
-            (['zypper', '--non-interactive', 'install', 'python', 'openssh', ], )
+        assert mocked_execute_streaming.call_count == 3
+        assert mocked_execute_streaming.call_args_list[0][0][1:] == \
+            (['rpm', '-q', '--queryformat', '%{NAME}\\n', 'python', 'openssh', ], )
+        assert '\nzypper --non-interactive refresh || exit $?\n' in \
+            mocked_execute_streaming.call_args_list[1][0][1][2]
+        assert mocked_execute_streaming.call_args_list[2][0][1:] == \
+            (['zypper', '--non-interactive', '--no-refresh', 'install', 'python', 'openssh', ], )
+
+    def test_only_installs_the_packages_that_are_not_installed_yet(self, mocked_execute_streaming):
+        lxd_container = unittest.mock.Mock()
+        mocked_execute_streaming.command_result.return_value = (
+            1, 'python\npackage openssh is not installed\n', '')
+        guest = OpenSUSEGuest(lxd_container)
+        guest.install_packages(['python', 'openssh', ])
+        assert mocked_execute_streaming.call_count == 3
+        assert mocked_execute_streaming.call_args_list[2][0][1:] == \
+            (['zypper', '--non-interactive', '--no-refresh', 'install', 'openssh', ], )
+
+    def test_does_not_run_the_package_manager_if_all_the_packages_are_installed(
+            self, mocked_execute_streaming):
+        lxd_container = unittest.mock.Mock()
+        mocked_execute_streaming.command_result.return_value = (0, 'python\nopenssh\n', '')
+        guest = OpenSUSEGuest(lxd_container)
+        guest.install_packages(['python', 'openssh', ])
+        assert mocked_execute_streaming.call_count == 1
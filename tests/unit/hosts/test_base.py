@@ -7,6 +7,7 @@ import pytest
 
 from lxdock.hosts import Host
 from lxdock.hosts.base import InvalidHost
+from lxdock.utils.acl import AclNotSupported
 
 
 class TestGuest:
@@ -53,3 +54,30 @@ class TestGuest:
         assert mocked_call.call_args[0] == (
             'setfacl -Rm user:lxd:rwx,default:user:lxd:rwx,user:19958953:rwx,default:user:19958953'
             ':rwx .',)
+
+    @unittest.mock.patch('lxdock.hosts.base.give_users_access_to_tree')
+    @unittest.mock.patch('os.stat')
+    def test_can_give_current_and_mapped_users_access_to_share_in_a_single_pass(
+            self, mocked_stat, mocked_give_access):
+        class MockedContainer(object):
+            name = 'test'
+        mocked_stat.return_value = unittest.mock.MagicMock(st_uid=19958953)
+        host = Host(MockedContainer())
+        host.give_access_to_share('.', mapped_userpaths=[None, '/home/test'])
+        assert mocked_give_access.call_count == 1
+        assert mocked_give_access.call_args[1]['default_uids'] == [os.getuid(), ]
+        assert mocked_give_access.call_args[1]['access_uids'][:2] == [19958953, 19958953]
+
+    @unittest.mock.patch('subprocess.Popen')
+    @unittest.mock.patch('lxdock.hosts.base.give_users_access_to_tree')
+    @unittest.mock.patch('os.stat')
+    def test_can_fall_back_to_setfacl_if_acl_cannot_be_set_natively(
+            self, mocked_stat, mocked_give_access, mocked_call):
+        class MockedContainer(object):
+            name = 'test'
+        mocked_stat.return_value = unittest.mock.MagicMock(st_uid=19958953)
+        mocked_give_access.side_effect = AclNotSupported()
+        host = Host(MockedContainer())
+        host.give_access_to_share('.', mapped_userpaths=[None, ])
+        assert mocked_call.call_count == 2
+        assert mocked_call.call_args_list[0][0][0] == 'setfacl -Rdm u:{}:rwX .'.format(os.getuid())
@@ -51,16 +51,17 @@ class TestAnsibleProvisioner:
             'ANSIBLE_HOST_KEY_CHECKING=False ansible-playbook --inventory-file /[/\w]+ '
             '--ask-vault-pass ./deploy.yml', mock_popen.call_args[0][0])
 
-    def test_can_properly_setup_ssh_for_alpine_guests(self):
+    def test_can_properly_setup_ssh_for_alpine_guests(self, mocked_execute_streaming):
         lxd_container = unittest.mock.Mock()
-        lxd_container.execute.return_value = ('ok', 'ok', '')
+        mocked_execute_streaming.command_result.return_value = ('ok', 'ok', '')
         host = Host(unittest.mock.Mock())
         guest = AlpineGuest(lxd_container)
         provisioner = AnsibleProvisioner('./', host, guest, {'playbook': 'deploy.yml'})
         provisioner.setup()
-        assert lxd_container.execute.call_count == 4
-        assert lxd_container.execute.call_args_list[0][0] == (['apk', 'update'], )
-        assert lxd_container.execute.call_args_list[1][0] == \
+        assert mocked_execute_streaming.call_count == 4
+        assert '\napk update || exit $?\n' in mocked_execute_streaming.call_args_list[1][0][1][2]
+        assert mocked_execute_streaming.call_args_list[2][0][1:] == \
             (['apk', 'add'] + AnsibleProvisioner.guest_required_packages_alpine, )
-        assert lxd_container.execute.call_args_list[2][0] == (['rc-update', 'add', 'sshd'], )
-        assert lxd_container.execute.call_args_list[3][0] == (['/etc/init.d/sshd', 'start'], )
+        script = mocked_execute_streaming.call_args_list[3][0][1][2]
+        assert 'rc-update add sshd\n' in script
+        assert '/etc/init.d/sshd start\n' in script
@@ -20,7 +20,8 @@ class TestProvisioner:
                 name = 'myprovisioner'
                 schema = None
 
-    def test_trigger_packages_installation_on_the_guest_if_the_related_attr_is_defined(self):
+    def test_trigger_packages_installation_on_the_guest_if_the_related_attr_is_defined(
+            self, mocked_execute_streaming):
         class DummyProvisioner(Provisioner):
             name = 'myprovisioner'
             schema = {'test': 'test', }
@@ -28,18 +29,19 @@ class TestProvisioner:
             guest_required_packages_debian = ['test01', 'test02', ]
 
         lxd_container = unittest.mock.Mock()
-        lxd_container.execute.return_value = ('ok', 'ok', '')
+        mocked_execute_streaming.command_result.return_value = ('ok', 'ok', '')
         host = unittest.mock.Mock()
         guest = DebianGuest(lxd_container)
         provisioner = DummyProvisioner('./', host, guest, {})
         provisioner.setup()
-        assert lxd_container.execute.call_count == 2
-        assert lxd_container.execute.call_args_list[0][0] == \
-            (['apt-get', 'update'], )
-        assert lxd_container.execute.call_args_list[1][0] == \
+        assert mocked_execute_streaming.call_count == 3
+        assert '\napt-get update || exit $?\n' in \
+            mocked_execute_streaming.call_args_list[1][0][1][2]
+        assert mocked_execute_streaming.call_args_list[2][0][1:] == \
             (['apt-get', 'install', '-y', 'test01', 'test02', ], )
 
-    def test_trigger_specific_setup_on_the_guest_if_the_related_method_is_defined(self):
+    def test_trigger_specific_setup_on_the_guest_if_the_related_method_is_defined(
+            self, mocked_execute_streaming):
         class DummyProvisioner(Provisioner):
             name = 'myprovisioner'
             schema = {'test': 'test', }
@@ -49,7 +51,7 @@ class TestProvisioner:
                 self.called = True
 
         lxd_container = unittest.mock.Mock()
-        lxd_container.execute.return_value = ('ok', 'ok', '')
+        mocked_execute_streaming.command_result.return_value = ('ok', 'ok', '')
         host = unittest.mock.Mock()
         guest = DebianGuest(lxd_container)
         provisioner = DummyProvisioner('./', host, guest, {})
@@ -53,9 +53,28 @@ class TestPuppetProvisionerSchema:
 
 
 class TestPuppetProvisioner:
-    @unittest.mock.patch.object(Guest, 'copy_directory')
+    @unittest.mock.patch.object(Guest, 'sync_directory')
     @unittest.mock.patch.object(Guest, 'run')
-    def test_can_run_puppet_manifest_mode(self, mock_run, mock_copy_dir):
+    def test_can_exclude_files_from_synchronized_directories(self, mock_run, mock_sync_dir):
+        class DummyGuest(Guest):
+            name = 'dummy'
+        host = Host(unittest.mock.Mock())
+        guest = DummyGuest(unittest.mock.Mock())
+        mock_run.return_value = 0
+        provisioner = PuppetProvisioner('./', host, guest, {
+            'manifest_file': 'test_site.pp',
+            'manifests_path': 'test_manifests',
+            'module_path': 'test_modules',
+            'exclude': ['.git/', ]})
+        provisioner.provision()
+
+        assert mock_sync_dir.call_count == 2
+        assert mock_sync_dir.call_args_list[0][1] == {'exclude': ['.git/', ]}
+        assert mock_sync_dir.call_args_list[1][1] == {'exclude': ['.git/', ]}
+
+    @unittest.mock.patch.object(Guest, 'sync_directory')
+    @unittest.mock.patch.object(Guest, 'run')
+    def test_can_run_puppet_manifest_mode(self, mock_run, mock_sync_dir):
         class DummyGuest(Guest):
             name = 'dummy'
         host = Host(unittest.mock.Mock())
@@ -66,9 +85,9 @@ class TestPuppetProvisioner:
             'manifests_path': 'test_manifests'})
         provisioner.provision()
 
-        assert mock_copy_dir.call_count == 1
-        assert mock_copy_dir.call_args_list[0][0][0] == Path('test_manifests')
-        assert mock_copy_dir.call_args_list[0][0][1] == PurePosixPath(
+        assert mock_sync_dir.call_count == 1
+        assert mock_sync_dir.call_args_list[0][0][0] == Path('test_manifests')
+        assert mock_sync_dir.call_args_list[0][0][1] == PurePosixPath(
             provisioner._guest_manifests_path)
 
         assert mock_run.call_count == 2
@@ -79,9 +98,9 @@ class TestPuppetProvisioner:
                 PurePosixPath(provisioner._guest_manifests_path),
                 PurePosixPath(provisioner._guest_manifests_path) / 'test_site.pp')]
 
-    @unittest.mock.patch.object(Guest, 'copy_directory')
+    @unittest.mock.patch.object(Guest, 'sync_directory')
     @unittest.mock.patch.object(Guest, 'run')
-    def test_can_run_puppet_environment_mode(self, mock_run, mock_copy_dir):
+    def test_can_run_puppet_environment_mode(self, mock_run, mock_sync_dir):
         class DummyGuest(Guest):
             name = 'dummy'
         host = Host(unittest.mock.Mock())
@@ -92,9 +111,9 @@ class TestPuppetProvisioner:
             'environment_path': 'test_environments'})
         provisioner.provision()
 
-        assert mock_copy_dir.call_count == 1
-        assert mock_copy_dir.call_args_list[0][0][0] == Path('test_environments')
-        assert mock_copy_dir.call_args_list[0][0][1] == PurePosixPath(
+        assert mock_sync_dir.call_count == 1
+        assert mock_sync_dir.call_args_list[0][0][0] == Path('test_environments')
+        assert mock_sync_dir.call_args_list[0][0][1] == PurePosixPath(
             provisioner._guest_environment_path)
 
         assert mock_run.call_count == 2
@@ -106,6 +125,22 @@ class TestPuppetProvisioner:
                 PurePosixPath(provisioner._guest_environment_path),
                 'test_production')]
 
+    @unittest.mock.patch('lxdock.provisioners.puppet.logger')
+    @unittest.mock.patch.object(Guest, 'sync_directory')
+    def test_reports_the_error_output_of_puppet_if_it_fails(
+            self, mock_sync_dir, mock_logger, mocked_execute_streaming):
+        class DummyGuest(Guest):
+            name = 'dummy'
+        mocked_execute_streaming.command_result.side_effect = [
+            (0, '/usr/bin/puppet\n', ''), (4, '', 'Error: dummy failure\n'), ]
+        guest = DummyGuest(unittest.mock.Mock())
+        provisioner = PuppetProvisioner('./', Host(unittest.mock.Mock()), guest, {
+            'manifest_file': 'test_site.pp',
+            'manifests_path': 'test_manifests'})
+        provisioner.provision()
+        assert mock_logger.warning.call_args[0][0] == \
+            'Puppet failed (exit code: 4):\n  Error: dummy failure'
+
     @unittest.mock.patch.object(Guest, 'copy_file')
     @unittest.mock.patch.object(Guest, 'run')
     def test_raise_error_if_puppet_is_not_found(self, mock_run, mock_copy_file):
@@ -123,9 +158,9 @@ class TestPuppetProvisioner:
         assert mock_run.call_args[0] == (['which', 'puppet'], )
         assert mock_copy_file.call_count == 0
 
-    @unittest.mock.patch.object(Guest, 'copy_directory')
+    @unittest.mock.patch.object(Guest, 'sync_directory')
     @unittest.mock.patch.object(Guest, 'run')
-    def test_can_set_binary_path(self, mock_run, mock_copy_dir):
+    def test_can_set_binary_path(self, mock_run, mock_sync_dir):
         class DummyGuest(Guest):
             name = 'dummy'
         host = Host(unittest.mock.Mock())
@@ -145,9 +180,9 @@ class TestPuppetProvisioner:
                 PurePosixPath(provisioner._guest_manifests_path),
                 PurePosixPath(provisioner._guest_manifests_path) / 'test_site.pp')]
 
-    @unittest.mock.patch.object(Guest, 'copy_directory')
+    @unittest.mock.patch.object(Guest, 'sync_directory')
     @unittest.mock.patch.object(Guest, 'run')
-    def test_can_set_facter(self, mock_run, mock_copy_dir):
+    def test_can_set_facter(self, mock_run, mock_sync_dir):
         class DummyGuest(Guest):
             name = 'dummy'
         host = Host(unittest.mock.Mock())
@@ -167,9 +202,9 @@ class TestPuppetProvisioner:
                 PurePosixPath(provisioner._guest_manifests_path) / 'site.pp')]
 
     @unittest.mock.patch.object(Guest, 'copy_file')
-    @unittest.mock.patch.object(Guest, 'copy_directory')
+    @unittest.mock.patch.object(Guest, 'sync_directory')
     @unittest.mock.patch.object(Guest, 'run')
-    def test_can_set_hiera_config_path(self, mock_run, mock_copy_dir, mock_copy_file):
+    def test_can_set_hiera_config_path(self, mock_run, mock_sync_dir, mock_copy_file):
         class DummyGuest(Guest):
             name = 'dummy'
         host = Host(unittest.mock.Mock())
@@ -194,9 +229,9 @@ class TestPuppetProvisioner:
                 PurePosixPath(provisioner._guest_manifests_path),
                 PurePosixPath(provisioner._guest_manifests_path) / 'site.pp')]
 
-    @unittest.mock.patch.object(Guest, 'copy_directory')
+    @unittest.mock.patch.object(Guest, 'sync_directory')
     @unittest.mock.patch.object(Guest, 'run')
-    def test_can_set_module_path(self, mock_run, mock_copy_dir):
+    def test_can_set_module_path(self, mock_run, mock_sync_dir):
         class DummyGuest(Guest):
             name = 'dummy'
         host = Host(unittest.mock.Mock())
@@ -208,11 +243,11 @@ class TestPuppetProvisioner:
             'module_path': 'test-puppet-modules'})
         provisioner.provision()
 
-        assert mock_copy_dir.call_count == 2
+        assert mock_sync_dir.call_count == 2
         assert (Path('test-puppet-modules'),
                 PurePosixPath(provisioner._guest_module_path)) in {
-                    mock_copy_dir.call_args_list[0][0],
-                    mock_copy_dir.call_args_list[1][0]}
+                    mock_sync_dir.call_args_list[0][0],
+                    mock_sync_dir.call_args_list[1][0]}
 
         assert mock_run.call_count == 2
         assert mock_run.call_args_list[1][0][0] == [
@@ -223,9 +258,9 @@ class TestPuppetProvisioner:
                 PurePosixPath(provisioner._guest_manifests_path),
                 PurePosixPath(provisioner._guest_manifests_path) / 'mani.pp')]
 
-    @unittest.mock.patch.object(Guest, 'copy_directory')
+    @unittest.mock.patch.object(Guest, 'sync_directory')
     @unittest.mock.patch.object(Guest, 'run')
-    def test_can_set_environment_variables(self, mock_run, mock_copy_dir):
+    def test_can_set_environment_variables(self, mock_run, mock_sync_dir):
         class DummyGuest(Guest):
             name = 'dummy'
         host = Host(unittest.mock.Mock())
@@ -244,9 +279,9 @@ class TestPuppetProvisioner:
                 PurePosixPath(provisioner._guest_manifests_path),
                 PurePosixPath(provisioner._guest_manifests_path) / 'site.pp')]
 
-    @unittest.mock.patch.object(Guest, 'copy_directory')
+    @unittest.mock.patch.object(Guest, 'sync_directory')
     @unittest.mock.patch.object(Guest, 'run')
-    def test_can_set_options(self, mock_run, mock_copy_dir):
+    def test_can_set_options(self, mock_run, mock_sync_dir):
         class DummyGuest(Guest):
             name = 'dummy'
         host = Host(unittest.mock.Mock())
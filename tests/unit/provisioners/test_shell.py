@@ -1,6 +1,7 @@
+import logging
 import unittest.mock
 
-from lxdock.guests import DebianGuest
+from lxdock.guests import DebianGuest, Guest
 from lxdock.hosts import Host
 from lxdock.provisioners import ShellProvisioner
 
@@ -18,17 +19,17 @@ class TestShellProvisioner:
         assert mock_popen.call_args[0] == (
             """sh -c 'touch f && echo "Here'"'"'s the PATH" $PATH >> /tmp/test.txt'""", )
 
-    def test_can_run_commands_on_the_guest_side(self):
+    def test_can_run_commands_on_the_guest_side(self, mocked_execute_streaming):
         lxd_container = unittest.mock.Mock()
-        lxd_container.execute.return_value = ('ok', 'ok', '')
+        mocked_execute_streaming.command_result.return_value = (0, 'ok', '')
         host = Host(unittest.mock.Mock())
         guest = DebianGuest(lxd_container)
         cmd = """touch f && echo "Here's the PATH" $PATH >> /tmp/test.txt"""
         provisioner = ShellProvisioner(
             './', host, guest, {'inline': cmd})
         provisioner.provision()
-        assert lxd_container.execute.call_count == 1
-        assert lxd_container.execute.call_args_list[0][0] == (['sh', '-c', cmd], )
+        assert mocked_execute_streaming.call_count == 1
+        assert mocked_execute_streaming.call_args_list[0][0][1:] == (['sh', '-c', cmd], )
 
     @unittest.mock.patch('subprocess.Popen')
     def test_can_run_a_script_on_the_host_side(self, mock_popen):
@@ -39,15 +40,37 @@ class TestShellProvisioner:
         provisioner.provision()
         assert mock_popen.call_args[0] == ('./test.sh', )
 
-    @unittest.mock.patch('builtins.open')
-    def test_can_run_a_script_on_the_guest_side(self, mock_open):
+    @unittest.mock.patch.object(Guest, 'put_file')
+    def test_can_run_a_script_on_the_guest_side(self, mock_put_file, mocked_execute_streaming):
         lxd_container = unittest.mock.Mock()
-        lxd_container.execute.return_value = ('ok', 'ok', '')
+        mocked_execute_streaming.command_result.return_value = (0, 'ok', '')
         host = Host(unittest.mock.Mock())
         guest = DebianGuest(lxd_container)
         provisioner = ShellProvisioner(
             './', host, guest, {'script': 'test.sh', })
         provisioner.provision()
-        assert lxd_container.execute.call_count == 2
-        assert lxd_container.execute.call_args_list[0][0] == (['chmod', '+x', '/tmp/test.sh', ], )
-        assert lxd_container.execute.call_args_list[1][0] == (['/tmp/test.sh', ], )
+        assert mock_put_file.call_count == 1
+        assert mock_put_file.call_args[0][1] == '/tmp/test.sh'
+        assert mocked_execute_streaming.call_count == 2
+        assert mocked_execute_streaming.call_args_list[0][0][1:] == \
+            (['chmod', '+x', '/tmp/test.sh', ], )
+        assert mocked_execute_streaming.call_args_list[1][0][1:] == (['/tmp/test.sh', ], )
+
+    @unittest.mock.patch('lxdock.guests.base.logger')
+    def test_logs_the_output_of_guest_commands_at_the_info_level(
+            self, mock_logger, mocked_execute_streaming):
+        mocked_execute_streaming.command_result.return_value = (0, 'out 1\n', '')
+        guest = DebianGuest(unittest.mock.Mock())
+        provisioner = ShellProvisioner('./', Host(unittest.mock.Mock()), guest, {'inline': 'ls'})
+        provisioner.provision()
+        assert mock_logger.log.call_args_list == [unittest.mock.call(logging.INFO, 'out 1'), ]
+
+    @unittest.mock.patch('lxdock.provisioners.shell.logger')
+    def test_reports_the_error_output_of_failed_guest_commands(
+            self, mock_logger, mocked_execute_streaming):
+        mocked_execute_streaming.command_result.return_value = (1, 'out\n', 'err 1\nerr 2\n')
+        guest = DebianGuest(unittest.mock.Mock())
+        provisioner = ShellProvisioner('./', Host(unittest.mock.Mock()), guest, {'inline': 'ls'})
+        provisioner.provision()
+        assert mock_logger.warning.call_args[0][0] == \
+            'The shell command failed (exit code: 1):\n  err 1\n  err 2'
@@ -0,0 +1,141 @@
+import asyncio
+import http.server
+import os
+import socket
+import struct
+import tempfile
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from lxdock.cache_proxy import CacheStore, CachingProxy
+
+
+class StubOriginHandler(http.server.BaseHTTPRequestHandler):
+    """ Serves files whose content is their path; requests are counted by the server.
+
+    The connection is reset in the middle of the body of the files under /broken/, which are served
+    without Content-Length header. An invalid status line is sent for the files under /malformed/.
+    """
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        body = self.path.encode('utf-8') * 100
+        if self.path.startswith('/malformed/'):
+            self.wfile.write(b'NOT HTTP\r\n\r\n')
+            return
+        if self.path.startswith('/broken/'):
+            self.send_response(200)
+            self.end_headers()
+            self.wfile.write(body[:len(body) // 2])
+            self.wfile.flush()
+            # Closing the socket with a zero linger timeout sends a RST packet.
+            self.connection.setsockopt(
+                socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+            self.connection.close()
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        if self.path.startswith('/dists/'):
+            self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def origin():
+    server = http.server.HTTPServer(('127.0.0.1', 0), StubOriginHandler)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def proxy():
+    with tempfile.TemporaryDirectory() as d:
+        proxy = CachingProxy(port=0, cache_dir=d, max_size=10000)
+        loop = asyncio.new_event_loop()
+
+        def run_loop():
+            asyncio.set_event_loop(loop)
+            loop.run_forever()
+
+        thread = threading.Thread(target=run_loop, daemon=True)
+        thread.start()
+        asyncio.run_coroutine_threadsafe(proxy.start(), loop).result()
+        yield proxy
+        asyncio.run_coroutine_threadsafe(proxy.stop(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+def fetch(proxy, url):
+    opener = urllib.request.build_opener(urllib.request.ProxyHandler(
+        {'http': 'http://127.0.0.1:{}'.format(proxy.port)}))
+    with opener.open(url, timeout=5) as response:
+        return response.headers['X-Cache'], response.read()
+
+
+class TestCachingProxy:
+    def test_serves_immutable_artifacts_from_its_cache(self, origin, proxy):
+        url = 'http://127.0.0.1:{}/pool/main/p/python_2.7.deb'.format(origin.server_port)
+        assert fetch(proxy, url) == ('MISS', b'/pool/main/p/python_2.7.deb' * 100)
+        assert fetch(proxy, url) == ('HIT', b'/pool/main/p/python_2.7.deb' * 100)
+        assert origin.requests == ['/pool/main/p/python_2.7.deb', ]
+        assert (proxy.hits, proxy.misses) == (1, 1)
+
+    def test_does_not_cache_responses_interrupted_by_the_origin_server(self, origin, proxy):
+        url = 'http://127.0.0.1:{}/broken/python_2.7.deb'.format(origin.server_port)
+        for _ in range(2):
+            try:
+                assert fetch(proxy, url)[0] == 'MISS'
+            except OSError:
+                pass
+        assert len(origin.requests) == 2
+        assert proxy.store.size == 0
+        assert os.listdir(proxy.store.path) == []
+
+    def test_answers_502_if_the_origin_server_sends_an_invalid_response(self, origin, proxy):
+        url = 'http://127.0.0.1:{}/malformed/python_2.7.deb'.format(origin.server_port)
+        with pytest.raises(urllib.error.HTTPError) as excinfo:
+            fetch(proxy, url)
+        assert excinfo.value.code == 502
+        assert proxy.store.size == 0
+
+    def test_does_not_cache_responses_that_can_change(self, origin, proxy):
+        url = 'http://127.0.0.1:{}/dists/xenial/InRelease'.format(origin.server_port)
+        assert fetch(proxy, url)[0] == 'MISS'
+        assert fetch(proxy, url)[0] == 'MISS'
+        assert len(origin.requests) == 2
+
+
+class TestCacheStore:
+    def put(self, store, url, size):
+        body_path = store.get_temporary_path(url)
+        with open(body_path, 'wb') as fd:
+            fd.write(b'x' * size)
+        store.put(url, {'headers': [], 'expires': None}, body_path)
+
+    def test_evicts_the_least_recently_used_responses(self):
+        with tempfile.TemporaryDirectory() as d:
+            store = CacheStore(d, max_size=250)
+            self.put(store, 'http://test/a.deb', 100)
+            self.put(store, 'http://test/b.deb', 100)
+            assert store.get('http://test/a.deb') is not None
+            self.put(store, 'http://test/c.deb', 100)
+            assert store.get('http://test/b.deb') is None
+            assert store.get('http://test/a.deb') is not None
+            assert store.get('http://test/c.deb') is not None
+            assert store.size == 200
+            # The responses stored by previous runs are loaded.
+            assert CacheStore(d, max_size=250).size == 200
+            assert len(os.listdir(d)) == 4
@@ -0,0 +1,457 @@
+import os
+import tempfile
+import unittest.mock
+
+from pylxd.exceptions import NotFound
+
+from lxdock import constants
+from lxdock.container import Container, ContainerStateCache
+from lxdock.guests import CentosGuest, UbuntuGuest
+
+
+def get_container(api_extensions=('patch', ), config=None, devices=None, **options):
+    """ Returns a `Container` instance associated with a mocked PyLXD container (also returned). """
+    client = unittest.mock.Mock()
+    client.host_info = {'api_extensions': list(api_extensions)}
+    container = Container('project', '/tmp', client, name='test', **options)
+    lxd_container = unittest.mock.Mock()
+    lxd_container.config = dict(config or {})
+    lxd_container.devices = dict(devices or {})
+    container.set_lxd_container(lxd_container)
+    return container, lxd_container
+
+
+class TestContainerStateCache:
+    def test_can_fetch_a_container_once_until_it_expires(self):
+        client = unittest.mock.Mock()
+        cache = ContainerStateCache(client, 'test', ttl=60)
+        assert cache.get() is client.containers.get.return_value
+        assert cache.get() is client.containers.get.return_value
+        assert client.containers.get.call_count == 1
+        assert cache.hits == 1
+        assert cache.misses == 1
+
+    def test_can_refresh_a_container_in_place_when_it_expires(self):
+        client = unittest.mock.Mock()
+        cache = ContainerStateCache(client, 'test', ttl=0)
+        container = cache.get()
+        assert cache.get() is container
+        assert client.containers.get.call_count == 1
+        assert container.sync.call_count == 1
+        assert cache.misses == 2
+
+    def test_can_remember_that_a_container_does_not_exist(self):
+        client = unittest.mock.Mock()
+        client.containers.get.side_effect = NotFound(response=unittest.mock.Mock())
+        cache = ContainerStateCache(client, 'test', ttl=60)
+        assert cache.get() is None
+        assert cache.container is None
+        assert client.containers.get.call_count == 1
+
+    def test_can_be_invalidated(self):
+        client = unittest.mock.Mock()
+        cache = ContainerStateCache(client, 'test', ttl=60)
+        container = cache.get()
+        cache.invalidate()
+        assert cache.container is container
+        assert container.sync.call_count == 0
+        assert cache.get() is container
+        assert container.sync.call_count == 1
+
+    def test_can_be_primed_with_a_container_fetched_elsewhere(self):
+        client = unittest.mock.Mock()
+        container = unittest.mock.Mock()
+        cache = ContainerStateCache(client, 'test', ttl=60)
+        cache.set(container)
+        assert cache.get() is container
+        assert client.containers.get.call_count == 0
+        assert cache.hits == 1
+
+    def test_can_cache_the_runtime_state_of_a_container(self):
+        client = unittest.mock.Mock()
+        cache = ContainerStateCache(client, 'test', ttl=60)
+        container = cache.get()
+        assert cache.get_state() is container.state.return_value
+        assert cache.get_state() is container.state.return_value
+        assert container.state.call_count == 1
+        cache.get_state(force=True)
+        assert container.state.call_count == 2
+        cache.set(container)
+        cache.get_state()
+        assert container.state.call_count == 3
+
+
+class TestContainerChanges:
+    @unittest.mock.patch('lxdock.container.patch_container')
+    def test_does_not_write_anything_if_nothing_changed(self, mocked_patch):
+        container, lxd_container = get_container(
+            config={'environment.FOO': 'bar'}, environment={'FOO': 'bar'})
+        container._setup_env()
+        container._save_container()
+        assert mocked_patch.call_count == 0
+        assert lxd_container.save.call_count == 0
+
+    @unittest.mock.patch('lxdock.container.get_cache_proxy_url', return_value=None)
+    @unittest.mock.patch('lxdock.container.patch_container')
+    def test_defines_the_http_proxy_of_the_container_if_a_cache_proxy_is_used(
+            self, mocked_patch, mocked_get_url):
+        container, lxd_container = get_container(cache_proxy='http://10.0.3.1:3142')
+        container._container_guest = unittest.mock.Mock()
+        container._setup_cache_proxy()
+        container._save_container()
+        container._guest.configure_package_proxy.assert_called_once_with('http://10.0.3.1:3142')
+        assert mocked_patch.call_args[0][1] == {'config': {
+            'environment.http_proxy': 'http://10.0.3.1:3142',
+            'user.lxdock.cache_proxy': 'http://10.0.3.1:3142'}}
+
+    @unittest.mock.patch(
+        'lxdock.container.get_cache_proxy_url', return_value='http://10.0.3.1:3142')
+    @unittest.mock.patch('lxdock.container.patch_container')
+    def test_uses_the_running_cache_proxy_automatically(self, mocked_patch, mocked_get_url):
+        container, lxd_container = get_container()
+        container._container_guest = unittest.mock.Mock()
+        container._setup_cache_proxy()
+        container._save_container()
+        container._guest.configure_package_proxy.assert_called_once_with('http://10.0.3.1:3142')
+        assert mocked_patch.call_args[0][1]['config']['environment.http_proxy'] == \
+            'http://10.0.3.1:3142'
+
+    @unittest.mock.patch(
+        'lxdock.container.get_cache_proxy_url', return_value='http://10.0.3.1:3142')
+    @unittest.mock.patch('lxdock.container.patch_container')
+    def test_does_not_configure_the_cache_proxy_again_if_it_did_not_change(
+            self, mocked_patch, mocked_get_url):
+        container, lxd_container = get_container(config={
+            'environment.http_proxy': 'http://10.0.3.1:3142',
+            'user.lxdock.cache_proxy': 'http://10.0.3.1:3142'})
+        container._container_guest = unittest.mock.Mock()
+        container._setup_cache_proxy()
+        container._save_container()
+        assert container._guest.configure_package_proxy.call_count == 0
+        assert mocked_patch.call_count == 0
+
+    @unittest.mock.patch('lxdock.container.get_cache_proxy_url', return_value=None)
+    @unittest.mock.patch('lxdock.container.patch_container')
+    def test_removes_the_http_proxy_of_the_container_if_no_cache_proxy_is_used(
+            self, mocked_patch, mocked_get_url):
+        container, lxd_container = get_container(config={
+            'environment.http_proxy': 'http://10.0.3.1:3142',
+            'user.lxdock.cache_proxy': 'http://10.0.3.1:3142'})
+        container._container_guest = unittest.mock.Mock()
+        container._setup_cache_proxy()
+        container._save_container()
+        assert container._guest.remove_package_proxy.call_count == 1
+        assert mocked_patch.call_args[0][1] == {'config': {
+            'environment.http_proxy': '', 'user.lxdock.cache_proxy': ''}}
+
+    @unittest.mock.patch('lxdock.container.patch_container')
+    def test_can_send_only_the_changed_values_using_a_single_patch_request(self, mocked_patch):
+        container, lxd_container = get_container(
+            config={'environment.FOO': 'bar'}, environment={'FOO': 'bar', 'BAR': 42})
+        container._setup_env()
+        container._set_device('lxdockshare1', {'type': 'disk', 'source': '/a', 'path': '/b'})
+        container._save_container()
+        assert mocked_patch.call_count == 1
+        assert mocked_patch.call_args[0][1] == {
+            'config': {'environment.BAR': '42'},
+            'devices': {'lxdockshare1': {'type': 'disk', 'source': '/a', 'path': '/b'}},
+        }
+        assert lxd_container.config['environment.BAR'] == '42'
+        assert lxd_container.save.call_count == 0
+        # The changes are not sent twice.
+        container._save_container()
+        assert mocked_patch.call_count == 1
+
+    @unittest.mock.patch('lxdock.container.patch_container')
+    def test_saves_the_whole_container_if_patch_requests_are_not_supported(self, mocked_patch):
+        container, lxd_container = get_container(api_extensions=())
+        container._set_config('user.lxdock.provisioned', 'true')
+        container._save_container()
+        assert mocked_patch.call_count == 0
+        assert lxd_container.save.call_count == 1
+        assert lxd_container.config['user.lxdock.provisioned'] == 'true'
+
+    @unittest.mock.patch('lxdock.container.patch_container')
+    def test_saves_the_whole_container_if_devices_are_removed(self, mocked_patch):
+        container, lxd_container = get_container(devices={
+            'lxdockshare1': {'type': 'disk', 'source': '/a', 'path': '/b'}})
+        container._set_device('lxdockshare1', None)
+        container._save_container()
+        assert mocked_patch.call_count == 0
+        assert lxd_container.save.call_count == 1
+        assert lxd_container.devices == {}
+
+    @unittest.mock.patch('lxdock.container.patch_container')
+    def test_does_not_write_anything_if_the_shares_did_not_change(self, mocked_patch):
+        container, lxd_container = get_container(
+            devices={'lxdockshare1': {'type': 'disk', 'source': '/tmp/src', 'path': '/dest'}},
+            shares=[{'source': 'src', 'dest': '/dest', 'set_host_acl': False}, ])
+        container._setup_shares()
+        container._save_container()
+        assert mocked_patch.call_count == 0
+        assert lxd_container.save.call_count == 0
+
+
+class TestContainerShares:
+    def get_container(self, **kwargs):
+        container, lxd_container = get_container(**kwargs)
+        container._container_host = unittest.mock.Mock()
+        return container, lxd_container
+
+    @unittest.mock.patch('lxdock.container.patch_container')
+    def test_only_adds_new_shares(self, mocked_patch):
+        container, lxd_container = self.get_container(
+            devices={'lxdockshare1': {'type': 'disk', 'source': '/tmp/a', 'path': '/a'}},
+            shares=[
+                {'source': 'a', 'dest': '/a', 'set_host_acl': False},
+                {'source': 'b', 'dest': '/b', 'set_host_acl': False},
+            ])
+        container._setup_shares()
+        container._save_container()
+        assert mocked_patch.call_args[0][1] == {
+            'devices': {'lxdockshare2': {'type': 'disk', 'source': '/tmp/b', 'path': '/b'}}}
+
+    @unittest.mock.patch('lxdock.container.patch_container')
+    def test_only_removes_stale_shares(self, mocked_patch):
+        container, lxd_container = self.get_container(
+            devices={
+                'lxdockshare1': {'type': 'disk', 'source': '/tmp/a', 'path': '/a'},
+                'lxdockshare2': {'type': 'disk', 'source': '/tmp/b', 'path': '/b'},
+                'root': {'type': 'disk', 'path': '/'},
+            },
+            shares=[{'source': 'b', 'dest': '/b', 'set_host_acl': False}, ])
+        container._setup_shares()
+        container._save_container()
+        assert mocked_patch.call_count == 0
+        assert lxd_container.save.call_count == 1
+        assert lxd_container.devices == {
+            'lxdockshare2': {'type': 'disk', 'source': '/tmp/b', 'path': '/b'},
+            'root': {'type': 'disk', 'path': '/'},
+        }
+
+    @unittest.mock.patch('lxdock.container.patch_container')
+    def test_reuses_the_names_of_stale_shares_for_new_shares(self, mocked_patch):
+        container, lxd_container = self.get_container(
+            devices={'lxdockshare1': {'type': 'disk', 'source': '/tmp/a', 'path': '/a'}},
+            shares=[{'source': 'b', 'dest': '/b', 'set_host_acl': False}, ])
+        container._setup_shares()
+        container._save_container()
+        assert mocked_patch.call_args[0][1] == {
+            'devices': {'lxdockshare1': {'type': 'disk', 'source': '/tmp/b', 'path': '/b'}}}
+
+    @unittest.mock.patch('lxdock.container.patch_container')
+    def test_sets_host_acl_only_when_their_fingerprint_changed(self, mocked_patch):
+        options = {'shares': [{'source': 'a', 'dest': '/a'}, ], 'users': [{'name': 'test'}, ]}
+        container, lxd_container = self.get_container(**options)
+        container._setup_shares()
+        container._save_container()
+        assert container._host.give_access_to_share.call_count == 1
+        assert container._host.give_access_to_share.call_args[1] == {
+            'mapped_userpaths': [None, '/home/test'], }
+        config, devices = dict(lxd_container.config), dict(lxd_container.devices)
+        assert 'user.lxdock.shares_acl' in config
+
+        # Nothing is done if the same shares and users are set up again...
+        container, lxd_container = self.get_container(config=config, devices=devices, **options)
+        container._setup_shares()
+        container._save_container()
+        assert container._host.give_access_to_share.call_count == 0
+        assert mocked_patch.call_count == 1
+
+        # ... but ACL are set again if the users changed.
+        options['users'].append({'name': 'other'})
+        container, lxd_container = self.get_container(config=config, devices=devices, **options)
+        container._setup_shares()
+        assert container._host.give_access_to_share.call_count == 1
+
+    @unittest.mock.patch('lxdock.container.patch_container')
+    def test_can_set_up_shifted_shares_without_setting_host_acl(self, mocked_patch):
+        container, lxd_container = self.get_container(
+            shares=[{'source': 'a', 'dest': '/a', 'mapping': 'shift'}, ])
+        container._setup_shares()
+        container._save_container()
+        assert container._host.give_access_to_share.call_count == 0
+        assert mocked_patch.call_args[0][1] == {'devices': {'lxdockshare1': {
+            'type': 'disk', 'source': '/tmp/a', 'path': '/a', 'shift': 'true'}}}
+
+    @unittest.mock.patch('lxdock.container.patch_container')
+    def test_can_map_the_current_user_to_the_root_user_for_raw_idmap_shares(self, mocked_patch):
+        container, lxd_container = self.get_container(
+            shares=[{'source': 'a', 'dest': '/a', 'mapping': 'raw_idmap'}, ])
+        container._setup_shares()
+        container._save_container()
+        raw_idmap = 'uid {} 0\ngid {} 0'.format(os.getuid(), os.getgid())
+        assert container._host.give_access_to_share.call_count == 0
+        assert mocked_patch.call_args[0][1]['config'] == {'raw.idmap': raw_idmap}
+
+    def test_sets_the_raw_idmap_at_creation_time_if_required_by_shares(self):
+        client = unittest.mock.Mock()
+        client.containers.get.side_effect = NotFound(response=unittest.mock.Mock())
+        container = Container(
+            'project', '/tmp', client, name='test', image='ubuntu/xenial',
+            shares=[{'source': 'a', 'dest': '/a', 'mapping': 'raw_idmap'}, ])
+        container._get_container()
+        config = client.containers.create.call_args[0][0]['config']
+        assert config['raw.idmap'] == 'uid {} 0\ngid {} 0'.format(os.getuid(), os.getgid())
+
+
+class TestContainerProvisioning:
+    def test_installs_the_packages_of_all_the_provisioners_at_once(self):
+        container = Container('project', '/tmp', unittest.mock.Mock(), name='test')
+        guest = unittest.mock.Mock()
+        container._container_guest = guest
+        provisioners = [unittest.mock.Mock(), unittest.mock.Mock()]
+        provisioners[0].get_required_packages.return_value = ['openssh-server', 'python', ]
+        provisioners[1].get_required_packages.return_value = ['python', 'puppet', ]
+        container._setup_provisioners(provisioners)
+        guest.install_packages.assert_called_once_with(['openssh-server', 'python', 'puppet', ])
+        assert provisioners[0].setup_guest.call_count == 1
+        assert provisioners[1].setup_guest.call_count == 1
+
+    def test_does_not_run_the_package_manager_if_no_packages_are_required(self):
+        container = Container('project', '/tmp', unittest.mock.Mock(), name='test')
+        guest = unittest.mock.Mock()
+        container._container_guest = guest
+        provisioner = unittest.mock.Mock()
+        provisioner.get_required_packages.return_value = []
+        container._setup_provisioners([provisioner, ])
+        assert guest.install_packages.call_count == 0
+        assert provisioner.setup_guest.call_count == 1
+
+    def test_can_log_the_output_of_the_guest_in_a_log_directory(self):
+        with tempfile.TemporaryDirectory() as homedir:
+            container = Container('project', homedir, unittest.mock.Mock(), name='test')
+            guest = unittest.mock.Mock(output_log=None)
+            container._container_guest = guest
+            with container._logging_guest_output('logs'):
+                guest.output_log.write(b'output\n')
+            assert guest.output_log is None
+            with open(os.path.join(homedir, 'logs', 'test.log'), 'rb') as log_file:
+                assert log_file.read() == b'output\n'
+
+    def test_can_log_the_output_of_the_guest_in_the_configured_log_directory(self):
+        with tempfile.TemporaryDirectory() as homedir:
+            container = Container(
+                'project', homedir, unittest.mock.Mock(), name='test',
+                provisioning_log_dir='logs')
+            guest = unittest.mock.Mock(output_log=None)
+            container._container_guest = guest
+            with container._logging_guest_output():
+                guest.output_log.write(b'output\n')
+            assert os.path.exists(os.path.join(homedir, 'logs', 'test.log'))
+
+    def test_does_not_log_the_output_of_the_guest_if_no_log_directory_is_specified(self):
+        container = Container('project', '/tmp', unittest.mock.Mock(), name='test')
+        guest = unittest.mock.Mock(output_log=None)
+        container._container_guest = guest
+        with container._logging_guest_output():
+            assert guest.output_log is None
+
+
+class TestContainerGuest:
+    def get_container(self, **kwargs):
+        container, lxd_container = get_container(**kwargs)
+        lxd_container.files.get.return_value = b'ID=ubuntu\nID_LIKE=debian\n'
+        return container, lxd_container
+
+    @unittest.mock.patch('lxdock.container.patch_container')
+    def test_stores_the_name_of_the_detected_guest_in_the_container_config(self, mocked_patch):
+        container, lxd_container = self.get_container()
+        assert isinstance(container._guest, UbuntuGuest)
+        assert lxd_container.files.get.call_count == 1
+        container._save_container()
+        assert mocked_patch.call_args[0][1] == {'config': {'user.lxdock.guest': 'ubuntu'}}
+
+    @unittest.mock.patch('lxdock.container.subprocess.call')
+    @unittest.mock.patch('lxdock.container.patch_container')
+    def test_stores_the_name_of_the_guest_detected_to_run_a_shell_command(
+            self, mocked_patch, mocked_call, mocked_execute_streaming):
+        container, lxd_container = self.get_container()
+        lxd_container.status_code = constants.CONTAINER_RUNNING
+        container.client.containers.get.return_value = lxd_container
+        container.shell(cmd_args=['ls', '-l'])
+        assert mocked_patch.call_args[0][1] == {'config': {'user.lxdock.guest': 'ubuntu'}}
+        assert mocked_call.call_count == 1
+
+    def test_uses_the_guest_stored_in_the_container_config_without_reading_files(self):
+        container, lxd_container = self.get_container(config={'user.lxdock.guest': 'centos'})
+        assert isinstance(container._guest, CentosGuest)
+        assert lxd_container.files.get.call_count == 0
+
+
+class TestContainerGuestAgent:
+    def test_leaves_the_agent_running_if_it_was_started_by_an_enclosing_context(self):
+        container, lxd_container = get_container(agent=True)
+        container._container_guest = guest = unittest.mock.Mock(agent=None)
+
+        def start_agent():
+            guest.agent = unittest.mock.Mock()
+            return True
+
+        guest.start_agent.side_effect = start_agent
+        with container._using_guest_agent():
+            with container._using_guest_agent():
+                pass
+            assert guest.stop_agent.call_count == 0
+        assert guest.start_agent.call_count == 1
+        assert guest.stop_agent.call_count == 1
+
+
+class TestContainerPackageCache:
+    def get_container(self, **kwargs):
+        container, lxd_container = get_container(config={'image.release': 'xenial'}, **kwargs)
+        container._container_host = unittest.mock.Mock()
+        container._container_guest = unittest.mock.Mock()
+        container._container_guest.name = 'ubuntu'
+        container._container_guest.package_cache_path = '/var/cache/apt/archives'
+        return container, lxd_container
+
+    @unittest.mock.patch('lxdock.container.patch_container')
+    def test_mounts_a_package_cache_shared_by_the_containers_of_a_release(self, mocked_patch):
+        container, lxd_container = self.get_container(package_cache=True)
+        with tempfile.TemporaryDirectory() as d:
+            with unittest.mock.patch.dict(os.environ, {'XDG_CACHE_HOME': d}):
+                container._setup_package_cache()
+                container._save_container()
+                cache_dir = os.path.join(d, 'lxdock', 'pkg', 'ubuntu', 'xenial')
+                assert os.path.isdir(cache_dir)
+        assert mocked_patch.call_args[0][1] == {'devices': {'lxdockpkgcache': {
+            'type': 'disk', 'source': cache_dir, 'path': '/var/cache/apt/archives'}}}
+        container._host.give_access_to_share.assert_called_once_with(
+            cache_dir, mapped_userpaths=[None, ])
+
+    @unittest.mock.patch('lxdock.container.patch_container')
+    def test_removes_the_package_cache_if_it_is_disabled(self, mocked_patch):
+        container, lxd_container = self.get_container(devices={'lxdockpkgcache': {
+            'type': 'disk', 'source': '/tmp/cache', 'path': '/var/cache/apt/archives'}})
+        container._setup_package_cache()
+        container._save_container()
+        assert lxd_container.devices == {}
+        assert lxd_container.save.call_count == 1
+
+    @unittest.mock.patch('lxdock.container.lock_cache_dir')
+    def test_only_holds_the_lock_of_the_package_cache_while_installing_packages(self, mocked_lock):
+        container, lxd_container = self.get_container(package_cache=True)
+        lock = mocked_lock.return_value
+        container._guest.install_packages.side_effect = \
+            lambda packages: assert_lock_state(entered=1, exited=0)
+        provisioner = unittest.mock.Mock()
+        provisioner.get_required_packages.return_value = ['python', ]
+        provisioner.setup_guest.side_effect = lambda: assert_lock_state(entered=1, exited=1)
+
+        def assert_lock_state(entered, exited):
+            assert (lock.__enter__.call_count, lock.__exit__.call_count) == (entered, exited)
+
+        with tempfile.TemporaryDirectory() as d:
+            with unittest.mock.patch.dict(os.environ, {'XDG_CACHE_HOME': d}):
+                container._setup_provisioners([provisioner, ])
+        assert mocked_lock.call_args[0] == (os.path.join(d, 'lxdock', 'pkg', 'ubuntu', 'xenial'), )
+        assert container._guest.install_packages.call_count == 1
+        assert provisioner.setup_guest.call_count == 1
+
+    @unittest.mock.patch('lxdock.container.lock_cache_dir')
+    def test_does_not_lock_anything_if_the_package_cache_is_disabled(self, mocked_lock):
+        container, lxd_container = self.get_container()
+        with container._holding_package_cache():
+            pass
+        assert mocked_lock.call_count == 0
@@ -0,0 +1,57 @@
+import threading
+import time
+import unittest.mock
+
+from lxdock.events import EventListener
+
+
+class TestEventListener:
+    def test_can_subscribe_to_the_lxd_events_stream(self):
+        client = unittest.mock.Mock()
+        with EventListener(client) as listener:
+            websocket = client.events.return_value
+            assert websocket.listener is listener
+            assert websocket.connect.call_count == 1
+        assert websocket.close.call_count == 1
+
+    def test_can_fall_back_to_polling_if_the_events_stream_is_not_available(self):
+        client = unittest.mock.Mock()
+        client.events.side_effect = ValueError
+        results = iter(['', '', '10.0.3.2', ])
+        with EventListener(client) as listener:
+            assert listener.wait_for(lambda: next(results), 'test', 5) == '10.0.3.2'
+
+    def test_returns_the_last_value_of_the_predicate_after_the_timeout(self):
+        listener = EventListener(unittest.mock.Mock())
+        assert listener.wait_for(lambda: '', 'test', 0.2) == ''
+
+    def test_reevaluates_the_predicate_as_soon_as_a_related_event_is_received(self):
+        listener = EventListener(unittest.mock.Mock())
+        listener.initial_poll_interval = listener.max_poll_interval = 10
+        state = {'ip': '', }
+
+        def assign_ip():
+            time.sleep(0.1)
+            state['ip'] = '10.0.3.2'
+            listener.dispatch({'type': 'operation', 'metadata': {
+                'resources': {'containers': ['/1.0/containers/other', ]}, }})
+            listener.dispatch({'type': 'operation', 'metadata': {
+                'resources': {'containers': ['/1.0/containers/test', ]}, }})
+
+        thread = threading.Thread(target=assign_ip)
+        thread.start()
+        start = time.monotonic()
+        assert listener.wait_for(lambda: state['ip'], 'test', 5) == '10.0.3.2'
+        assert time.monotonic() - start < 5
+        thread.join()
+
+    def test_can_determine_the_containers_an_event_is_related_to(self):
+        listener = EventListener(unittest.mock.Mock())
+        assert listener._get_container_names({'type': 'operation', 'metadata': {
+            'resources': {'containers': ['/1.0/containers/c1', '/1.0/containers/c2', ]}, }}) == \
+            {'c1', 'c2', }
+        assert listener._get_container_names({'type': 'lifecycle', 'metadata': {
+            'action': 'container-started', 'source': '/1.0/containers/c1', }}) == {'c1', }
+        assert listener._get_container_names({'type': 'logging', 'metadata': {
+            'message': 'Started container', 'context': {'container': 'c1', }, }}) == {'c1', }
+        assert listener._get_container_names({'type': 'logging', 'metadata': None}) == set()
@@ -0,0 +1,334 @@
+import threading
+import time
+import unittest.mock
+
+import pytest
+
+from lxdock.exceptions import ContainerOperationFailed, ProjectError
+from lxdock.project import Project, StageLimiter
+
+
+def get_client_mock(containers_metadata=None):
+    client = unittest.mock.Mock()
+    client.api.containers.get.return_value.json.return_value = {
+        'metadata': containers_metadata or [], }
+    return client
+
+
+def get_container_mock(name, depends_on=None):
+    container = unittest.mock.Mock(exists=True, is_stopped=False)
+    container.name = name
+    container.options = {'depends_on': depends_on} if depends_on else {}
+    return container
+
+
+class TestStageLimiter:
+    def test_can_limit_the_number_of_containers_in_a_specific_stage(self):
+        limiter = StageLimiter({'provision': 2, })
+        lock = threading.Lock()
+        state = {'running': 0, 'max_running': 0, }
+
+        def provision():
+            with limiter.stage('provision'):
+                with lock:
+                    state['running'] += 1
+                    state['max_running'] = max(state['max_running'], state['running'])
+                time.sleep(0.05)
+                with lock:
+                    state['running'] -= 1
+
+        threads = [threading.Thread(target=provision) for _ in range(5)]
+        [t.start() for t in threads]
+        [t.join() for t in threads]
+        assert state['max_running'] == 2
+
+    def test_does_not_limit_stages_without_limits(self):
+        limiter = StageLimiter({'provision': 1, })
+        with limiter.stage('create'):
+            with limiter.stage('create'):
+                with limiter.stage('provision'):
+                    pass
+
+
+class TestProject:
+    def test_can_process_containers_one_at_a_time(self):
+        containers = [get_container_mock('c1'), get_container_mock('c2'), ]
+        project = Project('myproject', '.', get_client_mock(), containers)
+        processed = []
+        project._run_concurrently(lambda c: processed.append(c.name), containers)
+        assert processed == ['c1', 'c2', ]
+
+    def test_can_process_containers_concurrently_with_a_bounded_number_of_jobs(self):
+        containers = [get_container_mock('c{}'.format(i)) for i in range(6)]
+        project = Project('myproject', '.', get_client_mock(), containers, parallelism=3)
+        lock = threading.Lock()
+        state = {'running': 0, 'max_running': 0, }
+
+        def action(container):
+            with lock:
+                state['running'] += 1
+                state['max_running'] = max(state['max_running'], state['running'])
+            time.sleep(0.05)
+            with lock:
+                state['running'] -= 1
+
+        project._run_concurrently(action, containers)
+        assert state['max_running'] == 3
+
+    def test_reraises_errors_once_all_the_containers_have_been_processed(self):
+        containers = [get_container_mock('c1'), get_container_mock('c2'), ]
+        project = Project('myproject', '.', get_client_mock(), containers)
+        processed = []
+
+        def action(container):
+            if container.name == 'c1':
+                raise ContainerOperationFailed()
+            processed.append(container.name)
+
+        with pytest.raises(ContainerOperationFailed):
+            project._run_concurrently(action, containers, jobs=2)
+        assert processed == ['c2', ]
+
+    @unittest.mock.patch.object(Project, '_update_guest_etchosts')
+    def test_can_bring_up_containers_concurrently(self, mock_update_guest_etchosts):
+        containers = [get_container_mock('c1'), get_container_mock('c2'), ]
+        project = Project('myproject', '.', get_client_mock(), containers)
+        project.up(jobs=2, provisioning_mode=None)
+        for container in containers:
+            assert container.up.call_args[1]['provisioning_mode'] is None
+            assert callable(container.up.call_args[1]['stage'])
+        assert mock_update_guest_etchosts.call_count == 1
+
+    @unittest.mock.patch.object(Project, '_update_guest_etchosts')
+    @unittest.mock.patch('lxdock.project.EtcHosts')
+    def test_can_halt_containers_with_a_single_write_of_the_host_etchosts_file(
+            self, mock_etchosts, mock_update_guest_etchosts):
+        c1 = get_container_mock('c1')
+        c1.options = {'hostnames': ['c1.local', 'c1.test', ], }
+        c2 = get_container_mock('c2')
+        c2.options = {'hostnames': ['c2.local', ], }
+        c3 = get_container_mock('c3')
+        c3.options = {}
+        # The hostnames of the containers that are not running are left untouched.
+        c4 = get_container_mock('c4')
+        c4.options = {'hostnames': ['c4.local', ], }
+        c4.is_stopped = True
+        c5 = get_container_mock('c5')
+        c5.options = {'hostnames': ['c5.local', ], }
+        c5.exists = False
+        project = Project('myproject', '.', get_client_mock(), [c1, c2, c3, c4, c5, ])
+        project.halt(jobs=3)
+        etchosts = mock_etchosts.return_value
+        assert mock_etchosts.call_count == 1
+        assert [c[0][0] for c in etchosts.ensure_binding_absent.call_args_list] == \
+            ['c1.local', 'c1.test', 'c2.local', ]
+        assert etchosts.save.call_count == 1
+        for container in [c1, c2, c3, c4, c5, ]:
+            assert container.halt.call_args == [{'unsetup_hostnames': False, }, ]
+
+    @unittest.mock.patch.object(Project, '_update_guest_etchosts')
+    @unittest.mock.patch('lxdock.project.EtcHosts')
+    def test_can_destroy_containers_concurrently(self, mock_etchosts, mock_update_guest_etchosts):
+        containers = [get_container_mock('c1'), get_container_mock('c2'), ]
+        containers[0].options = {'hostnames': ['c1.local', ], }
+        containers[1].options = {'hostnames': ['c2.local', ], }
+        containers[1].exists = False
+        project = Project('myproject', '.', get_client_mock(), containers)
+        project.destroy(jobs=2)
+        etchosts = mock_etchosts.return_value
+        assert [c[0][0] for c in etchosts.ensure_binding_absent.call_args_list] == ['c1.local', ]
+        for container in containers:
+            assert container.destroy.call_args == [{'unsetup_hostnames': False, }, ]
+
+    @unittest.mock.patch.object(Project, 'load_containers_state')
+    @unittest.mock.patch('lxdock.project.EtcHosts')
+    def test_can_destroy_containers_whose_states_were_already_loaded(
+            self, mock_etchosts, mock_load_containers_state):
+        containers = [get_container_mock('c1'), get_container_mock('c2'), ]
+        project = Project('myproject', '.', get_client_mock(), containers)
+        project.destroy(load_state=False)
+        assert mock_load_containers_state.call_count == 0
+        for container in containers:
+            assert container.destroy.call_count == 1
+
+    def test_processes_containers_after_the_containers_they_depend_on(self):
+        containers = [
+            get_container_mock('app', depends_on=['db', 'cache', ]),
+            get_container_mock('db'),
+            get_container_mock('cache', depends_on=['db', ]),
+            get_container_mock('ci'),
+        ]
+        project = Project('myproject', '.', get_client_mock(), containers)
+        processed = []
+        project._run_concurrently(lambda c: processed.append(c.name), containers)
+        assert processed == ['db', 'ci', 'cache', 'app', ]
+
+    def test_processes_containers_in_the_reverse_order_of_their_dependencies(self):
+        containers = [
+            get_container_mock('app', depends_on=['db', ]),
+            get_container_mock('db'),
+        ]
+        project = Project('myproject', '.', get_client_mock(), containers)
+        processed = []
+        project._run_concurrently(lambda c: processed.append(c.name), containers, reverse=True)
+        assert processed == ['app', 'db', ]
+
+    def test_starts_containers_as_soon_as_their_dependencies_are_processed(self):
+        containers = [
+            get_container_mock('db'),
+            get_container_mock('slow'),
+            get_container_mock('app', depends_on=['db', ]),
+        ]
+        project = Project('myproject', '.', get_client_mock(), containers)
+        processed = []
+
+        def action(container):
+            if container.name == 'slow':
+                time.sleep(0.2)
+            processed.append(container.name)
+
+        project._run_concurrently(action, containers, jobs=3)
+        assert processed == ['db', 'app', 'slow', ]
+
+    def test_skips_containers_whose_dependencies_failed(self):
+        containers = [
+            get_container_mock('db'),
+            get_container_mock('cache', depends_on=['db', ]),
+            get_container_mock('app', depends_on=['cache', ]),
+            get_container_mock('ci'),
+        ]
+        project = Project('myproject', '.', get_client_mock(), containers)
+        processed = []
+
+        def action(container):
+            if container.name == 'db':
+                raise ContainerOperationFailed()
+            processed.append(container.name)
+
+        with pytest.raises(ContainerOperationFailed):
+            project._run_concurrently(action, containers, jobs=2)
+        assert processed == ['ci', ]
+
+    def test_raises_an_error_if_containers_have_circular_dependencies(self):
+        containers = [
+            get_container_mock('c1', depends_on=['c2', ]),
+            get_container_mock('c2', depends_on=['c1', ]),
+        ]
+        project = Project('myproject', '.', get_client_mock(), containers)
+        with pytest.raises(ProjectError):
+            project._run_concurrently(lambda c: None, containers)
+
+    def test_raises_an_error_if_a_dependency_is_not_defined(self):
+        containers = [get_container_mock('c1', depends_on=['unknown', ]), ]
+        project = Project('myproject', '.', get_client_mock(), containers)
+        with pytest.raises(ProjectError):
+            project._run_concurrently(lambda c: None, containers)
+
+    @unittest.mock.patch.object(Project, '_update_guest_etchosts')
+    def test_brings_up_the_dependencies_of_the_considered_containers(
+            self, mock_update_guest_etchosts):
+        containers = [
+            get_container_mock('app', depends_on=['db', ]),
+            get_container_mock('db'),
+            get_container_mock('ci'),
+        ]
+        project = Project('myproject', '.', get_client_mock(), containers)
+        project.up(container_names=['app', ])
+        assert containers[0].up.call_count == 1
+        assert containers[1].up.call_count == 1
+        assert containers[2].up.call_count == 0
+
+    @unittest.mock.patch.object(Project, '_update_guest_etchosts')
+    def test_can_overlap_the_stages_of_different_containers(self, mock_update_guest_etchosts):
+        events = []
+
+        def get_up_method(name, duration):
+            def up(stage, **kwargs):
+                with stage('create'):
+                    events.append((name, 'create'))
+                    time.sleep(duration)
+                with stage('provision'):
+                    events.append((name, 'provision'))
+                    time.sleep(0.1)
+                    events.append((name, 'provisioned'))
+            return up
+
+        c1 = get_container_mock('c1')
+        c1.up.side_effect = get_up_method('c1', 0)
+        c2 = get_container_mock('c2')
+        c2.up.side_effect = get_up_method('c2', 0.02)
+        project = Project(
+            'myproject', '.', get_client_mock(), [c1, c2, ], parallelism=2,
+            stage_parallelism={'provision': 1, })
+        project.up()
+        # c2 is created while c1 is provisioned but c2 is provisioned once c1 is provisioned.
+        assert events.index(('c2', 'create')) < events.index(('c1', 'provisioned'))
+        assert events[-3:] == [('c1', 'provisioned'), ('c2', 'provision'), ('c2', 'provisioned')]
+
+    @unittest.mock.patch.object(Project, '_update_guest_etchosts')
+    def test_waits_for_dependencies_to_be_provisioned_by_default(self, mock_update_guest_etchosts):
+        events = []
+
+        def up(stage, **kwargs):
+            with stage('setup'):
+                events.append('db up')
+            with stage('provision'):
+                time.sleep(0.1)
+                events.append('db provisioned')
+
+        db = get_container_mock('db')
+        db.up.side_effect = up
+        app = get_container_mock('app', depends_on=[{'name': 'db', }, ])
+        app.up.side_effect = lambda **kwargs: events.append('app up')
+        project = Project('myproject', '.', get_client_mock(), [db, app, ], parallelism=2)
+        project.up()
+        assert events == ['db up', 'db provisioned', 'app up', ]
+
+    @unittest.mock.patch.object(Project, '_update_guest_etchosts')
+    def test_can_bring_up_containers_once_their_dependencies_are_up(
+            self, mock_update_guest_etchosts):
+        events = []
+
+        def up(stage, **kwargs):
+            with stage('setup'):
+                events.append('db up')
+            with stage('provision'):
+                time.sleep(0.1)
+                events.append('db provisioned')
+
+        db = get_container_mock('db')
+        db.up.side_effect = up
+        app = get_container_mock('app', depends_on=[{'name': 'db', 'condition': 'up', }, ])
+        app.up.side_effect = lambda **kwargs: events.append('app up')
+        project = Project('myproject', '.', get_client_mock(), [db, app, ], parallelism=2)
+        project.up()
+        assert events == ['db up', 'app up', 'db provisioned', ]
+
+    def test_skips_containers_whose_dependencies_failed_before_being_up(self):
+        containers = [
+            get_container_mock('db'),
+            get_container_mock('app', depends_on=[{'name': 'db', 'condition': 'up', }, ]),
+        ]
+        project = Project('myproject', '.', get_client_mock(), containers)
+
+        def action(container, reach_milestone):
+            raise ContainerOperationFailed()
+
+        with pytest.raises(ContainerOperationFailed):
+            project._run_concurrently(action, containers, jobs=2, milestones=True)
+        assert containers[1].up.call_count == 0
+
+    def test_can_load_the_states_of_all_its_containers_using_a_single_api_call(self):
+        client = get_client_mock([
+            {'name': 'myproject-c1-1', 'status_code': 103, 'config': {'user.lxdock.made': '1'}},
+            {'name': 'other', 'status_code': 103, 'config': {}},
+        ])
+        c1 = get_container_mock('c1')
+        c1.lxd_name = 'myproject-c1-1'
+        c2 = get_container_mock('c2')
+        c2.lxd_name = 'myproject-c2-1'
+        project = Project('myproject', '.', client, [c1, c2, ])
+        project.load_containers_state()
+        assert client.api.containers.get.call_count == 1
+        assert c1.set_lxd_container.call_args[0][0].status_code == 103
+        assert c2.set_lxd_container.call_args[0] == (None, )
@@ -0,0 +1,113 @@
+import errno
+import os
+import tempfile
+import threading
+import unittest.mock
+
+import pytest
+
+from lxdock.utils.acl import (ACL_GROUP_OBJ, ACL_MASK, ACL_OTHER, ACL_UNDEFINED_ID, ACL_USER,
+                              ACL_USER_OBJ, ACL_XATTR_ACCESS, ACL_XATTR_DEFAULT, AclNotSupported,
+                              acl_from_mode, add_users_to_acl, decode_acl, encode_acl,
+                              give_users_access_to_tree)
+
+
+def acl_supported(path):
+    try:
+        os.getxattr(path, ACL_XATTR_ACCESS)
+    except AttributeError:
+        return False
+    except OSError as e:
+        return e.errno == errno.ENODATA
+    return True
+
+
+class TestAclEncoding:
+    def test_can_encode_and_decode_acl_entries(self):
+        entries = [
+            (ACL_USER_OBJ, 6, ACL_UNDEFINED_ID), (ACL_USER, 7, 1001), (ACL_USER, 5, 1000),
+            (ACL_GROUP_OBJ, 4, ACL_UNDEFINED_ID), (ACL_MASK, 7, ACL_UNDEFINED_ID),
+            (ACL_OTHER, 4, ACL_UNDEFINED_ID),
+        ]
+        data = encode_acl(entries)
+        assert len(data) == 4 + 8 * 6
+        decoded = decode_acl(data)
+        assert decoded[1:3] == [(ACL_USER, 5, 1000), (ACL_USER, 7, 1001)]
+        assert sorted(decoded) == sorted(entries)
+
+    def test_can_convert_a_file_mode_to_acl_entries(self):
+        assert acl_from_mode(0o100754) == [
+            (ACL_USER_OBJ, 7, ACL_UNDEFINED_ID), (ACL_GROUP_OBJ, 5, ACL_UNDEFINED_ID),
+            (ACL_OTHER, 4, ACL_UNDEFINED_ID)]
+
+    def test_can_add_users_and_recompute_the_mask(self):
+        entries = add_users_to_acl(acl_from_mode(0o100640), [1000, 1001])
+        assert (ACL_USER, 7, 1000) in entries
+        assert (ACL_USER, 7, 1001) in entries
+        assert (ACL_MASK, 7, ACL_UNDEFINED_ID) in entries
+        assert (ACL_GROUP_OBJ, 4, ACL_UNDEFINED_ID) in entries
+
+
+class TestGiveUsersAccessToTree:
+    def test_can_set_acl_on_a_whole_tree_in_a_single_pass(self):
+        with tempfile.TemporaryDirectory() as d:
+            if not acl_supported(d):
+                pytest.skip('POSIX ACL are not supported')
+            os.makedirs(os.path.join(d, 'a', 'b'))
+            open(os.path.join(d, 'a', 'b', 'file'), 'w').close()
+            os.symlink('/nonexistent', os.path.join(d, 'link'))
+            with unittest.mock.patch.dict(os.environ, {'XDG_CACHE_HOME': d}):
+                assert give_users_access_to_tree(
+                    os.path.join(d, 'a'), access_uids=[12345], default_uids=[23456], jobs=2)
+            file_acl = decode_acl(os.getxattr(os.path.join(d, 'a', 'b', 'file'), ACL_XATTR_ACCESS))
+            assert (ACL_USER, 7, 12345) in file_acl
+            dir_acl = decode_acl(os.getxattr(os.path.join(d, 'a', 'b'), ACL_XATTR_DEFAULT))
+            assert (ACL_USER, 7, 12345) in dir_acl
+            assert (ACL_USER, 7, 23456) in dir_acl
+
+    def test_can_skip_trees_that_were_already_processed(self):
+        with tempfile.TemporaryDirectory() as d:
+            if not acl_supported(d):
+                pytest.skip('POSIX ACL are not supported')
+            os.makedirs(os.path.join(d, 'a'))
+            with unittest.mock.patch.dict(os.environ, {'XDG_CACHE_HOME': d}):
+                assert give_users_access_to_tree(os.path.join(d, 'a'), access_uids=[12345])
+                assert not give_users_access_to_tree(os.path.join(d, 'a'), access_uids=[12345])
+                assert give_users_access_to_tree(os.path.join(d, 'a'), access_uids=[23456])
+                assert give_users_access_to_tree(
+                    os.path.join(d, 'a'), access_uids=[12345], force=True)
+
+    @unittest.mock.patch('lxdock.utils.acl._check_acl_support')
+    def test_bounds_the_number_of_batches_submitted_to_the_pool(self, mock_check_acl_support):
+        lock = threading.Lock()
+        state = {'submitted': 0, 'processed': 0, 'max_pending': 0, }
+
+        def walk_tree_in_batches(path):
+            for i in range(50):
+                with lock:
+                    state['submitted'] += 1
+                    state['max_pending'] = max(
+                        state['max_pending'], state['submitted'] - state['processed'])
+                yield [('{}/{}'.format(path, i), False), ]
+
+        def set_acl_on_files(files, access_uids, default_uids):
+            with lock:
+                state['processed'] += 1
+            return len(files), 0
+
+        with tempfile.TemporaryDirectory() as d:
+            with unittest.mock.patch.dict(os.environ, {'XDG_CACHE_HOME': d}):
+                with unittest.mock.patch(
+                        'lxdock.utils.acl._walk_tree_in_batches', walk_tree_in_batches):
+                    with unittest.mock.patch(
+                            'lxdock.utils.acl._set_acl_on_files', set_acl_on_files):
+                        assert give_users_access_to_tree(d, access_uids=[12345], jobs=2)
+        assert state['processed'] == 50
+        assert state['max_pending'] <= 4
+
+    def test_raises_if_acl_cannot_be_set_natively(self):
+        with tempfile.TemporaryDirectory() as d:
+            error = OSError(errno.EOPNOTSUPP, 'Operation not supported')
+            with unittest.mock.patch('os.getxattr', side_effect=error, create=True):
+                with pytest.raises(AclNotSupported):
+                    give_users_access_to_tree(d, access_uids=[12345])
@@ -0,0 +1,45 @@
+import io
+import os
+import tarfile
+import tempfile
+
+import pytest
+
+from lxdock.utils.archive import get_tar_extract_command, iter_tar_chunks
+
+
+def test_iter_tar_chunks_helper_can_stream_a_directory_in_bounded_chunks():
+    with tempfile.TemporaryDirectory() as d:
+        with open(os.path.join(d, 'big'), 'wb') as f:
+            f.write(os.urandom(300 * 1024))
+        chunks = list(iter_tar_chunks(d, chunk_size=16 * 1024))
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 16 * 1024 for chunk in chunks)
+    tar = tarfile.open(fileobj=io.BytesIO(b''.join(chunks)))
+    assert len(tar.extractfile('./big').read()) == 300 * 1024
+
+
+def test_iter_tar_chunks_helper_can_compress_the_tarball():
+    with tempfile.TemporaryDirectory() as d:
+        with open(os.path.join(d, 'file'), 'wb') as f:
+            f.write(b'a' * 100000)
+        data = b''.join(iter_tar_chunks(d, compression='gz'))
+    assert len(data) < 100000
+    tar = tarfile.open(fileobj=io.BytesIO(data), mode='r:gz')
+    assert tar.extractfile('./file').read() == b'a' * 100000
+
+
+def test_iter_tar_chunks_helper_raises_errors_that_occur_while_building_the_tarball():
+    with pytest.raises(FileNotFoundError):
+        list(iter_tar_chunks('/nonexistent/lxdock/directory'))
+
+
+@pytest.mark.parametrize('compression,options', [(None, '-xf'), ('gz', '-xzf'), ('bz2', '-xjf')])
+def test_get_tar_extract_command_helper_uses_the_compression_of_the_tarball(compression, options):
+    assert get_tar_extract_command('/a/b', compression=compression) == \
+        ['tar', options, '-', '-C', '/a/b']
+
+
+def test_get_tar_extract_command_helper_raises_if_the_compression_is_not_supported():
+    with pytest.raises(ValueError):
+        get_tar_extract_command('/a/b', compression='xz')
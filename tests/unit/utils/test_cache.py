@@ -0,0 +1,55 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest.mock
+
+from lxdock.utils.cache import (
+    get_cache_dir, get_cache_proxy_state_path, get_cache_proxy_url, lock_cache_dir)
+
+
+def test_get_cache_dir_helper_can_return_and_create_the_lxdock_cache_directory():
+    with tempfile.TemporaryDirectory() as d:
+        with unittest.mock.patch.dict(os.environ, {'XDG_CACHE_HOME': d}):
+            assert get_cache_dir() == os.path.join(d, 'lxdock')
+            assert get_cache_dir('pkg', 'debian') == os.path.join(d, 'lxdock', 'pkg', 'debian')
+            assert os.path.isdir(os.path.join(d, 'lxdock', 'pkg', 'debian'))
+
+
+def test_lock_cache_dir_helper_can_serialize_the_accesses_to_a_directory():
+    events = []
+
+    def install(name):
+        with lock_cache_dir(d):
+            events.append('start {}'.format(name))
+            time.sleep(0.05)
+            events.append('end {}'.format(name))
+
+    with tempfile.TemporaryDirectory() as d:
+        threads = [threading.Thread(target=install, args=(i, )) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert len(events) == 6
+    for i in range(0, 6, 2):
+        assert events[i].replace('start', 'end') == events[i + 1]
+
+
+def test_get_cache_proxy_url_helper_can_return_the_url_of_the_running_caching_proxy():
+    with tempfile.TemporaryDirectory() as d:
+        with unittest.mock.patch.dict(os.environ, {'XDG_CACHE_HOME': d}):
+            assert get_cache_proxy_url() is None
+            with open(get_cache_proxy_state_path(), 'w') as fd:
+                json.dump({'pid': os.getpid(), 'url': 'http://10.0.3.1:3142'}, fd)
+            assert get_cache_proxy_url() == 'http://10.0.3.1:3142'
+
+
+def test_get_cache_proxy_url_helper_ignores_the_state_of_a_proxy_that_is_not_running():
+    with tempfile.TemporaryDirectory() as d:
+        with unittest.mock.patch.dict(os.environ, {'XDG_CACHE_HOME': d}):
+            with open(get_cache_proxy_state_path(), 'w') as fd:
+                json.dump({'pid': os.getpid(), 'url': 'http://10.0.3.1:3142'}, fd)
+            with unittest.mock.patch('os.kill', side_effect=ProcessLookupError):
+                assert get_cache_proxy_url() is None
@@ -0,0 +1,58 @@
+import os
+import tempfile
+import unittest.mock
+
+from lxdock.utils.ignore import IgnoreRules, walk
+
+
+class TestIgnoreRules:
+    def test_can_match_basename_patterns_at_any_depth(self):
+        rules = IgnoreRules(['*.pyc', '# comment', ''])
+        assert rules.match('a.pyc')
+        assert rules.match('a/b/c.pyc')
+        assert not rules.match('a/b/c.py')
+
+    def test_can_match_anchored_patterns(self):
+        rules = IgnoreRules(['/build', 'docs/_build'])
+        assert rules.match('build', is_dir=True)
+        assert not rules.match('src/build', is_dir=True)
+        assert rules.match('docs/_build', is_dir=True)
+        assert not rules.match('src/docs/_build', is_dir=True)
+
+    def test_can_match_directory_only_patterns(self):
+        rules = IgnoreRules(['.git/'])
+        assert rules.match('.git', is_dir=True)
+        assert rules.match('modules/foo/.git', is_dir=True)
+        assert not rules.match('.git')
+
+    def test_can_match_double_star_patterns(self):
+        rules = IgnoreRules(['**/cache/*.tmp', 'vendor/**'])
+        assert rules.match('cache/a.tmp')
+        assert rules.match('a/b/cache/a.tmp')
+        assert not rules.match('a/b/cache/a/b.tmp')
+        assert rules.match('vendor/a/b')
+
+    def test_can_reinclude_files_using_negated_patterns(self):
+        rules = IgnoreRules(['*.log', '!keep.log'])
+        assert rules.match('a.log')
+        assert not rules.match('keep.log')
+
+    def test_can_load_patterns_from_lxdockignore_files(self):
+        with tempfile.TemporaryDirectory() as d:
+            with open(os.path.join(d, '.lxdockignore'), 'w') as f:
+                f.write('*.log\n')
+            rules = IgnoreRules.from_directory(d, ['*.tmp', ])
+            assert rules.match('a.log')
+            assert rules.match('a.tmp')
+            assert not IgnoreRules.from_directory(os.path.join(d, 'unknown'))
+
+
+def test_walk_helper_does_not_walk_through_excluded_directories():
+    with tempfile.TemporaryDirectory() as d:
+        os.makedirs(os.path.join(d, 'a', '.git', 'objects'))
+        open(os.path.join(d, 'a', 'f'), 'w').close()
+        real_listdir = os.listdir
+        with unittest.mock.patch('os.listdir', side_effect=real_listdir) as mocked_listdir:
+            relpaths = [relpath for relpath, _ in walk(d, IgnoreRules(['.git/', ]))]
+        assert sorted(relpaths) == ['a', 'a/f']
+        assert mocked_listdir.call_count == 2
@@ -1,6 +1,8 @@
+import unittest.mock
 from test.support import EnvironmentVarGuard
 
-from lxdock.utils.lxd import get_lxd_dir
+from lxdock.utils.lxd import (ExecChannel, execute_streaming, get_lxd_dir, get_lxdock_containers,
+                              patch_container, supports_api_extension)
 
 
 def test_get_lxd_helper_can_return_the_lxd_base_directory():
@@ -9,3 +11,95 @@ def test_get_lxd_helper_can_return_the_lxd_base_directory():
         assert get_lxd_dir() == '/var/lib/lxd'
         env.set('LXD_DIR', '/my/test/lxd/')
         assert get_lxd_dir() == '/my/test/lxd/'
+
+
+def test_get_lxdock_containers_helper_can_return_lxdock_containers_using_a_single_api_call():
+    client = unittest.mock.Mock()
+    client.api.containers.get.return_value.json.return_value = {'metadata': [
+        {'name': 'c1', 'status_code': 103, 'config': {'user.lxdock.made': '1'}, 'devices': {},
+         'unsupported_attribute': 'test'},
+        {'name': 'c2', 'status_code': 102, 'config': {}, 'devices': {}},
+    ]}
+    containers = get_lxdock_containers(client)
+    assert client.api.containers.get.call_count == 1
+    assert client.api.containers.get.call_args[1] == {'params': {'recursion': 1}}
+    assert list(containers.keys()) == ['c1', ]
+    assert containers['c1'].name == 'c1'
+    assert containers['c1'].status_code == 103
+    assert containers['c1'].config == {'user.lxdock.made': '1'}
+
+
+def test_patch_container_helper_can_partially_update_a_container_and_wait_for_the_operation():
+    container = unittest.mock.Mock()
+    response = container.api.session.patch.return_value
+    response.status_code = 202
+    response.json.return_value = {'type': 'async', 'operation': '/1.0/operations/1'}
+    patch_container(container, {'config': {'environment.FOO': 'bar'}})
+    assert container.api.session.patch.call_count == 1
+    assert container.api.session.patch.call_args[1]['json'] == {
+        'config': {'environment.FOO': 'bar'}}
+    container.client.operations.wait_for_operation.assert_called_once_with('/1.0/operations/1')
+
+
+def test_supports_api_extension_helper_can_tell_if_an_api_extension_is_supported():
+    client = unittest.mock.Mock()
+    client.host_info = {'api_extensions': ['patch', ]}
+    assert supports_api_extension(client, 'patch')
+    assert not supports_api_extension(client, 'container_exec_recording')
+
+
+@unittest.mock.patch('lxdock.utils.lxd.WebSocketManager')
+@unittest.mock.patch('lxdock.utils.lxd._StdinWebsocketClient')
+@unittest.mock.patch('lxdock.utils.lxd._OutputWebsocketClient')
+def test_execute_streaming_helper_can_pass_the_output_of_a_command_to_handlers(
+        mock_output_client, mock_stdin_client, mock_manager):
+    container = unittest.mock.MagicMock()
+    container.api['exec'].post.return_value.json.return_value = {
+        'operation': '/1.0/operations/42',
+        'metadata': {'metadata': {'fds': {'0': 's0', '1': 's1', '2': 's2'}}},
+    }
+    container.client.api.operations.__getitem__.return_value.websocket._api_endpoint = \
+        'http+unix://socket/1.0/operations/42/websocket'
+    container.client.operations.get.return_value.metadata = {'return': 3}
+    mock_manager.return_value.websockets = {}
+    stdout_handler, stderr_handler = unittest.mock.Mock(), unittest.mock.Mock()
+    exit_code = execute_streaming(
+        container, ['ls', ], stdout_handler=stdout_handler, stderr_handler=stderr_handler)
+    assert exit_code == 3
+    assert container.api['exec'].post.call_args[1]['json']['command'] == ['ls', ]
+    assert [c[0][1] for c in mock_output_client.call_args_list] == [
+        stdout_handler, stderr_handler]
+    assert mock_output_client.return_value.resource == '/1.0/operations/42/websocket?secret=s2'
+    assert mock_stdin_client.return_value.connect.call_count == 1
+    assert mock_manager.return_value.stop.call_count == 1
+
+
+@unittest.mock.patch('lxdock.utils.lxd.WebSocketManager')
+@unittest.mock.patch('lxdock.utils.lxd.WebSocketBaseClient')
+@unittest.mock.patch('lxdock.utils.lxd._OutputWebsocketClient')
+def test_exec_channel_can_exchange_lines_with_a_command(
+        mock_output_client, mock_stdin_client, mock_manager):
+    container = unittest.mock.MagicMock()
+    container.api['exec'].post.return_value.json.return_value = {
+        'operation': '/1.0/operations/42',
+        'metadata': {'metadata': {'fds': {'0': 's0', '1': 's1', '2': 's2'}}},
+    }
+    container.client.api.operations.__getitem__.return_value.websocket._api_endpoint = \
+        'http+unix://socket/1.0/operations/42/websocket'
+    container.client.operations.get.return_value.metadata = {'return': 0}
+    mock_manager.return_value.websockets = {1: mock_output_client.return_value}
+    channel = ExecChannel(container, ['cat', ])
+    channel.send(b'line 1\n')
+    assert mock_stdin_client.return_value.send.call_args[0] == (b'line 1\n', )
+    # The output of the command is received in chunks that do not match lines.
+    stdout_handler = mock_output_client.call_args_list[0][0][1]
+    stdout_handler(b'line 1\nli')
+    stdout_handler(b'ne 2\n')
+    assert channel.readline() == b'line 1'
+    assert channel.readline() == b'line 2'
+    assert channel.readline(timeout=0.1) is None
+    mock_manager.return_value.websockets = {}
+    assert channel.readline() is None
+    assert channel.close() == 0
+    assert mock_stdin_client.return_value.close.call_count == 1
+    assert mock_manager.return_value.stop.call_count == 1
@@ -0,0 +1,54 @@
+import os
+import tempfile
+import unittest.mock
+
+from lxdock.utils.manifest import compare_manifests, get_directory_manifest
+
+
+class TestGetDirectoryManifest:
+    def test_can_describe_the_content_of_a_directory(self):
+        with tempfile.TemporaryDirectory() as d:
+            os.makedirs(os.path.join(d, 'a', 'b'))
+            with open(os.path.join(d, 'a', 'b', 'f'), 'wb') as f:
+                f.write(b'dummy')
+            os.symlink('b/f', os.path.join(d, 'a', 'l'))
+            manifest = get_directory_manifest(d)
+        assert sorted(manifest.keys()) == ['a', 'a/b', 'a/b/f', 'a/l']
+        assert manifest['a'][0] == 'd'
+        assert manifest['a/b/f'][0] == 'f'
+        assert manifest['a/b/f'][2] == 5
+        assert manifest['a/b/f'][4] == '829c3804401b0727f70f73d4415e162400cbe57b'
+        assert manifest['a/l'] == ['l', 0, 0, 0, 'b/f']
+
+    def test_reuses_the_digests_of_files_that_did_not_change(self):
+        with tempfile.TemporaryDirectory() as d:
+            with open(os.path.join(d, 'f'), 'wb') as f:
+                f.write(b'dummy')
+            manifest = get_directory_manifest(d)
+            with unittest.mock.patch('lxdock.utils.manifest._get_file_digest') as mocked_digest:
+                assert get_directory_manifest(d, previous=manifest) == manifest
+            assert mocked_digest.call_count == 0
+
+
+class TestCompareManifests:
+    def test_can_return_changed_and_deleted_entries(self):
+        old = {
+            'a': ['d', 0o40755, 0, 0, None],
+            'a/f1': ['f', 0o100644, 1, 1, 'x'],
+            'a/f2': ['f', 0o100644, 1, 1, 'y'],
+            'b': ['d', 0o40755, 0, 0, None],
+            'b/f3': ['f', 0o100644, 1, 1, 'z'],
+        }
+        new = {
+            'a': ['d', 0o40755, 0, 0, None],
+            'a/f1': ['f', 0o100644, 1, 2, 'x'],
+            'a/f2': ['f', 0o100644, 2, 2, 'w'],
+            'a/f4': ['f', 0o100644, 1, 1, 'v'],
+        }
+        changed, deleted = compare_manifests(old, new)
+        assert changed == ['a/f2', 'a/f4']
+        assert deleted == ['b', ]
+
+    def test_considers_all_entries_as_changed_if_there_is_no_previous_manifest(self):
+        new = {'a': ['d', 0o40755, 0, 0, None], 'a/f1': ['f', 0o100644, 1, 1, 'x']}
+        assert compare_manifests({}, new) == (['a', 'a/f1'], [])
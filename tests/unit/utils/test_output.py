@@ -0,0 +1,40 @@
+import io
+import unittest.mock
+
+from lxdock.utils.output import CommandOutput
+
+
+class TestCommandOutput:
+    def test_can_process_the_output_of_a_command_line_by_line(self):
+        callback = unittest.mock.Mock()
+        output = CommandOutput(callback)
+        output(b'line 1\nli')
+        assert [c[0][0] for c in callback.call_args_list] == ['line 1', ]
+        output(b'ne 2\r\nline 3')
+        output.close()
+        assert [c[0][0] for c in callback.call_args_list] == ['line 1', 'line 2', 'line 3']
+
+    def test_can_decode_characters_split_across_chunks(self):
+        output = CommandOutput()
+        data = 'é\n'.encode('utf-8')
+        output(data[:1])
+        output(data[1:])
+        assert output.text == 'é'
+
+    def test_only_keeps_the_last_lines(self):
+        output = CommandOutput(max_lines=2)
+        output(b'1\n2\n3\n4\n')
+        assert output.text == '3\n4'
+
+    def test_splits_very_long_lines(self):
+        output = CommandOutput()
+        output.max_line_length = 4
+        output(b'0123456789')
+        output.close()
+        assert list(output.lines) == ['0123', '4567', '89']
+
+    def test_can_write_the_raw_output_to_a_file(self):
+        tee = io.BytesIO()
+        output = CommandOutput(max_lines=1, tee=tee)
+        output(b'1\n2\n')
+        assert tee.getvalue() == b'1\n2\n'
@@ -0,0 +1,29 @@
+import io
+import tempfile
+import unittest.mock
+
+from lxdock.utils.transfer import FileUploadBody, put_file
+
+
+class TestFileUploadBody:
+    def test_can_be_read_in_blocks_and_report_progress(self):
+        progress = unittest.mock.Mock()
+        body = FileUploadBody(io.BytesIO(b'0123456789'), 10, progress=progress)
+        assert len(body) == 10
+        assert body.read(4) == b'0123'
+        assert body.read(4) == b'4567'
+        assert body.read(4) == b'89'
+        assert body.read(4) == b''
+        assert [c[0] for c in progress.call_args_list] == [(4, 10), (8, 10), (10, 10)]
+
+
+def test_put_file_helper_can_stream_a_file_to_a_container():
+    lxd_container = unittest.mock.Mock()
+    with tempfile.NamedTemporaryFile() as f:
+        f.write(b'x' * 100000)
+        f.flush()
+        assert put_file(lxd_container, f.name, '/a/b') == 100000
+    path, body = lxd_container.files.put.call_args[0]
+    assert path == '/a/b'
+    assert isinstance(body, FileUploadBody)
+    assert len(body) == 100000